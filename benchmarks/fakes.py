@@ -0,0 +1,206 @@
+from server.llm import prompt_key
+from langchain_core.messages import AIMessage
+
+from dataclasses import dataclass
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+
+
+@dataclass
+class LatencyDistribution:
+    """
+    Latency distribution of a fake upstream service
+
+    Args:
+        distribution: one of [constant, uniform, normal, lognormal]
+        median_ms: the median (or constant) latency in milliseconds
+        spread_ms: the spread for uniform/normal distributions
+        sigma: the shape of the lognormal distribution
+        scale: multiplier applied to every sample, 0 disables the latency
+    """
+
+    distribution: str = "constant"
+    median_ms: float = 0.0
+    spread_ms: float = 0.0
+    sigma: float = 0.0
+    scale: float = 1.0
+
+    @classmethod
+    def from_dict(cls, data: dict | None, scale: float = 1.0):
+        return cls(**(data or {}), scale=scale)
+
+    def sample(self, rng: random.Random) -> float:
+        """
+        Sample a latency in seconds
+
+        Args:
+            rng: the random generator
+        """
+        if self.distribution == "constant":
+            ms = self.median_ms
+        elif self.distribution == "uniform":
+            ms = rng.uniform(self.median_ms - self.spread_ms, self.median_ms + self.spread_ms)
+        elif self.distribution == "normal":
+            ms = rng.gauss(self.median_ms, self.spread_ms)
+        elif self.distribution == "lognormal":
+            ms = self.median_ms * rng.lognormvariate(0, self.sigma)
+        else:
+            raise AttributeError(f"Unknown latency distribution `{self.distribution}`")
+        return max(ms, 0.0) * self.scale / 1000
+
+
+def fixture_hash(value: str) -> str:
+    """
+    Hash a prompt or text for fixture lookups
+
+    Args:
+        value: the prompt or text
+    """
+    return hashlib.sha256(value.encode()).hexdigest()[:16]
+
+
+class Fixtures:
+    """
+    Recorded LLM/TTS fixtures. Exact recordings are looked up by prompt hash,
+    otherwise the first rule whose `contains` fragments all appear in the prompt,
+    and whose optional `message` starts the last human message, is used
+
+    Args:
+        path: the fixture json file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        data = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                data = json.load(file)
+        self.llm: dict[str, str] = data.get("llm", {})
+        self.tts: dict[str, int] = data.get("tts", {})
+        self.rules: list[dict] = data.get("rules", [])
+        self.default_tts_bytes: int = data.get("default_tts_bytes", 24000)
+
+    def llm_response(self, prompt: str) -> str:
+        """
+        Find the recorded response for a prompt
+
+        Args:
+            prompt: the prompt string
+        """
+        recorded = self.llm.get(fixture_hash(prompt))
+        if recorded is not None:
+            return recorded
+        # Chat prompts carry the history, rules match on the latest message
+        message = prompt.rsplit("Human: ", 1)[-1]
+        for rule in self.rules:
+            if not all(fragment in prompt for fragment in rule["contains"]):
+                continue
+            if message.startswith(rule.get("message", "")):
+                return rule["response"]
+        raise KeyError(f"No fixture recorded for prompt: {prompt[:120]}")
+
+    def tts_bytes(self, text: str) -> int:
+        """
+        Find the recorded audio size for a text
+
+        Args:
+            text: the spoken text
+        """
+        return self.tts.get(fixture_hash(text), self.default_tts_bytes)
+
+    def save(self):
+        """Write the fixtures back to disk"""
+        data = {
+            "default_tts_bytes": self.default_tts_bytes,
+            "rules": self.rules,
+            "llm": self.llm,
+            "tts": self.tts,
+        }
+        with open(self.path, "w") as file:
+            json.dump(data, file, indent=2)
+
+
+class FakeLLM:
+    """
+    Local fake LLM replaying recorded responses with a latency distribution
+
+    Args:
+        fixtures: the recorded fixtures
+        latency: the latency distribution
+        rng: the random generator
+    """
+
+    model_name = "fake-llm"
+
+    def __init__(self, fixtures: Fixtures, latency: LatencyDistribution, rng: random.Random):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.rng = rng
+
+    async def ainvoke(self, input, *args, **kwargs) -> AIMessage:
+        await asyncio.sleep(self.latency.sample(self.rng))
+        return AIMessage(content=self.fixtures.llm_response(prompt_key(input)))
+
+
+class RecordingLLM:
+    """
+    Wraps a real LLM and records every response to the fixtures
+
+    Args:
+        llm: the real LLM
+        fixtures: the fixtures to record to
+    """
+
+    def __init__(self, llm, fixtures: Fixtures):
+        self.llm = llm
+        self.model_name = getattr(llm, "model_name", "recorded-llm")
+        self.fixtures = fixtures
+
+    async def ainvoke(self, input, *args, **kwargs):
+        response = await self.llm.ainvoke(input, *args, **kwargs)
+        self.fixtures.llm[fixture_hash(prompt_key(input))] = response.content
+        return response
+
+
+class FakeVoice:
+    """
+    Local fake of the Voice TTS returning silent audio of the recorded size
+
+    Args:
+        fixtures: the recorded fixtures
+        latency: the latency distribution
+        rng: the random generator
+    """
+
+    def __init__(self, fixtures: Fixtures, latency: LatencyDistribution, rng: random.Random):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.rng = rng
+
+    async def tts(self, input: str, *args) -> io.BytesIO:
+        await asyncio.sleep(self.latency.sample(self.rng))
+        return io.BytesIO(bytes(self.fixtures.tts_bytes(input)))
+
+
+class RecordingVoice:
+    """
+    Wraps the real Voice and records the produced audio sizes
+
+    Args:
+        voice: the real Voice
+        fixtures: the fixtures to record to
+    """
+
+    def __init__(self, voice, fixtures: Fixtures):
+        self.voice = voice
+        self.fixtures = fixtures
+
+    async def tts(self, input: str, *args) -> io.BytesIO:
+        audio = await self.voice.tts(input, *args)
+        self.fixtures.tts[fixture_hash(input)] = len(audio.getbuffer())
+        return audio
@@ -0,0 +1,401 @@
+"""
+End-to-end latency benchmark for `HomeLink.execute_link` and `HomeLink.send_chat`.
+
+Replays a corpus of utterances against recorded LLM/TTS fixtures served by local
+fakes with configurable latency distributions, backed by fakeredis or a local Redis.
+
+Usage:
+    python -m benchmarks.harness --iterations 5 --save --compare previous
+    python -m benchmarks.harness --record --redis-url redis://localhost:6379
+"""
+
+from .fakes import (
+    Fixtures,
+    FakeLLM,
+    FakeVoice,
+    LatencyDistribution,
+    RecordingLLM,
+    RecordingVoice,
+)
+from shared.utils import load_yaml, Colors
+
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from time import perf_counter
+
+import argparse
+import asyncio
+import functools
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# The sample timings of the turn currently executing
+_current_sample: ContextVar[dict[str, float] | None] = ContextVar(
+    "current_sample", default=None
+)
+
+
+@dataclass
+class BenchmarkConfig:
+    corpus: str = os.path.join(BENCH_DIR, "corpus.yml")
+    fixtures: str = os.path.join(BENCH_DIR, "fixtures", "recorded.json")
+    config_folder: str = os.path.join(ROOT_DIR, "config")
+    results_folder: str = os.path.join(BENCH_DIR, "results")
+    iterations: int = 3
+    concurrency: int = 1
+    seed: int = 7
+    latency_scale: float = 1.0
+    redis_url: str | None = None
+    record: bool = False
+
+
+@dataclass
+class BenchmarkReport:
+    samples: list[dict[str, float]] = field(default_factory=list)
+    errors: int = 0
+
+    def stages(self) -> dict[str, dict[str, float]]:
+        """Percentiles per stage, plus the overall turn latency under `total`"""
+        timings: dict[str, list[float]] = {}
+        for sample in self.samples:
+            for stage, seconds in sample.items():
+                timings.setdefault(stage, []).append(seconds * 1000)
+        return {
+            stage: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+            for stage, values in sorted(timings.items())
+        }
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Linear interpolated percentile
+
+    Args:
+        values: the values
+        q: the percentile between 0 and 100
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def instrument(obj: object, attribute: str, stage: str):
+    """
+    Wrap an async method so its duration is recorded on the current sample
+
+    Args:
+        obj: the object owning the method
+        attribute: the method name
+        stage: the stage name to record under
+    """
+    method = getattr(obj, attribute)
+
+    @functools.wraps(method)
+    async def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            sample = _current_sample.get()
+            if sample is not None:
+                sample[stage] = sample.get(stage, 0.0) + perf_counter() - start
+
+    setattr(obj, attribute, timed)
+
+
+def create_redis(redis_url: str | None):
+    """
+    Create the Redis object, fakeredis unless a url is given
+
+    Args:
+        redis_url: optional url of a local Redis
+    """
+    if redis_url:
+        from redis import Redis
+
+        return Redis.from_url(redis_url, decode_responses=True)
+    try:
+        import fakeredis
+    except ImportError:
+        raise EnvironmentError(
+            "fakeredis is not installed, install it or pass --redis-url"
+        )
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def build_homelink(config: BenchmarkConfig, latency: dict, fixtures: Fixtures):
+    """
+    Build a HomeLink wired to the fakes (or recorders)
+
+    Args:
+        config: the benchmark config
+        latency: the latency distributions per service from the corpus
+        fixtures: the recorded fixtures
+    """
+    from server import HomeLink
+
+    if not config.record:
+        # Clients are constructed but never reach the network
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    homelink = HomeLink(
+        config_folder=config.config_folder, redis=create_redis(config.redis_url)
+    )
+    rng = random.Random(config.seed)
+    llm_ctx = homelink.llm_context
+    if config.record:
+        llm_ctx.reasoning_llm = RecordingLLM(llm_ctx._models["reasoning"], fixtures)
+        llm_ctx.intent_llm = RecordingLLM(llm_ctx._models["intent"], fixtures)
+        llm_ctx.fast_llm = RecordingLLM(llm_ctx._models["fast"], fixtures)
+        llm_ctx.task_llm = RecordingLLM(llm_ctx._models["task"], fixtures)
+        homelink.voice = RecordingVoice(homelink.voice, fixtures)
+    else:
+        llm_latency = LatencyDistribution.from_dict(latency.get("llm"), config.latency_scale)
+        llm_ctx.reasoning_llm = FakeLLM(fixtures, llm_latency, rng)
+        llm_ctx.intent_llm = FakeLLM(fixtures, llm_latency, rng)
+        llm_ctx.fast_llm = FakeLLM(fixtures, llm_latency, rng)
+        llm_ctx.task_llm = FakeLLM(fixtures, llm_latency, rng)
+        tts_latency = LatencyDistribution.from_dict(latency.get("tts"), config.latency_scale)
+        homelink.voice = FakeVoice(fixtures, tts_latency, rng)
+
+    instrument(homelink.intents_engine, "determine_intent", "intent")
+    instrument(homelink.intents_engine, "llm_tiebreak", "intent_tiebreak")
+    instrument(homelink, "execute_intent", "execute_intent")
+    instrument(homelink.memory, "_is_this_memorable", "memory_extraction")
+    instrument(homelink.memory, "ensure_key", "key_canonicalization")
+    instrument(homelink.conversations, "conversate", "conversation")
+    instrument(homelink.voice, "tts", "tts")
+    return homelink
+
+
+async def run_turn(homelink, utterance: dict, report: BenchmarkReport):
+    """
+    Run a single utterance and record its sample
+
+    Args:
+        homelink: the HomeLink under test
+        utterance: the corpus entry
+        report: the report to add the sample to
+    """
+    sample: dict[str, float] = {}
+    token = _current_sample.set(sample)
+    start = perf_counter()
+    try:
+        if utterance.get("mode", "link") == "chat":
+            await homelink.send_chat(utterance["text"])
+        else:
+            await homelink.execute_link(utterance["text"])
+    except Exception as ex:
+        report.errors += 1
+        print(f"{Colors.RED}Error on `{utterance['text']}`: {ex}{Colors.RESET}")
+        return
+    finally:
+        _current_sample.reset(token)
+    sample["total"] = perf_counter() - start
+    report.samples.append(sample)
+
+
+async def run_benchmark(config: BenchmarkConfig) -> BenchmarkReport:
+    """
+    Run the benchmark over the corpus
+
+    Args:
+        config: the benchmark config
+    """
+    corpus = load_yaml(config.corpus)
+    fixtures = Fixtures(config.fixtures)
+    homelink = build_homelink(config, corpus.get("latency", {}), fixtures)
+
+    report = BenchmarkReport()
+    semaphore = asyncio.Semaphore(config.concurrency)
+
+    async def bounded(utterance: dict):
+        async with semaphore:
+            await run_turn(homelink, utterance, report)
+
+    for _ in range(config.iterations):
+        await asyncio.gather(*[bounded(utterance) for utterance in corpus["utterances"]])
+
+    if config.record:
+        fixtures.save()
+    return report
+
+
+def current_commit() -> str:
+    """Returns the short commit hash of the tree, marked dirty if modified"""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True
+        ).strip()
+        dirty = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT_DIR,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def save_result(config: BenchmarkConfig, report: BenchmarkReport) -> str:
+    """
+    Save the report for regression tracking across commits
+
+    Args:
+        config: the benchmark config
+        report: the finished report
+    """
+    os.makedirs(config.results_folder, exist_ok=True)
+    commit = current_commit()
+    result = {
+        "commit": commit,
+        "created": datetime.now().isoformat(),
+        "corpus": os.path.basename(config.corpus),
+        "iterations": config.iterations,
+        "concurrency": config.concurrency,
+        "seed": config.seed,
+        "latency_scale": config.latency_scale,
+        "errors": report.errors,
+        "stages": report.stages(),
+    }
+    path = os.path.join(config.results_folder, f"{commit}.json")
+    with open(path, "w") as file:
+        json.dump(result, file, indent=2)
+    return path
+
+
+def load_baseline(config: BenchmarkConfig, baseline: str) -> dict | None:
+    """
+    Load a previous result by commit, or the most recent other commit for `previous`
+
+    Args:
+        config: the benchmark config
+        baseline: the commit hash or `previous`
+    """
+    if baseline == "previous":
+        commit = current_commit()
+        paths = [
+            path
+            for path in glob.glob(os.path.join(config.results_folder, "*.json"))
+            if os.path.basename(path) != f"{commit}.json"
+        ]
+        if not paths:
+            return None
+        path = max(paths, key=os.path.getmtime)
+    else:
+        path = os.path.join(config.results_folder, f"{baseline}.json")
+        if not os.path.exists(path):
+            return None
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def find_regressions(
+    stages: dict, baseline: dict, threshold: float = 0.1, min_delta_ms: float = 5.0
+) -> list[str]:
+    """
+    Compare p95 latencies against a baseline result
+
+    Args:
+        stages: the stage percentiles of this run
+        baseline: the baseline result
+        threshold: the relative increase counted as a regression
+        min_delta_ms: ignore increases smaller than this
+    """
+    regressions = []
+    for stage, current in stages.items():
+        previous = baseline["stages"].get(stage)
+        if not previous:
+            continue
+        delta = current["p95"] - previous["p95"]
+        if delta > min_delta_ms and delta > previous["p95"] * threshold:
+            regressions.append(
+                f"{stage}: p95 {previous['p95']:.1f}ms -> {current['p95']:.1f}ms"
+            )
+    return regressions
+
+
+def print_report(report: BenchmarkReport):
+    """
+    Print the stage percentiles
+
+    Args:
+        report: the finished report
+    """
+    print(f"{'stage':<24}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for stage, stats in report.stages().items():
+        print(
+            f"{stage:<24}{stats['count']:>8}{stats['p50']:>12.1f}"
+            f"{stats['p95']:>12.1f}{stats['p99']:>12.1f}"
+        )
+    if report.errors:
+        print(f"{Colors.RED}{report.errors} turns failed{Colors.RESET}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HomeLink latency benchmark")
+    parser.add_argument("--corpus", default=BenchmarkConfig.corpus)
+    parser.add_argument("--fixtures", default=BenchmarkConfig.fixtures)
+    parser.add_argument("--config-folder", default=BenchmarkConfig.config_folder)
+    parser.add_argument("--iterations", type=int, default=BenchmarkConfig.iterations)
+    parser.add_argument("--concurrency", type=int, default=BenchmarkConfig.concurrency)
+    parser.add_argument("--seed", type=int, default=BenchmarkConfig.seed)
+    parser.add_argument("--latency-scale", type=float, default=BenchmarkConfig.latency_scale)
+    parser.add_argument("--redis-url", default=None)
+    parser.add_argument("--record", action="store_true", help="record fixtures from the real providers")
+    parser.add_argument("--save", action="store_true", help="save the result for this commit")
+    parser.add_argument("--compare", default=None, help="commit hash or `previous`")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    config = BenchmarkConfig(
+        corpus=args.corpus,
+        fixtures=args.fixtures,
+        config_folder=args.config_folder,
+        iterations=args.iterations,
+        concurrency=args.concurrency,
+        seed=args.seed,
+        latency_scale=args.latency_scale,
+        redis_url=args.redis_url,
+        record=args.record,
+    )
+    report = asyncio.run(run_benchmark(config))
+    print_report(report)
+
+    if args.compare:
+        baseline = load_baseline(config, args.compare)
+        if baseline is None:
+            print(f"{Colors.YELLOW}No baseline result for `{args.compare}`{Colors.RESET}")
+        else:
+            regressions = find_regressions(report.stages(), baseline, args.threshold)
+            print(f"Compared against {baseline['commit']}")
+            for regression in regressions:
+                print(f"{Colors.RED}Regression {regression}{Colors.RESET}")
+            if regressions:
+                if args.save:
+                    save_result(config, report)
+                sys.exit(1)
+
+    if args.save:
+        print(f"Saved result to {save_result(config, report)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Concurrent load generator for the HomeLink server.
+
+Simulates clients (rooms) that post the corpus transcripts to `/awake` and
+`/chat` in a closed loop, ramping the number of clients stage by stage. By
+default the server runs in a subprocess backed by the benchmark fakes with
+their latency distributions, and fakeredis or a local Redis. Every stage
+reports throughput, latency percentiles, rejections, the pool queue depth and
+the event loop lag of the server and of the generator itself.
+
+Usage:
+    python -m benchmarks.loadgen --ramp 1,4,16,32 --stage-seconds 10
+    python -m benchmarks.loadgen --url http://localhost:6455 --ramp 2,4
+"""
+
+from .harness import BenchmarkConfig, build_homelink, percentile
+from .fakes import Fixtures
+from shared.utils import load_yaml, Colors
+
+from dataclasses import dataclass, field
+from time import perf_counter
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+@dataclass
+class LoadConfig:
+    url: str | None = None
+    ramp: list[int] = field(default_factory=lambda: [1, 2, 4, 8, 16])
+    stage_seconds: float = 10
+    think_ms: float = 0
+    corpus: str = BenchmarkConfig.corpus
+    fixtures: str = BenchmarkConfig.fixtures
+    config_folder: str = BenchmarkConfig.config_folder
+    latency_scale: float = 1.0
+    redis_url: str | None = None
+    seed: int = 7
+    poll_interval: float = 0.5
+    timeout: float = 60
+    verbose: bool = False
+
+
+@dataclass
+class StageReport:
+    clients: int
+    seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    rejected: int = 0
+    errors: int = 0
+    queue_depths: list[int] = field(default_factory=list)
+    server_lag_ms: list[float] = field(default_factory=list)
+    client_lag_ms: list[float] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        """The stage numbers, latencies in milliseconds"""
+        latencies = [seconds * 1000 for seconds in self.latencies]
+        return {
+            "clients": self.clients,
+            "requests": len(latencies),
+            "rps": len(latencies) / self.seconds if self.seconds else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "queue_depth_avg": (
+                sum(self.queue_depths) / len(self.queue_depths) if self.queue_depths else 0.0
+            ),
+            "queue_depth_max": max(self.queue_depths, default=0),
+            "server_lag_p99": max(self.server_lag_ms, default=0.0),
+            "client_lag_p99": max(self.client_lag_ms, default=0.0),
+        }
+
+
+class LoadRun:
+    """
+    The clients and pollers of a run, reporting into the current stage
+
+    Args:
+        client: the pooled http client
+        utterances: the corpus utterances
+        config: the load config
+    """
+
+    def __init__(self, client: httpx.AsyncClient, utterances: list[dict], config: LoadConfig):
+        self.client = client
+        self.utterances = utterances
+        self.config = config
+        self.stage: StageReport | None = None
+        self.stop = asyncio.Event()
+
+    async def room(self, index: int):
+        """
+        A client posting transcripts one after the other
+
+        Args:
+            index: the client number, used for its client id
+        """
+        rng = random.Random(self.config.seed + index)
+        client_id = f"room-{index}"
+        while not self.stop.is_set():
+            utterance = rng.choice(self.utterances)
+            path = "/chat" if utterance.get("mode") == "chat" else "/awake"
+            stage = self.stage
+            start = perf_counter()
+            try:
+                response = await self.client.post(
+                    path, json={"input": utterance["text"], "client_id": client_id}
+                )
+                await response.aread()
+            except httpx.HTTPError:
+                stage.errors += 1
+                continue
+            if response.status_code == 503:
+                stage.rejected += 1
+                # back off like the client does
+                await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+                continue
+            if response.status_code >= 400:
+                stage.errors += 1
+                continue
+            stage.latencies.append(perf_counter() - start)
+            if self.config.think_ms:
+                await asyncio.sleep(rng.expovariate(1000 / self.config.think_ms))
+
+    async def poll(self):
+        """Sample the server pool and event loop"""
+        while not self.stop.is_set():
+            try:
+                stats = (await self.client.get("/")).json()
+            except (httpx.HTTPError, ValueError):
+                stats = {}
+            stage = self.stage
+            if "pool" in stats:
+                stage.queue_depths.append(stats["pool"]["queue_depth"])
+            if "loop" in stats:
+                stage.server_lag_ms.append(stats["loop"]["lag_p99_ms"])
+            await asyncio.sleep(self.config.poll_interval)
+
+
+async def run_load(config: LoadConfig, url: str) -> list[StageReport]:
+    """
+    Ramp the clients against a running server
+
+    Args:
+        config: the load config
+        url: the server url
+    """
+    from server.workers import LoopLagMonitor
+
+    corpus = load_yaml(config.corpus)
+    clients = max(config.ramp)
+    reports: list[StageReport] = []
+    monitor = LoopLagMonitor(window=config.stage_seconds)
+    async with httpx.AsyncClient(
+        base_url=url,
+        timeout=config.timeout,
+        limits=httpx.Limits(max_connections=clients + 1, max_keepalive_connections=clients + 1),
+    ) as client:
+        run = LoadRun(client, corpus["utterances"], config)
+        await monitor.start()
+        tasks = [asyncio.create_task(run.poll())]
+        for target in config.ramp:
+            run.stage = StageReport(clients=target)
+            while len(tasks) - 1 < target:
+                tasks.append(asyncio.create_task(run.room(len(tasks) - 1)))
+            start = perf_counter()
+            await asyncio.sleep(config.stage_seconds)
+            run.stage.seconds = perf_counter() - start
+            run.stage.client_lag_ms.append(monitor.stats()["lag_p99_ms"])
+            reports.append(run.stage)
+            print_stage(run.stage)
+        run.stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    await monitor.close()
+    return reports
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve(config: LoadConfig, port: int):
+    """
+    Serve a HomeLink backed by the benchmark fakes
+
+    Args:
+        config: the load config
+        port: the port to listen on
+    """
+    import uvicorn
+    from server.main import create_app
+
+    corpus = load_yaml(config.corpus)
+    homelink = build_homelink(
+        BenchmarkConfig(
+            corpus=config.corpus,
+            fixtures=config.fixtures,
+            config_folder=config.config_folder,
+            seed=config.seed,
+            latency_scale=config.latency_scale,
+            redis_url=config.redis_url,
+        ),
+        corpus.get("latency", {}),
+        Fixtures(config.fixtures),
+    )
+    app = create_app(homelink=homelink)
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    await server.serve()
+
+
+def start_server(config: LoadConfig) -> tuple[subprocess.Popen, str]:
+    """
+    Start the fake backed server in a subprocess and wait until it answers
+
+    Args:
+        config: the load config
+    """
+    port = free_port()
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.loadgen",
+        "--serve",
+        "--port",
+        str(port),
+        "--corpus",
+        config.corpus,
+        "--fixtures",
+        config.fixtures,
+        "--config-folder",
+        config.config_folder,
+        "--latency-scale",
+        str(config.latency_scale),
+        "--seed",
+        str(config.seed),
+    ]
+    if config.redis_url:
+        command += ["--redis-url", config.redis_url]
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # the server logs every turn, keep it off the report unless asked for
+    output = None if config.verbose else subprocess.DEVNULL
+    process = subprocess.Popen(
+        command,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        stdout=output,
+        stderr=output,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        if process.poll() is not None:
+            raise EnvironmentError(
+                "The load test server exited on startup, run with --verbose to see why"
+            )
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise EnvironmentError("The load test server did not start")
+
+
+HEADER = (
+    f"{'clients':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    f"{'503s':>7}{'errors':>8}{'queue':>8}{'srv lag':>9}{'gen lag':>9}"
+)
+
+
+def print_stage(stage: StageReport):
+    s = stage.summary()
+    line = (
+        f"{s['clients']:>8}{s['rps']:>9.1f}{s['p50']:>9.0f}{s['p95']:>9.0f}{s['p99']:>9.0f}"
+        f"{s['rejected']:>7}{s['errors']:>8}{s['queue_depth_max']:>8}"
+        f"{s['server_lag_p99']:>9.1f}{s['client_lag_p99']:>9.1f}"
+    )
+    # the generator itself is saturated, the numbers understate the server
+    if s["client_lag_p99"] > 50:
+        line = f"{Colors.YELLOW}{line}{Colors.RESET}"
+    print(line, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HomeLink load generator")
+    parser.add_argument("--url", default=None, help="an already running server")
+    parser.add_argument("--ramp", default="1,2,4,8,16", help="clients per stage")
+    parser.add_argument("--stage-seconds", type=float, default=LoadConfig.stage_seconds)
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between turns")
+    parser.add_argument("--corpus", default=LoadConfig.corpus)
+    parser.add_argument("--fixtures", default=LoadConfig.fixtures)
+    parser.add_argument("--config-folder", default=LoadConfig.config_folder)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--redis-url", default=None)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", default=None, help="write the stage summaries here")
+    parser.add_argument("--verbose", action="store_true", help="show the server output")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    config = LoadConfig(
+        url=args.url,
+        ramp=[int(clients) for clients in args.ramp.split(",")],
+        stage_seconds=args.stage_seconds,
+        think_ms=args.think_ms,
+        corpus=args.corpus,
+        fixtures=args.fixtures,
+        config_folder=args.config_folder,
+        latency_scale=args.latency_scale,
+        redis_url=args.redis_url,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    if args.serve:
+        asyncio.run(serve(config, args.port))
+        return
+
+    process = None
+    url = config.url
+    if url is None:
+        process, url = start_server(config)
+    try:
+        print(HEADER)
+        reports = asyncio.run(run_load(config, url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump([report.summary() for report in reports], file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
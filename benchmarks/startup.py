@@ -0,0 +1,180 @@
+"""
+Import-time and startup profiler for the HomeLink server.
+
+Each measurement runs in a fresh interpreter so module caches do not hide the
+cold start cost. The import profile comes from `python -X importtime`, the
+startup profile times every startup stage of `HomeLink` against fakeredis.
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --module server.homelink --top 25
+"""
+
+from dataclasses import dataclass
+from time import perf_counter
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_ms: float
+    cumulative_ms: float
+    depth: int
+
+
+def parse_importtime(stderr: str) -> list[ImportTiming]:
+    """
+    Parse the output of `python -X importtime`
+
+    Args:
+        stderr: the interpreter stderr
+    """
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings.append(
+            ImportTiming(
+                module=name.strip(),
+                self_ms=int(self_us) / 1000,
+                cumulative_ms=int(cumulative_us) / 1000,
+                depth=depth,
+            )
+        )
+    return timings
+
+
+def profile_imports(module: str) -> list[ImportTiming]:
+    """
+    Import a module in a fresh interpreter and time every import
+
+    Args:
+        module: the module to import
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise AttributeError(f"Could not import `{module}`:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+async def _startup_stages(config_folder: str, startup: str) -> dict[str, float]:
+    stages: dict[str, float] = {}
+
+    start = perf_counter()
+    from server.homelink import HomeLink
+
+    stages["import"] = perf_counter() - start
+
+    import fakeredis
+
+    start = perf_counter()
+    homelink = HomeLink(
+        config_folder=config_folder, redis=fakeredis.FakeRedis(decode_responses=True)
+    )
+    stages["init"] = perf_counter() - start
+
+    start = perf_counter()
+    await homelink.warm_up(startup=startup)
+    stages["warm_up"] = perf_counter() - start
+
+    # What the first turn waits for
+    start = perf_counter()
+    await homelink.ready()
+    stages["first_use"] = perf_counter() - start
+    await homelink.close()
+
+    for name, seconds in homelink.startup_times.items():
+        stages[f"component.{name}"] = seconds
+    return stages
+
+
+def profile_startup(config_folder: str, startup: str) -> dict[str, float]:
+    """
+    Time the startup stages in a fresh interpreter
+
+    Args:
+        config_folder: the configuration folder
+        startup: the `server.startup` mode to profile
+    """
+    env = dict(os.environ)
+    # Clients are only constructed, no request is made
+    env.setdefault("OPENAI_API_KEY", "profiling")
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.startup",
+            "--child",
+            "--config-folder",
+            config_folder,
+            "--startup",
+            startup,
+        ],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if result.returncode:
+        raise AttributeError(f"Startup profile failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def print_imports(module: str, timings: list[ImportTiming], top: int):
+    total = next((t.cumulative_ms for t in timings if t.module == module), 0.0)
+    print(f"Import of {module}: {total:.1f} ms")
+    print(f"{'module':<50}{'self ms':>10}{'cumulative ms':>16}")
+    # Top level packages show where the time goes, submodules are noise
+    packages = [t for t in timings if "." not in t.module or t.module.startswith(module)]
+    for timing in sorted(packages, key=lambda t: t.cumulative_ms, reverse=True)[:top]:
+        print(f"{timing.module:<50}{timing.self_ms:>10.1f}{timing.cumulative_ms:>16.1f}")
+
+
+def print_startup(startup: str, stages: dict[str, float]):
+    print(f"\nStartup ({startup}):")
+    for name, seconds in stages.items():
+        print(f"{name:<40}{seconds * 1000:>10.1f} ms")
+    ready = stages["import"] + stages["init"] + stages["warm_up"]
+    print(f"{'ready to serve':<40}{ready * 1000:>10.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HomeLink startup profiler")
+    parser.add_argument("--module", default="server.main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--config-folder", default=os.path.join(ROOT_DIR, "config"))
+    parser.add_argument(
+        "--startup", choices=["eager", "background", "lazy"], action="append"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        stages = asyncio.run(_startup_stages(args.config_folder, args.startup[0]))
+        print(json.dumps(stages))
+        return
+
+    print_imports(args.module, profile_imports(args.module), args.top)
+    for startup in args.startup or ["eager", "lazy"]:
+        print_startup(startup, profile_startup(args.config_folder, startup))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Fold the spans written by `shared.tracing` into flame graph stacks.
+
+Each line is `root;child;grandchild <self microseconds>`, the format read by
+flamegraph.pl and speedscope. Client and server traces of the same turns can
+be given together, spans are joined by trace and parent ids.
+
+Usage:
+    python -m benchmarks.traces traces/client.otlp.jsonl traces/server.otlp.jsonl > turns.folded
+"""
+
+from collections import defaultdict
+
+import argparse
+import json
+
+
+def load_spans(paths: list[str]) -> list[dict]:
+    """
+    Read the spans of OTLP JSON lines files
+
+    Args:
+        paths: the trace files
+    """
+    spans = []
+    for path in paths:
+        with open(path) as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                for resource in json.loads(line).get("resourceSpans", []):
+                    for scope in resource.get("scopeSpans", []):
+                        spans.extend(scope.get("spans", []))
+    return spans
+
+
+def fold(spans: list[dict]) -> dict[str, int]:
+    """
+    Sum the self time of every stack of span names
+
+    Args:
+        spans: the OTLP spans
+    """
+    by_id = {(s["traceId"], s["spanId"]): s for s in spans}
+    children_ns: dict[tuple, int] = defaultdict(int)
+    for span in spans:
+        parent = (span["traceId"], span.get("parentSpanId"))
+        if parent in by_id:
+            children_ns[parent] += _duration(span)
+
+    stacks: dict[str, int] = defaultdict(int)
+    for key, span in by_id.items():
+        names = [span["name"]]
+        parent = by_id.get((span["traceId"], span.get("parentSpanId")))
+        while parent is not None:
+            names.append(parent["name"])
+            parent = by_id.get((parent["traceId"], parent.get("parentSpanId")))
+        # concurrent children can add up to more than their parent
+        self_ns = max(0, _duration(span) - children_ns[key])
+        stacks[";".join(reversed(names))] += self_ns // 1000
+    return dict(stacks)
+
+
+def _duration(span: dict) -> int:
+    return int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold HomeLink traces for flame graphs")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    for stack, micros in sorted(fold(load_spans(args.files)).items()):
+        print(f"{stack} {micros}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+def lowpass_taps(cutoff: float, taps: int) -> np.ndarray:
+    """
+    Windowed-sinc low-pass FIR filter
+
+    Args:
+        cutoff: the cutoff as a fraction of the input Nyquist rate
+        taps: the filter length
+    """
+    n = np.arange(taps) - (taps - 1) / 2
+    h = cutoff * np.sinc(cutoff * n) * np.blackman(taps)
+    return (h / h.sum()).astype(np.float32)
+
+
+class AudioFrontend:
+    """
+    Streaming mono mix and polyphase decimation of 16-bit PCM, so the
+    recognizer runs at the rate its model was trained on. Only every
+    `factor`-th filter output is computed and all buffers are reused
+
+    Args:
+        input_rate: the microphone sample rate
+        output_rate: the recognizer sample rate
+        channels: the microphone channels, mixed down to mono
+        taps_per_phase: the filter length of each polyphase branch
+    """
+
+    def __init__(
+        self,
+        input_rate: int = 48000,
+        output_rate: int = 16000,
+        channels: int = 1,
+        taps_per_phase: int = 16,
+    ):
+        if input_rate % output_rate:
+            raise NotImplementedError(
+                f"Resampling {input_rate} to {output_rate} is not an integer decimation"
+            )
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.channels = channels
+        self.factor = input_rate // output_rate
+        self.taps = lowpass_taps(1 / self.factor, self.factor * taps_per_phase)
+        self._kernel = np.ascontiguousarray(self.taps[::-1])
+        self._history = len(self.taps) - 1
+        self._frames = 0
+        self._work = np.zeros(self._history, dtype=np.float32)
+        self._filtered = np.zeros(0, dtype=np.float32)
+        self._out = np.zeros(0, dtype=np.int16)
+
+    def _allocate(self, frames: int):
+        # frames are a multiple of the factor so the phase stays aligned across blocks
+        self._frames = frames
+        work = np.zeros(self._history + frames, dtype=np.float32)
+        work[: self._history] = self._work[: self._history]
+        self._work = work
+        self._filtered = np.zeros(frames // self.factor, dtype=np.float32)
+        self._out = np.zeros(frames // self.factor, dtype=np.int16)
+
+    def process(self, data: bytes) -> memoryview:
+        """
+        Convert a block of interleaved 16-bit PCM
+
+        Args:
+            data: the block read from the microphone
+
+        Returns:
+            mono 16-bit PCM at the output rate, valid until the next call
+        """
+        samples = np.frombuffer(data, dtype=np.int16)
+        frames = len(samples) // self.channels
+        if frames % self.factor:
+            raise AttributeError(
+                f"Block of {frames} frames is not a multiple of {self.factor}"
+            )
+        if frames != self._frames:
+            self._allocate(frames)
+
+        block = self._work[self._history :]
+        if self.channels == 1:
+            block[:] = samples
+        else:
+            np.mean(
+                samples[: frames * self.channels].reshape(frames, self.channels),
+                axis=1,
+                dtype=np.float32,
+                out=block,
+            )
+
+        if self.factor == 1:
+            np.copyto(self._out, block, casting="unsafe")
+        else:
+            # Each output sample is the filter applied at every factor-th input
+            windows = np.lib.stride_tricks.sliding_window_view(self._work, len(self.taps))
+            np.matmul(windows[:: self.factor], self._kernel, out=self._filtered)
+            np.clip(self._filtered, -32768, 32767, out=self._filtered)
+            np.copyto(self._out, self._filtered, casting="unsafe")
+            # keep the tail as history for the next block
+            self._work[: self._history] = self._work[frames:]
+        return memoryview(self._out).cast("B")
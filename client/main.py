@@ -1,11 +1,14 @@
 from .voice_listener import VoskListener
 from .sound_controller import SoundController
+from .server_link import ServerLink
 
 from fastapi import FastAPI, UploadFile, File
 from contextlib import asynccontextmanager
 from shared.mixins import ResponseMixin
 from shared.utils import load_yaml
-from tempfile import TemporaryFile
+from shared.audio import AUDIO_FORMATS
+from shared import tracing
+from shared import log
 from dataclasses import dataclass
 from pydantic import BaseModel
 
@@ -14,6 +17,7 @@ import uvicorn
 import asyncio
 import os
 import json
+import socket
 
 class PlayModel(BaseModel):
     continous: bool
@@ -32,29 +36,67 @@ def on_startup() -> tuple[FastAPI, SoundController, VoskListener]:
 
     server = client_settings.get("server_ip")
     server_ip = client_settings.get("server_port")
+    # The server keeps one conversation per client
+    client_id = client_settings.get("client_id") or socket.gethostname()
+
+    log.configure(**(client_settings.get("logging") or {}))
+
+    tracing_settings = client_settings.get("tracing") or {}
+    if tracing_settings.get("enabled"):
+        tracing.configure(
+            tracing_settings.get("service", "homelink-client"),
+            file=tracing_settings.get("file"),
+            endpoint=tracing_settings.get("endpoint"),
+            sample_rate=tracing_settings.get("sample_rate", 1.0),
+        )
 
     sound_controller = SoundController()
 
-    async def send_speech_phenomenon(input: str):
+    async def on_awake_response(response: httpx.Response):
+        if response.status_code != 200:
+            return
+        if response.headers.get("X-Continuous-Conversation") == "true":
+            vosk_listener.set_continous_listen(True)
+        # Queue the reply from memory without holding up the next transcript
+        await sound_controller.play_audio(
+            response.content,
+            response.headers.get("X-Audio-Format", "mp3"),
+            wait=False,
+        )
+
+    server_link = ServerLink(
+        base_url=f"{server}{(':' + str(server_ip)) if server_ip else ''}",
+        client_id=client_id,
+        on_response=on_awake_response,
+        max_pending=client_settings.get("max_pending_requests", 8),
+        timeout=client_settings.get("request_timeout", 30),
+        retries=client_settings.get("request_retries", 2),
+        accept=client_settings.get("audio_formats") or ["pcm", "opus", "mp3"],
+    )
+
+    def send_speech_phenomenon(input: str):
+        # Called on the recognition thread, only queues the transcript
         input: dict = json.loads(input)
-        payload = {"input": input["text"]}
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{server}{(':' + str(server_ip)) if server_ip else ''}/awake",
-                json=payload,
-                headers={"Content-Type":"application/json"}
-            )
+        server_link.submit(input["text"])
+
     model = os.path.abspath(os.path.join(dir,  "..", "vosk-model-small-en-us-0.15"))
     vosk_listener = VoskListener(
-        wake_word=client_settings["wake_words"],
+        wake_word=client_settings.get("wake_words") or client_settings["wake_word"],
         model_path=model,
         callback=send_speech_phenomenon,
-        continous_listen_max=client_settings['continous_listening_max_seconds'],
+        continous_listen_max=client_settings.get("continous_listening_max_seconds", 10),
+        wake_word_variants=client_settings.get("wake_word_variants"),
+        vad=client_settings.get("vad"),
+        # Stop talking as soon as the user starts
+        on_wake=sound_controller.barge_in_threadsafe,
         loop=asyncio.get_event_loop(),
+        **(client_settings.get("audio") or {}),
     )
 
     @asynccontextmanager
     async def on_fastapi_lifecycle(app: FastAPI):
+        await sound_controller.start()
+        await server_link.start()
         # start vosk_listener
         task = asyncio.create_task(vosk_listener.start())
 
@@ -64,6 +106,10 @@ def on_startup() -> tuple[FastAPI, SoundController, VoskListener]:
             # tear down
             task.cancel()
             await task
+            await server_link.close()
+            await sound_controller.close()
+            tracing.shutdown()
+            log.shutdown()
 
     app = FastAPI(title="Client sided HomeLink server", lifespan=on_fastapi_lifecycle)
 
@@ -75,7 +121,7 @@ app, sound_controller, vosk_listener = on_startup()
 
 @app.get("/")
 def get_root():
-    return {"status": "active"}
+    return {"status": "active", "listener": vosk_listener.stats()}
 
 @app.post("/set_continous")
 async def set_continous():
@@ -85,12 +131,9 @@ async def set_continous():
 
 @app.post("/play")
 async def play_audio(play: PlayModel, file: UploadFile = File(...)):
-    print("play model", play)
-    with TemporaryFile(delete=False, suffix=".mp3") as temp_audio_file:
-        temp_audio_file.write(await file.read())
-        temp_audio_file.flush()
-
-    await sound_controller.play_sound(temp_audio_file.name)
+    formats = {media: fmt for fmt, media in AUDIO_FORMATS.items()}
+    audio_format = formats.get((file.content_type or "").split(";")[0], "mp3")
+    await sound_controller.play_audio(await file.read(), audio_format)
     return ClientResponseMixin(response="Completed", completed=True)
 
 
@@ -0,0 +1,163 @@
+from shared.audio import AUDIO_FORMATS
+from shared import tracing
+from shared.log import get_logger
+
+from typing import Awaitable, Callable
+
+import asyncio
+import httpx
+
+log = get_logger(__name__)
+
+
+class ServerLink:
+    """
+    Long-lived link to the HomeLink server. Transcripts are queued without
+    waiting, a background task sends them over a pooled keep-alive client so
+    the recognition thread never blocks on the network
+
+    Args:
+        base_url: the server url, ie `http://localhost:6455`
+        client_id: the id the server keeps this client's conversation under
+        on_response: called with each successful `/awake` response
+        max_pending: how many transcripts may wait, the oldest is dropped when full
+        timeout: the request timeout in seconds
+        retries: how many times to retry a failed request
+        backoff: the first retry delay in seconds, doubled on each retry
+        accept: the reply audio formats, best first, see `shared.audio.AUDIO_FORMATS`
+        transport: optional httpx transport, mostly for testing
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        client_id: str,
+        on_response: Callable[[httpx.Response], Awaitable] | None = None,
+        max_pending: int = 8,
+        timeout: float = 30,
+        retries: int = 2,
+        backoff: float = 0.25,
+        accept: list[str] | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.base_url = base_url
+        self.client_id = client_id
+        self.on_response = on_response
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        formats = accept or ["mp3"]
+        self.accept = ", ".join(
+            f"{AUDIO_FORMATS[f]};q={1 - i / 10:.1f}" for i, f in enumerate(formats)
+        )
+        self.transport = transport
+        self.client: httpx.AsyncClient | None = None
+        self.queue: asyncio.Queue[str] | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    async def start(self):
+        """Open the pooled client and start sending"""
+        self._loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            # connecting should fail fast, the turn itself may take a while
+            timeout=httpx.Timeout(self.timeout, connect=5),
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+            # `send` retries with backoff itself, the transport must not retry too
+            transport=self.transport or httpx.AsyncHTTPTransport(retries=0),
+            headers={"Accept": self.accept},
+        )
+        self._task = asyncio.create_task(self._sender())
+
+    def submit(self, text: str):
+        """
+        Queue a transcript from any thread without waiting
+
+        Args:
+            text: the transcript
+        """
+        if self._loop is None:
+            raise AttributeError("ServerLink was not started")
+        self._loop.call_soon_threadsafe(self._enqueue, text)
+
+    def _enqueue(self, text: str):
+        if self.queue.full():
+            # the oldest utterance is the most stale, drop it
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.dropped += 1
+        self.queue.put_nowait(text)
+
+    async def _sender(self):
+        while True:
+            text = await self.queue.get()
+            try:
+                # the server and playback spans of this transcript nest under it
+                with tracing.span("client.turn", client_id=self.client_id):
+                    response = await self.send(text)
+                    if response is not None and self.on_response:
+                        await self.on_response(response)
+            except Exception:
+                log.exception("could not handle the server response")
+            finally:
+                self.queue.task_done()
+
+    async def send(self, text: str) -> httpx.Response | None:
+        """
+        Send a transcript to `/awake`, retrying connection errors and busy responses.
+        A turn is not idempotent, so it is never sent again once it may have reached the server
+
+        Args:
+            text: the transcript
+        """
+        payload = {"input": text, "client_id": self.client_id}
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+            try:
+                with tracing.span("client.request", attempt=attempt):
+                    response = await self.client.post(
+                        "/awake", json=payload, headers=tracing.inject()
+                    )
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as ex:
+                # Nothing reached the server, later errors may come after it ran the turn
+                log.warning("could not reach the server", attempt=attempt, error=str(ex))
+                continue
+            except httpx.TransportError as ex:
+                log.warning("server request failed", attempt=attempt, error=str(ex))
+                break
+            if response.status_code == 503:
+                delay = max(delay, float(response.headers.get("Retry-After", 0)))
+                continue
+            self.sent += 1
+            return response
+        self.failed += 1
+        return None
+
+    async def close(self):
+        """Stop sending and close the pooled client"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.client:
+            await self.client.aclose()
+
+    def stats(self) -> dict:
+        """Returns the link counters"""
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+        }
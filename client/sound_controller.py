@@ -1,12 +1,18 @@
 from shared.mixins import ResponseMixin
+from shared.audio import PCM_SAMPLE_RATE
+from shared import tracing
 
 from pygame import mixer
-from dataclasses import dataclass
-
-from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import IntEnum
+from itertools import count
 
 import os
+import io
 import asyncio
+import heapq
+import threading
+import numpy as np
 
 
 @dataclass
@@ -15,17 +21,73 @@ class SoundControllerResponse(ResponseMixin):
     ...
 
 
+class PlaybackPriority(IntEnum):
+    ALERT = 0
+    RESPONSE = 1
+    CHATTER = 2
+
+
+@dataclass(order=True)
+class PlaybackItem:
+    priority: int
+    seq: int
+    source: str | bytes = field(compare=False)
+    audio_format: str = field(compare=False)
+    done: asyncio.Future = field(compare=False)
+    sound: asyncio.Task | None = field(default=None, compare=False)
+    # the span that queued the sound, playback is traced under it
+    trace: tracing.SpanContext | None = field(default=None, compare=False)
+
+
 class SoundController:
-    """The SoundController class"""
+    """
+    The SoundController class. Sounds play one at a time from a priority
+    queue, alerts before responses before chatter. The next sound is decoded
+    while the current one plays, and playback can be cut short on barge-in
+
+    Args:
+        max_queued: how many sounds may wait to play
+        frequency: the mixer rate, PCM replies play without resampling at 24000
+        channels: the mixer channels
+    """
 
-    def __init__(self):
-        mixer.init()
+    def __init__(self, max_queued: int = 16, frequency: int = PCM_SAMPLE_RATE, channels: int = 1):
+        mixer.init(frequency=frequency, size=-16, channels=channels)
+        self.frequency, _, self.channels = mixer.get_init()
+        self._pcm = np.zeros(0, dtype=np.int16)  # reused when PCM must be converted
+        self._pcm_lock = threading.Lock()
+        self.max_queued = max_queued
+        self._heap: list[PlaybackItem] = []
+        self._seq = count()
+        self._ready: asyncio.Event | None = None
+        self._stop: asyncio.Event | None = None
+        self._current: PlaybackItem | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self.played = 0
+        self.interrupted = 0
+
+    async def start(self):
+        """Start the player"""
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._player())
+
+    async def close(self):
+        """Stop playing and the player"""
+        self.barge_in(clear=True)
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
 
     async def play_sound(
         self,
         file: str,
         overplay: bool = False,
         scr: SoundControllerResponse | None = None,
+        priority: PlaybackPriority = PlaybackPriority.RESPONSE,
+        wait: bool = True,
     ):
         """
         Play sound through the SoundController
@@ -34,16 +96,67 @@ class SoundController:
             file: the sound file
             overplay: whether or not to cut the other sound of
             scr: previous SoundControllerResponse in case of retry
+            priority: the queue priority of the sound
+            wait: wait until the sound finished playing
         """
         if not os.path.exists(file):
             raise FileNotFoundError("Could not play audio file.")
+        return await self._enqueue(file, "file", overplay, scr, priority, wait)
 
-        if self.is_playing and not overplay:
-            while self.is_playing:
-                asyncio.timeout(delay=0.2)  # wait until sound is done
-        try:
-            await self._play_sound(file)
+    async def play_audio(
+        self,
+        audio: bytes,
+        audio_format: str = "mp3",
+        overplay: bool = False,
+        priority: PlaybackPriority = PlaybackPriority.RESPONSE,
+        wait: bool = True,
+    ):
+        """
+        Play audio from memory without touching the disk
+
+        Args:
+            audio: the encoded audio, or 24 kHz 16-bit mono for pcm
+            audio_format: the format, one of `shared.audio.AUDIO_FORMATS`
+            overplay: whether or not to cut the other sound of
+            priority: the queue priority of the sound
+            wait: wait until the sound finished playing
+        """
+        return await self._enqueue(audio, audio_format, overplay, None, priority, wait)
+
+    async def _enqueue(
+        self,
+        source: str | bytes,
+        audio_format: str,
+        overplay: bool,
+        scr: SoundControllerResponse | None,
+        priority: PlaybackPriority,
+        wait: bool,
+    ):
+        if self._task is None:
+            raise AttributeError("SoundController was not started")
+
+        if len(self._heap) >= self.max_queued:
+            return SoundControllerResponse(
+                response="Too many sounds are queued", completed=False, retry=True
+            )
+
+        item = PlaybackItem(
+            priority=priority,
+            seq=next(self._seq),
+            source=source,
+            audio_format=audio_format,
+            done=self._loop.create_future(),
+            trace=tracing.current_context(),
+        )
+        if overplay:
+            self.barge_in()
+        heapq.heappush(self._heap, item)
+        self._ready.set()
+        if not wait:
+            return SoundControllerResponse(response="Queued", completed=True)
 
+        try:
+            played = await item.done
         except Exception as ex:
             if scr:
                 return SoundControllerResponse(
@@ -57,27 +170,115 @@ class SoundController:
                 retry_count=1,
                 meta=ex,
             )
+        return SoundControllerResponse(
+            response="Completed" if played else "Interrupted", completed=True
+        )
 
-    @property
-    def is_playing(self) -> bool:
-        return mixer.music.get_busy()
-    
-    async def _play_sound(self, file: str):
+    def _decode(self, item: PlaybackItem) -> mixer.Sound:
+        if item.audio_format == "file":
+            return mixer.Sound(item.source)
+        if item.audio_format == "pcm":
+            # the Sound copies the converted samples, so the buffer can be reused
+            with self._pcm_lock:
+                return mixer.Sound(buffer=self._convert_pcm(item.source))
+        # compressed replies decode straight from memory
+        return mixer.Sound(file=io.BytesIO(item.source))
+
+    def _convert_pcm(self, audio: bytes):
+        samples = np.frombuffer(audio, dtype=np.int16)
+        if self.frequency == PCM_SAMPLE_RATE and self.channels == 1:
+            return samples
+        frames = len(samples) * self.frequency // PCM_SAMPLE_RATE
+        if len(self._pcm) < frames * self.channels:
+            self._pcm = np.zeros(frames * self.channels, dtype=np.int16)
+        out = self._pcm[: frames * self.channels].reshape(frames, self.channels)
+        positions = np.arange(frames) * (PCM_SAMPLE_RATE / self.frequency)
+        # linear interpolation to the mixer rate, same signal on every channel
+        out[:, 0] = np.interp(positions, np.arange(len(samples)), samples)
+        out[:, 1:] = out[:, :1]
+        return out
+
+    def _preload(self, item: PlaybackItem):
+        if item.sound is None:
+            item.sound = asyncio.create_task(asyncio.to_thread(self._decode, item))
+
+    async def _player(self):
+        while True:
+            if not self._heap:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            item = heapq.heappop(self._heap)
+            self._current = item
+            self._stop.clear()
+            try:
+                with tracing.span(
+                    "client.playback", parent=item.trace, format=item.audio_format
+                ) as span:
+                    self._preload(item)
+                    sound: mixer.Sound = await item.sound
+                    channel = sound.play()
+                    # Decode the next sound while this one plays
+                    if self._heap:
+                        self._preload(self._heap[0])
+                    # Finished when the length elapsed or when stopped, whichever comes first.
+                    # `wait_for` would swallow a cancel that races with the stop
+                    stop = asyncio.ensure_future(self._stop.wait())
+                    try:
+                        stopped, _ = await asyncio.wait({stop}, timeout=sound.get_length())
+                    finally:
+                        stop.cancel()
+                    played = not stopped
+                    if played:
+                        self.played += 1
+                    else:
+                        channel.stop()
+                        self.interrupted += 1
+                    span.set_attribute("interrupted", not played)
+                if not item.done.done():
+                    item.done.set_result(played)
+            except asyncio.CancelledError:
+                if not item.done.done():
+                    item.done.cancel()
+                raise
+            except Exception as ex:
+                if not item.done.done():
+                    item.done.set_exception(ex)
+            finally:
+                self._current = None
+
+    def barge_in(self, clear: bool = False):
         """
+        Stop the current sound, ie when the user starts speaking
+
+        Args:
+            clear: also drop every queued sound
+        """
+        if self._stop is not None and self._current is not None:
+            self._stop.set()
+        if clear:
+            for item in self._heap:
+                if item.sound:
+                    item.sound.cancel()
+                if not item.done.done():
+                    item.done.set_result(False)
+            self._heap.clear()
+
+    def barge_in_threadsafe(self, clear: bool = True):
+        """
+        Barge in from another thread, ie the voice listener
+
+        Args:
+            clear: also drop every queued sound
         """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.barge_in, clear)
+
+    @property
+    def is_playing(self) -> bool:
+        return self._current is not None
 
-        await asyncio.to_thread(mixer.music.load, file)
-        await asyncio.to_thread(mixer.music.play)
-        
-        asyncio.create_task(self.wait_for_playback())
-
-    async def wait_for_playback(self):
-        """Background task that monitors if the music is still playing"""
-        while mixer.music.get_busy():
-            await asyncio.sleep(0.1)  # Wait a bit before checking again
-        print("Music finished")
-        
     def stop_sound(self):
         """Stop playing sound"""
-        if self.is_playing:
-            mixer.music.stop()
+        self.barge_in()
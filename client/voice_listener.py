@@ -1,29 +1,62 @@
 from shared.utils import get_datetime
 from datetime import datetime
+from time import monotonic
 import os
 import sys
+import json
 import pyaudio
 import asyncio
 from vosk import Model, KaldiRecognizer
-import numpy as np
+from .audio_frontend import AudioFrontend
+from .wake_word import WakeWordDetector
+from shared.audio import EnergyVAD, SpeechGate
+from shared.log import get_logger, DEBUG
+
+log = get_logger(__name__)
 
 
 class VoskListener:
     def __init__(
         self,
-        wake_word: str,
+        wake_word: str | list[str],
         model_path: str,
         callback: callable,
         continous_listen_max: int,
         loop: asyncio.events.AbstractEventLoop,
+        input_rate: int = 48000,
+        sample_rate: int = 16000,
+        channels: int = 1,
+        block_ms: int = 100,
+        wake_word_variants: list[str] | None = None,
+        command_timeout: float = 8,
+        vad: dict | None = None,
+        on_wake: callable = None,
     ):
         self.wake_word = wake_word
+        self.wake_word_variants = wake_word_variants
+        self.command_timeout = command_timeout
+        self.on_wake = on_wake
         self.loop = loop
         self.model_path = model_path
         self.callback = callback
         self.continous_listen = False
         self.continous_listen_start: datetime = None
         self.continous_listen_max: int = continous_listen_max
+        self.input_rate = input_rate
+        self.channels = channels
+        self.block_frames = input_rate * block_ms // 1000
+        # Mix to mono and decimate to the rate the recognition model was trained on
+        self.frontend = AudioFrontend(input_rate, sample_rate, channels)
+        # Only speech reaches the recognizers, silence costs a NumPy pass per block
+        vad = vad or {}
+        self.gate = SpeechGate(
+            EnergyVAD(
+                threshold_db=vad.get("threshold_db", -45),
+                hangover_frames=vad.get("hangover_ms", 600) // block_ms,
+                max_zcr=vad.get("max_zcr", 0.5),
+            ),
+            pre_roll_frames=max(vad.get("pre_roll_ms", 300) // block_ms, 1),
+        )
         # Load the Vosk model
         if not os.path.exists(model_path):
             print("Model not found. Please download and extract it.")
@@ -44,7 +77,7 @@ class VoskListener:
         """
         self.continous_listen = mode
         if mode:
-            self.set_continous_listen_start = get_datetime()
+            self.continous_listen_start = get_datetime()
             return
         self.continous_listen_start = None
 
@@ -57,6 +90,10 @@ class VoskListener:
         if delta.seconds >= self.continous_listen_max:
             self.set_continous_listen(False)
 
+    def stats(self) -> dict:
+        """Returns the speech gate metrics"""
+        return self.gate.stats()
+
     def _listen(self):
         """
         Start listening. This function is blocking
@@ -67,41 +104,71 @@ class VoskListener:
         mic = pyaudio.PyAudio()
         stream = mic.open(
             format=pyaudio.paInt16,
-            channels=1,
-            rate=48000,
+            channels=self.channels,
+            rate=self.input_rate,
             input=True,
-            frames_per_buffer=4800,
+            frames_per_buffer=self.block_frames,
         )
         stream.start_stream()
 
-        rec = KaldiRecognizer(model, 48000)
+        # A grammar restricted recognizer spots the wake word on partial results,
+        # the full vocabulary recognizer only runs for the command after it
+        wake = WakeWordDetector.from_model(
+            model, self.frontend.output_rate, self.wake_word, self.wake_word_variants
+        )
+        rec = KaldiRecognizer(model, self.frontend.output_rate)
+        awake_since: float | None = None
 
-        print("Listening for wake word...")
+        log.info("listening for wake word")
 
         while True:
-            data = stream.read(4800, exception_on_overflow=False)
-
-            # audio_data = np.frombuffer(data, dtype=np.int16)
-            # mono_data = (audio_data[0::2] + audio_data[1::2]) // 2
-
-            if rec.AcceptWaveform(data):
-                result = rec.Result()
-                phrase = result.lower()
-                
-                # Check open mic
-                self.continous_listen_check()
-                print(phrase)
-                if (
-                    any(word.lower() in phrase for word in self.wake_word)
-                    or self.continous_listen
-                ):
-                    # disable the continous listen until told to reactivate
-                    self.set_continous_listen(False)
-                    future = asyncio.run_coroutine_threadsafe(
-                        self.callback(result), self.loop
-                    )
-                    try:
-                        future.result()
-                    except Exception as ex:
-                        print(f"Error occured: {ex}")
-                    print("Wake word detected!")
+            data = stream.read(self.block_frames, exception_on_overflow=False)
+            pcm = self.frontend.process(data)
+
+            # Check open mic
+            self.continous_listen_check()
+
+            # Nothing said after the wake word, go back to listening for it
+            if awake_since and monotonic() - awake_since >= self.command_timeout:
+                awake_since = None
+                wake.reset()
+
+            was_open = self.gate.open
+            frames = self.gate.process(pcm)
+            if not frames:
+                if not was_open:
+                    continue
+                # The speech segment ended, finish what was heard
+                if awake_since is None and not self.continous_listen:
+                    wake.reset()
+                    continue
+                result = rec.FinalResult()
+            else:
+                result = None
+                for frame in frames:
+                    if awake_since is None and not self.continous_listen:
+                        if wake.process(frame):
+                            log.info("wake word detected", latency=wake.last_latency or 0)
+                            awake_since = monotonic()
+                            rec.Reset()
+                            if self.on_wake:
+                                self.on_wake()
+                    elif rec.AcceptWaveform(frame):
+                        result = rec.Result()
+                if result is None:
+                    continue
+
+            if not json.loads(result).get("text"):
+                continue
+
+            if log.isEnabledFor(DEBUG):
+                log.debug("recognized", text=json.loads(result)["text"])
+            awake_since = None
+            wake.reset()
+            # disable the continous listen until told to reactivate
+            self.set_continous_listen(False)
+            # Hand off without waiting so no audio is dropped during the request
+            try:
+                self.callback(result)
+            except Exception:
+                log.exception("transcript callback failed")
@@ -0,0 +1,124 @@
+from time import monotonic
+
+import json
+import re
+
+# Spellings the small vosk model commonly hears for short wake-word tokens
+PHONETIC_VARIANTS: dict[str, list[str]] = {
+    "hey": ["hay", "he", "a"],
+    "ok": ["okay"],
+    "okay": ["ok"],
+    "hi": ["high"],
+}
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip everything but letters, digits and single spaces"""
+    return " ".join(re.sub(r"[^a-z0-9' ]", " ", text.lower()).split())
+
+
+def wake_variants(wake_words: str | list[str], extra: list[str] | None = None) -> list[str]:
+    """
+    Expand the wake words into the phrases the detector listens for
+
+    Args:
+        wake_words: a wake word or a list of wake words
+        extra: more spellings, ie names the model does not know
+    """
+    if isinstance(wake_words, str):
+        wake_words = [wake_words]
+
+    variants: list[str] = []
+    for phrase in [*wake_words, *(extra or [])]:
+        words = normalize(phrase).split()
+        if not words:
+            continue
+        options = [[word, *PHONETIC_VARIANTS.get(word, [])] for word in words]
+        phrases = [""]
+        for choices in options:
+            phrases = [f"{p} {choice}".strip() for p in phrases for choice in choices]
+        for candidate in phrases:
+            if candidate not in variants:
+                variants.append(candidate)
+    return variants
+
+
+class WakeWordDetector:
+    """
+    Wake-word stage running a grammar restricted recognizer on partial
+    results, so it triggers while the wake word is still being spoken
+    instead of at the end of the utterance
+
+    Args:
+        recognizer: a KaldiRecognizer restricted to the wake-word grammar
+        variants: the phrases that trigger, see `wake_variants`
+    """
+
+    def __init__(self, recognizer, variants: list[str]):
+        self.recognizer = recognizer
+        self.variants = variants
+        self._patterns = [re.compile(rf"\b{re.escape(v)}\b") for v in variants]
+        self._speech_start: float | None = None
+        self.detections = 0
+        self.last_latency: float | None = None
+
+    @classmethod
+    def from_model(
+        cls,
+        model,
+        sample_rate: int,
+        wake_words: str | list[str],
+        extra: list[str] | None = None,
+    ) -> "WakeWordDetector":
+        """
+        Build the detector on a loaded vosk model
+
+        Args:
+            model: the vosk Model
+            sample_rate: the sample rate of the audio
+            wake_words: a wake word or a list of wake words
+            extra: more spellings to listen for
+        """
+        from vosk import KaldiRecognizer
+
+        variants = wake_variants(wake_words, extra)
+        # Everything outside the grammar is recognized as [unk]
+        grammar = sorted({word for v in variants for word in v.split()}) + ["[unk]"]
+        recognizer = KaldiRecognizer(model, sample_rate, json.dumps(grammar))
+        return cls(recognizer, variants)
+
+    def matches(self, text: str) -> bool:
+        text = normalize(text)
+        return any(pattern.search(text) for pattern in self._patterns)
+
+    def process(self, frame) -> bool:
+        """
+        Feed a frame of 16-bit mono PCM
+
+        Args:
+            frame: the audio frame
+
+        Returns:
+            whether the wake word was heard
+        """
+        if self.recognizer.AcceptWaveform(bytes(frame)):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            self._speech_start = None
+        else:
+            text = json.loads(self.recognizer.PartialResult()).get("partial", "")
+            if text and self._speech_start is None:
+                self._speech_start = monotonic()
+
+        if not text or not self.matches(text):
+            return False
+
+        self.detections += 1
+        if self._speech_start is not None:
+            self.last_latency = monotonic() - self._speech_start
+        self.reset()
+        return True
+
+    def reset(self):
+        """Forget the audio heard so far"""
+        self.recognizer.Reset()
+        self._speech_start = None
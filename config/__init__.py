@@ -6,6 +6,10 @@ from .prompts import (
     HEAL_PROMPT_SECOND_ATTEMPT,
     CASUAL_CHAT,
     MEMORY_PICKER,
+    INTENT_TIE_BREAK_STRUCTURED,
+    DETERMINE_SIMILAR_KEY_STRUCTURED,
+    DETERMINE_IF_MEMORY_STRUCTURED,
+    MEMORY_PICKER_STRUCTURED,
 )
 
 __all__ = [k for k in globals()]
@@ -1,4 +1,5 @@
-from server.agent import Agent
+from server.agent import AgentBase
 
-class iMessgeAgent:
-    ...
\ No newline at end of file
+
+class iMessageAgent(AgentBase):
+    ...
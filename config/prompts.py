@@ -59,6 +59,48 @@ DETERMINE_IF_MEMORY = PromptTemplate.from_template(
     """
 )
 
+# Structured output variants, the response is constrained to a JSON schema
+INTENT_TIE_BREAK_STRUCTURED = PromptTemplate.from_template(
+    """
+    Determine the action only if the user explicitly expresses a desire to execute something or if the query context provided aligns closely with the intent.
+    | Input: {input}.
+    | Intent data: {intent_data}
+    | Set `intent` to the matching intent `key`, or null if none match.
+    | Set `query` to true if the match is based on the query of the intent.
+    """
+)
+
+DETERMINE_SIMILAR_KEY_STRUCTURED = PromptTemplate.from_template(
+    """
+    Determine the key from the list most similar to the key: `{non_key}`
+    Keys can be matched based on context as well, such as "eggs_needed" -> "shopping_list"
+    | List of real keys: `{list_of_keys}`
+    | Set `key` to the similarly matched key, or null if none match.
+    """
+)
+
+DETERMINE_IF_MEMORY_STRUCTURED = PromptTemplate.from_template(
+    """
+    You are an AI assistant that has an internal memory. Identify if the user shared something memorable or requested something to remember or forget.
+    Completed tasks/items imply a memory clear unless stated otherwise.
+    - If the user adds items to a list, use a general key like `shopping_list` to represent the entire list, and set `memory` to the list of items.
+    - If the user shares a specific memorable action, create a descriptive key in snake_case that reflects the context.
+    Input text: {text}
+    | Add one entry to `memories` per memorable action, with `action` set to the memory type (list or str) or `clear` if forgotten.
+    | Set `ttl` to the seconds a short lived memory stays useful, such as where the car is parked, otherwise leave it null.
+    | If not memorable, return an empty `memories` list.
+    """
+)
+
+MEMORY_PICKER_STRUCTURED = PromptTemplate.from_template(
+    """
+    Pick which memory keys are best suited for what the user said.
+    User: {user_response}
+    List of memories: {memories}
+    Set `keys` to the needed memory keys, or an empty list if none exist.
+    """
+)
+
 # Minimum of 119 tokens
 CASUAL_CHAT = ChatPromptTemplate(
     [
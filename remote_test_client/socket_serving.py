@@ -1,20 +1,144 @@
+from shared.audio import (
+    FRAME_HEADER,
+    FLAG_COMPRESSED,
+    FLAG_EVENT,
+    RingBuffer,
+    pack_header,
+)
+
+import argparse
+import json
+import os
 import socket
 import sounddevice as sd
-import os
+import threading
+import time
+import zlib
+
+SAMPLE_RATE = 16000
+
+
+class PCMStreamClient:
+    """
+    Streams microphone audio to the HomeLink PCM transport. The audio callback
+    only copies into a lock-free ring buffer, a sender thread cuts it into
+    fixed frames and sends them with a length-prefixed header
+
+    Args:
+        host: the server ip
+        port: the transport port
+        frame_ms: the duration of each frame in milliseconds
+        compress: zlib compress the frames
+    """
+
+    def __init__(self, host: str, port: int = 6456, frame_ms: int = 20, compress: bool = False):
+        self.frame_bytes = SAMPLE_RATE * frame_ms // 1000 * 2
+        self.frame_ms = frame_ms
+        self.compress = compress
+        self.ring = RingBuffer(self.frame_bytes * 50)
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.running = False
+        self.sent = 0
+        self.overruns = 0
+
+    def audio_callback(self, indata, frames, time_info, status):
+        if status:
+            self.overruns += 1
+        self.ring.write(indata)
+
+    def _send(self):
+        frame = bytearray(self.frame_bytes)
+        frame_view = memoryview(frame)
+        header = bytearray(FRAME_HEADER.size)
+        start = time.monotonic()
+        seq = 0
+        while self.running:
+            if not self.ring.read_into(frame_view, exact=True):
+                time.sleep(self.frame_ms / 2000)
+                continue
+            payload, flags = frame_view, 0
+            if self.compress:
+                payload, flags = zlib.compress(frame_view, 1), FLAG_COMPRESSED
+            timestamp_ms = int(start * 1000) + seq * self.frame_ms
+            pack_header(header, seq, timestamp_ms, flags, len(payload))
+            sent = self.sock.sendmsg([header, payload])
+            if sent < len(header):
+                self.sock.sendall(memoryview(header)[sent:])
+                self.sock.sendall(payload)
+            elif sent < len(header) + len(payload):
+                self.sock.sendall(memoryview(payload)[sent - len(header) :])
+            seq += 1
+            self.sent += 1
+
+    def _recv_exact(self, view: memoryview) -> bool:
+        received = 0
+        while received < len(view):
+            size = self.sock.recv_into(view[received:])
+            if size == 0:
+                return False
+            received += size
+        return True
+
+    def _receive(self):
+        header = bytearray(FRAME_HEADER.size)
+        audio_bytes = 0
+        while self.running:
+            if not self._recv_exact(memoryview(header)):
+                self.running = False
+                return
+            _, _, flags, length = FRAME_HEADER.unpack(header)
+            payload = bytearray(length)
+            if not self._recv_exact(memoryview(payload)):
+                self.running = False
+                return
+            if flags & FLAG_EVENT:
+                event = json.loads(payload)
+                if event.get("event") == "audio_end":
+                    print(f"Received {audio_bytes} bytes of audio")
+                    audio_bytes = 0
+                print(event)
+            else:
+                audio_bytes += length
 
-# Open a socket to the server
-sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-sock.connect((os.getenv("server_ip"), 6455))
+    def run(self, seconds: float):
+        """
+        Stream the microphone for a while
 
+        Args:
+            seconds: how long to stream
+        """
+        self.running = True
+        threads = [
+            threading.Thread(target=self._send, daemon=True),
+            threading.Thread(target=self._receive, daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        with sd.InputStream(
+            samplerate=SAMPLE_RATE,
+            channels=1,
+            dtype="int16",
+            blocksize=self.frame_bytes // 2,
+            callback=self.audio_callback,
+        ):
+            print("Streaming audio to the server...")
+            time.sleep(seconds)
+        self.running = False
+        self.sock.close()
+        print(
+            f"Sent {self.sent} frames, dropped {self.ring.dropped} bytes, "
+            f"{self.overruns} input overruns"
+        )
 
-# Callback to stream audio to the server
-def audio_callback(indata, frames, time, status):
-    sock.sendall(indata)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream microphone audio to HomeLink")
+    parser.add_argument("--host", default=os.getenv("server_ip"))
+    parser.add_argument("--port", type=int, default=6456)
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=100)
+    parser.add_argument("--compress", action="store_true")
+    args = parser.parse_args()
 
-# Start capturing audio and streaming it
-with sd.InputStream(
-    samplerate=16000, channels=1, dtype="int16", callback=audio_callback
-):
-    print("Streaming audio to the server...")
-    sd.sleep(100000)  # Keep the stream open
+    PCMStreamClient(args.host, args.port, args.frame_ms, args.compress).run(args.seconds)
@@ -1,8 +1,36 @@
-from .intents import IntentEngine
-from .settings import Settings
-from .homelink import HomeLink
-from .llm import LLMContext, heal
-from .models import SettingsModel, VoiceSettings, ConversationMemory
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .intents import IntentEngine
+    from .settings import Settings
+    from .homelink import HomeLink
+    from .llm import LLMContext, heal
+    from .models import SettingsModel, VoiceSettings
+    from .history import ConversationMemory
+
+# Submodules are imported on first attribute access, so importing one part of
+# the server does not pull in langchain and the provider SDKs
+_LAZY = {
+    "IntentEngine": ".intents",
+    "Settings": ".settings",
+    "HomeLink": ".homelink",
+    "LLMContext": ".llm",
+    "heal": ".llm",
+    "SettingsModel": ".models",
+    "VoiceSettings": ".models",
+    "ConversationMemory": ".history",
+}
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
 __all__ = (
     "IntentEngine",
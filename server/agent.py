@@ -1,10 +1,16 @@
 from redis import Redis
 from .llm import LLMContext
+from .models import Intent, DEFAULT_CLIENT
+from .tools import ToolSchema, compile_tools
 
 from shared.mixins import ResponseMixin
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from typing import ClassVar
 from .settings import Settings
 
+import json
+
 @dataclass
 class AgentConfig:
     redis: Redis
@@ -12,7 +18,7 @@ class AgentConfig:
     settings: Settings
 
 
-class AgentBase:
+class AgentBase(ABC):
     """
     The base Agent class for all other extendable agents
 
@@ -26,10 +32,42 @@ class AgentBase:
 
     def query(self): ...
 
+    @abstractmethod
+    def execute(
+        self,
+        input: str,
+        intent: Intent,
+        query: bool = False,
+        client_id: str = DEFAULT_CLIENT,
+    ) -> ResponseMixin:
+        """
+        Act on an intent. May be implemented as a coroutine, blocking
+        implementations are run off the event loop by the `AgentRegistry`.
+        Agents without it are not dispatched to, their intents fall back to
+        the conversation
+
+        Args:
+            input: the transcribed input
+            intent: the matched intent
+            query: whether the input asks for information
+            client_id: the client the input came from
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not execute intents")
+
+    # Compiled once per class when it is defined, see `__init_subclass__`
+    tools: ClassVar[tuple[ToolSchema, ...]] = ()
+    tool_specs: ClassVar[tuple[dict, ...]] = ()
+    tools_json: ClassVar[str] = "[]"
+    _function_docs: ClassVar[dict[str, str]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # The base methods are the agent protocol, not tools
+        cls.tools = compile_tools(cls, exclude=set(vars(AgentBase)))
+        cls.tool_specs = tuple(tool.spec for tool in cls.tools)
+        cls.tools_json = json.dumps(cls.tool_specs)
+        cls._function_docs = {tool.name: tool.description for tool in cls.tools}
+
     @classmethod
-    def _capture_functions(cls) -> dict:
-        return {
-            func: getattr(cls, func).__doc__
-            for func in dir(cls)
-            if callable(getattr(cls, func)) and not func.startswith("_")
-        }
+    def _capture_functions(cls) -> dict[str, str]:
+        return cls._function_docs
@@ -1,4 +1,20 @@
-from .memory import Memory
-from .conversations import Conversations
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .memory import Memory
+    from .conversations import Conversations
+
+_LAZY = {"Memory": ".memory", "Conversations": ".conversations"}
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
 __all__ = ("Memory", "Conversations")
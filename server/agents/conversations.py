@@ -1,9 +1,12 @@
 from server.agent import AgentBase, AgentConfig
-from server.llm import heal, HealHelper
-from server.models import ConversationMemory
+from server.llm import heal, HealHelper, RETRY_STATS
+from server.history import ConversationMemory
+from server.models import Intent, MemoryPick, DEFAULT_CLIENT
 from .memory import Memory
-from config.prompts import CASUAL_CHAT, MEMORY_PICKER
+from config.prompts import CASUAL_CHAT, MEMORY_PICKER, MEMORY_PICKER_STRUCTURED
 from shared.mixins import ResponseMixin
+from shared import tracing
+from shared.log import get_logger, DEBUG
 
 from langchain_core.messages import SystemMessage, AIMessage, HumanMessage
 from langchain_core.prompt_values import ChatPromptValue
@@ -11,6 +14,10 @@ from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.runnables import RunnableLambda
 from uuid import uuid4
 
+import asyncio
+
+log = get_logger(__name__)
+
 
 class Conversations(AgentBase):
     """
@@ -19,52 +26,97 @@ class Conversations(AgentBase):
 
     def __init__(self, config: AgentConfig):
         # self.config = config
+        self.llm_ctx = config.llm_ctx
         self.reasoning_llm = config.llm_ctx.reasoning_llm
-        self.task_llm = config.llm_ctx.reasoning_llm  # change to task
+        self.task_llm = config.llm_ctx.task_llm
         self.settings = config.settings
 
         self.assistant_name = self.settings.get("assistant").response["name"]
 
-    async def conversate(self, input: str) -> str:
+        # Each client (room, device) has its own conversation
+        self.sessions: dict[str, str] = {}
+        self._session_locks: dict[str, asyncio.Lock] = {}
+
+    def session_id(self, client_id: str = DEFAULT_CLIENT) -> str:
+        """
+        Get the current conversation id of a client, starting one if needed
+
+        Args:
+            client_id: the client the turn came from
+        """
+        convo_id = self.sessions.get(client_id)
+        # Start a new conversation on first use or once the system ended it
+        if convo_id is None or self.memory.get_chat_session(convo_id).ended_conversation:
+            convo_id = self._generate_short_key()
+            self.sessions[client_id] = convo_id
+        return convo_id
+
+    def session_lock(self, client_id: str = DEFAULT_CLIENT) -> asyncio.Lock:
+        """
+        The lock serializing the turns of a client
+
+        Args:
+            client_id: the client the turn came from
+        """
+        if client_id not in self._session_locks:
+            self._session_locks[client_id] = asyncio.Lock()
+        return self._session_locks[client_id]
+
+    async def conversate(
+        self, input: str, has_intent: bool = False, client_id: str = DEFAULT_CLIENT
+    ) -> str:
         """Engage in seamless conversation without
         having to manage previous context
 
         Args:
             input: str
+            has_intent: whether an intent was found for the input, used for model routing
+            client_id: the client the turn came from, each client has its own conversation
         """
+        # Turns of one client run in order, different clients run in parallel
+        with tracing.span("conversation", client_id=client_id):
+            async with self.session_lock(client_id):
+                return await self._conversate(input, has_intent, self.session_id(client_id))
 
-        # Generate a convo id if not one (first run potentially)
-        if not hasattr(self, "convo_id"):
-            self.convo_id = self._generate_short_key()
-        convo_id = self.convo_id
-
+    async def _conversate(self, input: str, has_intent: bool, convo_id: str) -> str:
         convo_memory = self.memory.get_chat_session(convo_id)
 
-        # Check if conversation was ended by system
-        if convo_memory.ended_conversation:
-            convo_id = self._generate_short_key()
-            convo_memory = self.memory.get_chat_session(convo_id)
-
         prompt_objs = {"assistant_name": self.assistant_name}
 
         # This is not the standard, but for the love of me their documentation is so poorly written
         # It is impossible to understand what to do after hours of testing, so we will omit using
         # Any automatic history tracking from them. Its probably better this way :)
 
+        # Simple turns go to the fast model, complex ones to the reasoning model
+        decision = self.llm_ctx.route(input, has_intent=has_intent)
+
         # Allow healing
-        chain = CASUAL_CHAT | heal(self.reasoning_llm, self.ensure_conversation)
+        chain = CASUAL_CHAT | heal(
+            self.llm_ctx.routed_llm(decision), self.ensure_conversation
+        )
 
         # Manual tracking
 
         chat_history = convo_memory.messages
-        print("Input was", input)
         llm_res = await chain.ainvoke(
             {"chat_history": chat_history, "message": input, **prompt_objs}
         )
         ai_response = llm_res.response
         convo_memory.add_user_message(HumanMessage(input))
         convo_memory.add_ai_message(AIMessage(ai_response))
-        print("convo entire mem", convo_memory.messages)
+        log.info(
+            "conversation turn",
+            session=convo_id,
+            route=decision.route,
+            history=len(convo_memory.messages),
+        )
+        # The history grows every turn, only dump it when debugging
+        if log.isEnabledFor(DEBUG):
+            log.debug(
+                "conversation history",
+                session=convo_id,
+                messages=[message.content for message in convo_memory.messages],
+            )
         return ai_response
 
     def get_convo_memory(self, session_id: str) -> ConversationMemory:
@@ -81,24 +133,13 @@ class Conversations(AgentBase):
         Args:
             memory: The conversation memory to help aid in memory healing
         """
-        keys_list = await self.memory.list_of_keys()
-
         async def heal_helper(heal_config: HealHelper):
             memory_data: dict[str, str] = {}
             llm_input: ChatPromptValue = heal_config.llm_input
             last_message: HumanMessage = llm_input.messages[-1].content
-            print("lmc", last_message)
-            chain = MEMORY_PICKER | self.task_llm
-            response = await chain.ainvoke(
-                {"user_response": last_message, "memories": keys_list}
-            )
-            mem: str = response.content
-            print("Memory that AI chose:", mem)
-
-            # Multiple memories requested
-            keys = [mem]
-            if mem.find(",") > 0:
-                keys = mem.split(",")
+            # only the closest keys go in the prompt
+            keys_list = await self.memory.candidate_keys(last_message)
+            keys = await self._pick_memory_keys(last_message, keys_list)
 
             for key in keys:
                 key_real = await self.memory.exists(key)
@@ -110,17 +151,48 @@ class Conversations(AgentBase):
             if not memory_data:
                 memory_data = "User does not have any memories related. Request information from user, but keep it brief."
             final_message = f"{last_message} | Memory Bank: {str(memory_data)}"
-            print(final_message)
+            log.debug("memory heal", keys=keys, message=final_message)
             return final_message
 
         return heal_helper
 
+    async def _pick_memory_keys(self, message: str, keys_list: list[str]) -> list[str]:
+        """
+        Pick the memory keys needed to answer a message
+
+        Args:
+            message: the user message
+            keys_list: the available memory keys
+        """
+        if self.llm_ctx.supports_structured("task"):
+            prompt = await MEMORY_PICKER_STRUCTURED.ainvoke(
+                {"user_response": message, "memories": keys_list}
+            )
+            pick = await self.llm_ctx.structured(
+                "task", prompt, MemoryPick, task="memory_picker"
+            )
+            if pick is not None:
+                log.debug("memory keys picked", keys=pick.keys)
+                return pick.keys
+
+        chain = MEMORY_PICKER | self.task_llm
+        response = await chain.ainvoke({"user_response": message, "memories": keys_list})
+        RETRY_STATS.record("memory_picker", "text")
+        mem: str = response.content
+        log.debug("memory keys picked", keys=mem)
+
+        # Multiple memories requested
+        keys = [mem]
+        if mem.find(",") > 0:
+            keys = mem.split(",")
+        return keys
+
     async def ensure_conversation(self, input):
         """
         Ensure AI reponse to conversation or heal
         """
         response: str = input.content
-        print("RESPONSE", response)
+        log.debug("conversation response", response=response)
         # A memory reuest was called
         if response.find("!memory_request!") >= 0:
             return ResponseMixin(
@@ -140,6 +212,25 @@ class Conversations(AgentBase):
         """
         return str(uuid4())[:8]
 
+    async def execute(
+        self,
+        input: str,
+        intent: Intent,
+        query: bool = False,
+        client_id: str = DEFAULT_CLIENT,
+    ) -> ResponseMixin:
+        """
+        Answer the input in the conversation
+
+        Args:
+            input: the transcribed input
+            intent: the matched intent
+            query: whether the input asks for information
+            client_id: the client the input came from
+        """
+        response = await self.conversate(input, has_intent=True, client_id=client_id)
+        return ResponseMixin(response=response, completed=True)
+
     def _inject_memory_agent(self, memory: Memory):
         """
         Used to innject the memory storage
@@ -1,12 +1,41 @@
 from server.agent import AgentBase, AgentConfig
-from server.models import ConversationMemory
+from server.history import ConversationMemory
+from server.keyindex import KeyIndex
+from server.models import (
+    Intent,
+    MemoryCommand,
+    MemoryExtraction,
+    KeyMatch,
+    MemorySettings,
+    DEFAULT_CLIENT,
+)
+from server.settings import SettingsSnapshot
 from shared.mixins import ResponseMixin
 from shared.chaintools import text
 from shared.utils import get_datetime
-from config.prompts import DETERMINE_SIMILAR_KEY, DETERMINE_IF_MEMORY
-from server.llm import heal
+from shared import tracing
+from shared.log import get_logger
+from config.prompts import (
+    DETERMINE_SIMILAR_KEY,
+    DETERMINE_IF_MEMORY,
+    DETERMINE_SIMILAR_KEY_STRUCTURED,
+    DETERMINE_IF_MEMORY_STRUCTURED,
+)
+from server.llm import heal, RETRY_STATS
+from server.scheduler import llm_priority, Priority
 from langchain_core.messages import AIMessage
 from langchain_core.chat_history import InMemoryChatMessageHistory
+from fnmatch import fnmatchcase
+
+import asyncio
+import time
+
+log = get_logger(__name__)
+
+# Sorted set of memory keys scored by their decayed use
+MEMORY_USAGE = "memory_usage"
+# Hash with the `epoch` the usage scores are relative to
+MEMORY_USAGE_META = "memory_usage_meta"
 
 
 class Memory(AgentBase):
@@ -15,10 +44,24 @@ class Memory(AgentBase):
     def __init__(self, config: AgentConfig):
         self.redis = config.redis
         self.llm_ctx = config.llm_ctx
+        self.memory_settings: MemorySettings = config.settings.memory
+        self._usage_epoch: float | None = None
+        self.key_index = KeyIndex()
+        self._key_index_synced: float | None = None
+        config.settings.subscribe(self._apply_settings)
 
         # Create InMemory chat storage
         self.chat_store: dict[str, ConversationMemory] = {}
 
+    def _apply_settings(self, snapshot: SettingsSnapshot):
+        """
+        Swap in new memory settings
+
+        Args:
+            snapshot: the new SettingsSnapshot
+        """
+        self.memory_settings = snapshot.memory
+
     def get_chat_session(self, session: str) -> ConversationMemory:
         """
         Get chat session history
@@ -32,15 +75,103 @@ class Memory(AgentBase):
 
     def _store_memory_key_to_memories(self, key: str):
         """
-        Store all stored memories to a memory list
+        Track a stored memory in the usage ranking and evict beyond the cap
 
         Args:
             key: the key to store"""
-        keys = self.redis.lrange("agent_memory", 0, -1)
-        if key not in keys:
-            self.redis.lpush("agent_memory", key)
+        self._touch(key)
+        self._evict()
+
+    def _usage_weight(self) -> float:
+        """
+        The score of a use now. Weights double every half life, so ranking by
+        the summed weights ranks by use with older uses decayed
+        """
+        half_life = self.memory_settings.decay_half_life_hours * 3600
+        now = time.time()
+        if self._usage_epoch is None:
+            self.redis.hsetnx(MEMORY_USAGE_META, "epoch", now)
+            self._usage_epoch = float(self.redis.hget(MEMORY_USAGE_META, "epoch") or now)
+        exponent = (now - self._usage_epoch) / half_life
+        if exponent > 64:
+            # another worker may have rebased already
+            epoch = float(self.redis.hget(MEMORY_USAGE_META, "epoch") or now)
+            if epoch != self._usage_epoch:
+                self._usage_epoch = epoch
+                return self._usage_weight()
+            # rescale before the scores overflow, the ranking stays the same
+            self.redis.zunionstore(MEMORY_USAGE, {MEMORY_USAGE: 2.0**-exponent})
+            self.redis.hset(MEMORY_USAGE_META, "epoch", now)
+            self._usage_epoch, exponent = now, 0.0
+        return 2.0**exponent
+
+    def _touch(self, key: str):
+        """
+        Count a use of a memory
 
-    async def store(self, key: str, memory: str | list, value_type: str = "str"):
+        Args:
+            key: the memory key
+        """
+        self.redis.zincrby(MEMORY_USAGE, self._usage_weight(), key)
+
+    def _evict(self):
+        """
+        Evict the least used memories beyond `max_memories`. Expired memories
+        leave the ranking lazily, see `_drop_expired`
+        """
+        limit = self.memory_settings.max_memories
+        size = self.redis.zcard(MEMORY_USAGE)
+        if size <= limit:
+            return
+        # least used first
+        evicted = self.redis.zrange(MEMORY_USAGE, 0, size - limit - 1)
+        pipe = self.redis.pipeline()
+        pipe.delete(*evicted)
+        pipe.zrem(MEMORY_USAGE, *evicted)
+        deleted, _ = pipe.execute()
+        for key in evicted:
+            self.key_index.remove(key.replace("memory|", "", 1))
+        log.info("memories evicted", evicted=deleted, expired=len(evicted) - deleted)
+
+    def _drop_expired(self, keys: list[str]):
+        """
+        Drop the memories that expired from the usage ranking
+
+        Args:
+            keys: the memory keys found in Redis, without the prefix
+        """
+        found = {self._to_memory_key(key) for key in keys}
+        missing = [key for key in self.redis.zrange(MEMORY_USAGE, 0, -1) if key not in found]
+        if not missing:
+            return
+        # stored by another worker since the scan
+        pipe = self.redis.pipeline()
+        for key in missing:
+            pipe.exists(key)
+        expired = [key for key, exists in zip(missing, pipe.execute()) if not exists]
+        if expired:
+            self.redis.zrem(MEMORY_USAGE, *expired)
+
+    def _ttl(self, key: str, ttl: int | None) -> int | None:
+        """
+        The seconds a memory lives: its own ttl, the first matching pattern of
+        `ttls` or the default
+
+        Args:
+            key: the memory key
+            ttl: the ttl given with the memory
+        """
+        if ttl:
+            return ttl
+        name = key.replace("memory|", "", 1)
+        for pattern, seconds in self.memory_settings.ttls.items():
+            if fnmatchcase(name, pattern):
+                return seconds
+        return self.memory_settings.default_ttl
+
+    async def store(
+        self, key: str, memory: str | list, value_type: str = "str", ttl: int | None = None
+    ):
         """
         Store a memory of type string or list
 
@@ -48,8 +179,16 @@ class Memory(AgentBase):
             key: the key of the memory to store
             memory: the memory to store
             value_type: the value of the memory type. supports [str, list]
+            ttl: optional, seconds until a short lived memory expires
         """
-        memory = str(memory)
+        if value_type == "list" and not isinstance(memory, list):
+            return ResponseMixin(
+                response="Could not convert memory to the type specified",
+                retry=True,
+                meta={"value_type": value_type, "memory": memory},
+            )
+        if value_type == "str":
+            memory = str(memory)
 
         # Done with casting/conversions
         key = await self.ensure_key(key)
@@ -63,7 +202,13 @@ class Memory(AgentBase):
                     d.lower() for d in data
                 ]:  # prevent duplicate, in future use a likeness function
                     self.redis.lpush(key, item)
-        self._store_memory_key_to_memories(key)
+        # the key the memory is stored under, ranked and indexed
+        stored_key = key.lower() if value_type == "str" else key
+        ttl = self._ttl(stored_key, ttl)
+        if ttl:
+            self.redis.expire(stored_key, ttl)
+        self.key_index.add(stored_key.replace("memory|", "", 1))
+        self._store_memory_key_to_memories(stored_key)
 
     def forget(self, key: str):
         """
@@ -73,6 +218,8 @@ class Memory(AgentBase):
             key: the memory key
         """
         res = self.redis.delete(key)
+        self.redis.zrem(MEMORY_USAGE, key)
+        self.key_index.remove(key.replace("memory|", "", 1))
         return ResponseMixin(response=bool(res), completed=True)
 
     async def ensure_key(self, potential_key: str) -> str:
@@ -86,7 +233,10 @@ class Memory(AgentBase):
         if self.redis.exists(key):
             return key
         else:
-            return self._to_memory_key(await self._determine_key_via_llm(potential_key))
+            # Key canonicalization must not hold up interactive calls
+            with llm_priority(Priority.BACKGROUND), tracing.span("memory.canonicalize_key"):
+                similar_key = await self._determine_key_via_llm(potential_key)
+            return self._to_memory_key(similar_key)
 
     async def _determine_key_via_llm(self, non_key: str) -> str:
         """
@@ -100,10 +250,27 @@ class Memory(AgentBase):
             requesting chain to revalidate
         """
 
-        like_keys: list[str] = await self.list_of_keys()
+        like_keys = await self.candidate_keys(non_key)
+        # the same key written differently needs no LLM, similar spellings may
+        # be other memories
+        match = self.key_index.exact(non_key)
+        if match is not None:
+            RETRY_STATS.record("key_matching", "index")
+            return match
+
+        if self.llm_ctx.supports_structured("intent"):
+            prompt = await DETERMINE_SIMILAR_KEY_STRUCTURED.ainvoke(
+                {"non_key": non_key, "list_of_keys": like_keys}
+            )
+            match = await self.llm_ctx.structured(
+                "intent", prompt, KeyMatch, task="key_matching"
+            )
+            if match is not None and (match.key is None or match.key in like_keys):
+                return match.key or non_key
 
         chain = DETERMINE_SIMILAR_KEY | self.llm_ctx.intent_llm | text
         res = await chain.ainvoke({"non_key": non_key, "list_of_keys": like_keys})
+        RETRY_STATS.record("key_matching", "text")
         if res.lower() == "none":
             # could not find key, creating new one
             return non_key
@@ -115,6 +282,40 @@ class Memory(AgentBase):
         like_keys: list[str] = self.redis.keys("memory|*")
         return [key.replace("memory|", "") for key in like_keys]
 
+    def _scan_keys(self) -> list[str]:
+        """Scan the memory keys without blocking Redis like `KEYS` does"""
+        keys = [
+            key.replace("memory|", "", 1)
+            for key in self.redis.scan_iter(match="memory|*", count=1000)
+        ]
+        self._drop_expired(keys)
+        return keys
+
+    async def _refresh_key_index(self):
+        """
+        Reconcile the key index and the usage ranking with Redis every
+        `key_index_refresh` seconds. Store, forget and eviction keep them
+        current in between, this catches keys that expired or that other
+        workers stored
+        """
+        now = time.monotonic()
+        synced = self._key_index_synced
+        if synced is not None and now - synced < self.memory_settings.key_index_refresh:
+            return
+        self._key_index_synced = now
+        self.key_index.sync(await asyncio.to_thread(self._scan_keys))
+
+    async def candidate_keys(self, query: str) -> list[str]:
+        """
+        Returns the memory keys closest to a key or message, at most `key_candidates`
+
+        Args:
+            query: the key or message to match
+        """
+        await self._refresh_key_index()
+        candidates = self.key_index.search(query, self.memory_settings.key_candidates)
+        return [key for key, _ in candidates]
+
     async def exists(self, key: str) -> bool:
         """Determine if memory exists
 
@@ -132,6 +333,10 @@ class Memory(AgentBase):
         """
         key = await self.ensure_key(key)
         data_type = self.redis.type(key)
+        if data_type != "none":
+            self._touch(key)
+        else:
+            self.redis.zrem(MEMORY_USAGE, key)
         if data_type == "string":
             data = self.redis.get(key)
         elif data_type == "list":
@@ -151,6 +356,24 @@ class Memory(AgentBase):
         """
         Queries all data about Agent for the LLM"""
 
+    async def execute(
+        self,
+        input: str,
+        intent: Intent,
+        query: bool = False,
+        client_id: str = DEFAULT_CLIENT,
+    ) -> ResponseMixin:
+        """
+        Remember what the input shares
+
+        Args:
+            input: the transcribed input
+            intent: the matched intent
+            query: whether the input asks for information
+            client_id: the client the input came from
+        """
+        return await self._is_this_memorable(input)
+
     async def understand_agent(self) -> ResponseMixin:
         """
         Method that returns a LLM understandable version of what this agent does
@@ -160,45 +383,101 @@ class Memory(AgentBase):
         return ResponseMixin(response=f"{class_doc} | Methods: {funcs}")
 
     async def _parse_memory_response(self, input: str):
-        """ """
-        input = text(input)
+        """
+        Parse the free text `key|type|memory` response into memory commands
+        and apply them, asking to heal when malformed
+
+        Args:
+            input: the AIMessage or string response from the LLM
+        """
+        input = text(input).strip()
         if input.lower() == "none":
             return ResponseMixin(response="Nothing to remember", completed=True)
 
-        commands = input.split(";")
-        if len(input.split("|")) > 2 and len(commands) == 0:
-            # issue with the AI response
-            return ResponseMixin(
-                response="You incorrectly responded. Please fix your response and only respond with the correct output.",
-                retry=True,
-                meta=text,
-            )
+        commands: list[MemoryCommand] = []
+        for cmd in input.split(";"):
+            split = [part.strip() for part in cmd.split("|")]
+            if len(split) < 2 or (split[1] != "clear" and len(split) < 3):
+                # issue with the AI response
+                return ResponseMixin(
+                    response="You incorrectly responded. Please fix your response and only respond with the correct output.",
+                    retry=True,
+                    meta={"invalid_command": cmd},
+                )
+            key, mod = split[0], split[1]
+            memory = None
+            if mod == "list":
+                memory = [item.strip() for item in split[2].split(",") if item.strip()]
+            elif mod != "clear":
+                memory = split[2]
+            try:
+                commands.append(MemoryCommand(key=key, action=mod, memory=memory))
+            except ValueError:
+                return ResponseMixin(
+                    response="You incorrectly responded. The type must be one of [str, list, clear].",
+                    retry=True,
+                    meta={"invalid_command": cmd},
+                )
+        return await self._apply_memory_commands(commands)
+
+    async def _apply_memory_commands(self, commands: list[MemoryCommand]) -> ResponseMixin:
+        """
+        Store or forget the extracted memories
+
+        Args:
+            commands: the memory commands
+        """
+        if not commands:
+            return ResponseMixin(response="Nothing to remember", completed=True)
 
         remembered = []
-        cleared = [] 
+        cleared = []
         for cmd in commands:
-            split = cmd.split("|")
-            key = split[0]
-            mod = split[1]
-            if mod == "clear":
-                self.forget(key)
-                cleared.append(key)
+            if cmd.action == "clear":
+                self.forget(cmd.key)
+                cleared.append(cmd.key)
             else:
-                memory = split[2]
-                await self.store(key=key, memory=memory, value_type=mod)
-                remembered.append(key)
+                memory = cmd.memory
+                if cmd.action == "list" and isinstance(memory, str):
+                    memory = [memory]
+                await self.store(
+                    key=cmd.key, memory=memory, value_type=cmd.action, ttl=cmd.ttl
+                )
+                remembered.append(cmd.key)
         return ResponseMixin(response=f"Remembered something: {','.join(remembered) if remembered else 'null'} | Forgot: {','.join(cleared) if cleared else 'null'}", completed=True)
 
     async def _is_this_memorable(self, input: str) -> ResponseMixin:
         """
-        Determines if this message is memorable
+        Determines if this message is memorable. Uses structured output when the
+        model supports it and falls back to healing the free text response.
+        Runs as background work for the LLM scheduler
 
         Args:
             input: the user input
         """
-        llm = self.llm_ctx.reasoning_llm
+        with llm_priority(Priority.BACKGROUND), tracing.span("memory.extract"):
+            return await self._extract_memories(input)
+
+    async def _extract_memories(self, input: str) -> ResponseMixin:
+        """
+        Extract and apply the memories of a message
+
+        Args:
+            input: the user input
+        """
+        if self.llm_ctx.supports_structured("task"):
+            prompt = await DETERMINE_IF_MEMORY_STRUCTURED.ainvoke({"text": input})
+            extraction = await self.llm_ctx.structured(
+                "task", prompt, MemoryExtraction, task="memory_extraction"
+            )
+            if extraction is not None:
+                return await self._apply_memory_commands(extraction.memories)
+
+        llm = self.llm_ctx.task_llm
         chain = DETERMINE_IF_MEMORY | heal(
-            llm.with_config(config={"llm_temperature": 0}), self._parse_memory_response
+            llm.with_config(config={"llm_temperature": 0}),
+            self._parse_memory_response,
+            task="memory_extraction",
         )
         response: ResponseMixin = await chain.ainvoke({"text": input})
         return response
@@ -0,0 +1,15 @@
+from pydantic import Field
+from datetime import datetime
+from langchain_core.chat_history import InMemoryChatMessageHistory
+
+
+class ConversationMemory(InMemoryChatMessageHistory):
+    """Higher order implementation of InMemoryChatMessageHistory
+    to help with conversational awareness
+    """
+
+    start_datetime: datetime
+    last_datetime: datetime | None = None
+    end_reason: str | None = None
+    ended_conversation: bool = False
+    conversation_highlights: list[str] = Field(default_factory=list)
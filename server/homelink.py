@@ -1,18 +1,58 @@
-from .intents import IntentEngine, IntentResponse
 from .settings import Settings, SettingsResponse
-from .voice import Voice
-from .llm import LLMContext
-from .agent import AgentBase, AgentConfig
+from .models import DEFAULT_CLIENT
 
 from shared.mixins import ResponseMixin
-
-from .agents import Memory, Conversations
-from shared.utils import load_yaml, Colors
-from config.prompts import CASUAL_CHAT
+from shared.utils import load_yaml
+from shared import tracing
+from shared.log import get_logger
 
 from redis import Redis
+from typing import TYPE_CHECKING, Callable
+from time import perf_counter
 
+import asyncio
 import os
+import threading
+
+log = get_logger(__name__)
+
+if TYPE_CHECKING:
+    from .intents import IntentEngine, IntentResponse
+    from .voice import Voice
+    from .llm import LLMContext
+    from .agent import AgentConfig
+    from .agents import Memory, Conversations
+    from .registry import AgentRegistry
+
+# Components build under one lock, they depend on each other
+_component_lock = threading.RLock()
+
+
+class component:
+    """
+    A HomeLink component built on first use. The heavy modules behind it are
+    only imported then, assigning the attribute replaces the component
+
+    Args:
+        factory: builds the component from the HomeLink
+    """
+
+    def __init__(self, factory: Callable):
+        self.factory = factory
+        self.__doc__ = factory.__doc__
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        with _component_lock:
+            if self.name not in obj.__dict__:
+                start = perf_counter()
+                obj.__dict__[self.name] = self.factory(obj)
+                obj.startup_times[self.name] = perf_counter() - start
+        return obj.__dict__[self.name]
 
 
 class HomeLink:
@@ -20,9 +60,10 @@ class HomeLink:
 
     Args:
         config_folder: the configuration folder
+        redis: optional Redis object, created from the environment if not given
     """
 
-    def __init__(self, config_folder: str):
+    def __init__(self, config_folder: str, redis: Redis | None = None):
         stgs = f"{config_folder}/settings.yml"
         stgs_opt = f"{config_folder}/SETTINGS_OPT.yml"
         intents_file = f"{config_folder}/intents.yml"
@@ -48,76 +89,216 @@ class HomeLink:
         #         f"Could not find client.yml in config folder {config_folder}."
         #     )
 
-        port: str = os.getenv("REDIS_PORT") or 6379
-        host: str = os.getenv("REDIS_HOST") or "localhost"
+        if redis is None:
+            port: str = os.getenv("REDIS_PORT") or 6379
+            host: str = os.getenv("REDIS_HOST") or "localhost"
 
-        # Create the Redis object
-        self.redis = Redis(host=host, port=port, decode_responses=True)
+            # Create the Redis object
+            redis = Redis(host=host, port=port, decode_responses=True)
+        self.redis = redis
 
         # Set the settings
         self.settings = Settings(
             settings=stgs, settings_opt=stgs_opt, client=client, redis=self.redis
         )
-        self.llm_context = LLMContext(settings=self.settings)
+        self.intents_file = intents_file
+        # Seconds spent building each component, see `benchmarks.startup`
+        self.startup_times: dict[str, float] = {}
+        self._warm_task: asyncio.Task | None = None
+        self._ready = False
+
+    @component
+    def llm_context(self) -> "LLMContext":
+        from .llm import LLMContext
+
+        return LLMContext(settings=self.settings)
+
+    @component
+    def voice(self) -> "Voice":
+        from .voice import Voice
+
+        return Voice(settings=self.settings)
 
-        self.voice = Voice(settings=self.settings)
+    @component
+    def agent_config(self) -> "AgentConfig":
+        from .agent import AgentConfig
 
-        # Create AgentConfig
-        self.agent_config = AgentConfig(
+        return AgentConfig(
             redis=self.redis, llm_ctx=self.llm_context, settings=self.settings
         )
 
-        # Load Main Agents
-        self.memory = Memory(config=self.agent_config)
-        self.conversations = Conversations(config=self.agent_config)
+    @component
+    def memory(self) -> "Memory":
+        from .agents.memory import Memory
 
+        return Memory(config=self.agent_config)
+
+    @component
+    def conversations(self) -> "Conversations":
+        from .agents.conversations import Conversations
+
+        conversations = Conversations(config=self.agent_config)
         # maybe if it makes sense in the future, abstract memory to be a core comp.
         # so it can be added to the config?
-        self.conversations._inject_memory_agent(self.memory)
+        conversations._inject_memory_agent(self.memory)
+        return conversations
+
+    @component
+    def intents_engine(self) -> "IntentEngine":
+        from .intents import IntentEngine
 
-        intent_data = load_yaml(intents_file)
-        self.intents_engine = IntentEngine(
-            intents=intent_data, llm=self.llm_context.intent_llm
+        intent_data = load_yaml(self.intents_file)
+        return IntentEngine(
+            intents=intent_data,
+            llm=self.llm_context.intent_llm,
+            llm_ctx=self.llm_context,
         )
 
-    async def send_chat(self, input: str):
+    @component
+    def agents(self) -> "AgentRegistry":
+        from .registry import AgentRegistry
+
+        return AgentRegistry(
+            config=self.agent_config,
+            settings=self.settings,
+            intents=self.intents_engine.intents,
+        )
+
+    def build_components(self):
+        """
+        Build every component now instead of on first use
+        """
+        for name in (
+            "llm_context",
+            "voice",
+            "memory",
+            "conversations",
+            "intents_engine",
+            "agents",
+        ):
+            getattr(self, name)
+
+    async def warm_up(self, startup: str | None = None):
+        """
+        Warm up the components before serving turns. How much is built before
+        serving is set by `server.startup`: `eager` builds everything, `background`
+        builds while serving and `lazy` builds on the first turn. Either way the
+        build runs off the event loop, turns wait for it in `ready`
+
+        Args:
+            startup: overrides the `server.startup` setting
+        """
+        # Open the Redis connection and fail fast if it is unreachable
+        await asyncio.to_thread(self.redis.ping)
+
+        # Pick up settings changed while starting and follow the other workers
+        self.settings.refresh_settings(await asyncio.to_thread(self.settings.load))
+        self.settings.start_listener()
+
+        startup = startup or self.settings.server.startup
+        if startup == "eager":
+            await self.warm_components()
+        elif startup == "background":
+            self._warm_task = asyncio.create_task(self.warm_components())
+
+    async def warm_components(self):
+        """
+        Build the components and render the prompts off the event loop
+        """
+        await asyncio.to_thread(self.build_components)
+        await self.memory.list_of_keys()
+
+        # Render the prompts once so the first turn does not pay for it
+        from config.prompts import CASUAL_CHAT
+
+        await CASUAL_CHAT.ainvoke(
+            {"chat_history": [], "message": "", "assistant_name": ""}
+        )
+        self._ready = True
+
+    async def ready(self):
+        """
+        Wait until the components are built, starting the build if nothing
+        started it yet. Turns call this first so a component is never built
+        on the event loop
+        """
+        if self._ready:
+            return
+        task = self._warm_task
+        # a failed build is retried by the next turn
+        if task is None or (task.done() and (task.cancelled() or task.exception())):
+            task = self._warm_task = asyncio.create_task(self.warm_components())
+        # a cancelled turn must not cancel the build the other turns wait on
+        await asyncio.shield(task)
+
+    async def close(self):
+        """
+        Release the components when shutting down
+        """
+        self.settings.stop_listener()
+        if "agents" in self.__dict__:
+            self.agents.close()
+        if self._warm_task:
+            self._warm_task.cancel()
+            await asyncio.gather(self._warm_task, return_exceptions=True)
+
+    @tracing.traced("homelink.send_chat")
+    async def send_chat(self, input: str, client_id: str = DEFAULT_CLIENT):
         """
         Sends a chat to the current conversational context
 
         Args:
             input: the initial chat message
+            client_id: the client the chat came from
         """
+        await self.ready()
         memorable: ResponseMixin = await self.memory._is_this_memorable(input)
-        print(
-            f"{Colors.YELLOW}Input:{Colors.RESET}{Colors.GREEN}",
-            memorable.response,
-            Colors.RESET,
-        )
+        log.debug("memory extraction", response=memorable.response)
 
-        response: str = await self.conversations.conversate(input)
+        response: str = await self.conversations.conversate(input, client_id=client_id)
 
         return ResponseMixin(response=response, completed=True)
 
-    async def execute_link(self, input: str):
+    @tracing.traced("homelink.execute_link")
+    async def execute_link(
+        self, input: str, client_id: str = DEFAULT_CLIENT, audio_format: str = "mp3"
+    ):
         """
         Execute a link
+
+        Args:
+            input: the transcribed input
+            client_id: the client the input came from
+            audio_format: the reply audio format negotiated with the client
         """
-        intents: IntentResponse = await self.determine_intent(input)  # TODO:FIX
-        if intents.intent:
-            intent_execution = await self.execute_intent(intents)
+        await self.ready()
+        intents: list[IntentResponse] = await self.determine_intents(input)
+        # intents without a working agent are answered by the conversation
+        agents = [intent.intent.agent for intent in intents if intent.intent]
+        if any(self.agents.available(agent) for agent in agents):
+            # the memories of the input are extracted while the agents run
+            memorable, result = await asyncio.gather(
+                self.memory._is_this_memorable(input),
+                self.execute_intents(intents, input, client_id),
+            )
+            log.debug("memory extraction", response=memorable.response)
+            if not result.response:
+                return None
+            audio_file = await self.voice.tts(result.response, audio_format)
+            return False, audio_file
         else:
             memorable: ResponseMixin = await self.memory._is_this_memorable(input)
 
-            response = await self.conversations.conversate(input)
+            response = await self.conversations.conversate(input, client_id=client_id)
 
             continous_convo = False
             if response.strip().endswith("?"):
                 continous_convo = True
             
-            audio_file = await self.voice.tts(response)
+            audio_file = await self.voice.tts(response, audio_format)
             return continous_convo, audio_file
 
-    async def determine_intent(self, input: str) -> IntentResponse:
+    async def determine_intent(self, input: str) -> "IntentResponse":
         """
         Gets intents from Intent Engine
 
@@ -126,9 +307,77 @@ class HomeLink:
         """
         return await self.intents_engine.determine_intent(input)
 
-    async def execute_intent(self, intent: IntentResponse):
-        """Execute the intent
+    @tracing.traced("intent.determine")
+    async def determine_intents(self, input: str) -> list["IntentResponse"]:
+        """
+        Gets the intent of every clause of a compound command
+
+        Args:
+            input: the requested input string
+        """
+        return await self.intents_engine.determine_intents(input)
+
+    @tracing.traced("intent.execute")
+    async def execute_intents(
+        self, intents: list["IntentResponse"], input: str, client_id: str = DEFAULT_CLIENT
+    ) -> ResponseMixin:
+        """
+        Execute the intents of a compound command concurrently. An intent that
+        waits for another only runs once it completed, the replies are merged
+        in the order they were asked. A failing clause answers with an error,
+        the other clauses still run
+
+        Args:
+            intents: the IntentResponses from `determine_intents`
+            input: the transcribed input
+            client_id: the client the input came from
+        """
+        if len(intents) == 1:
+            return await self._execute_clause(intents[0], input, client_id)
+
+        async def run(intent: "IntentResponse", after: asyncio.Task | None) -> ResponseMixin:
+            if after is not None and not (await after).completed:
+                return ResponseMixin(response="", meta={"skipped": intent.clause})
+            return await self._execute_clause(intent, intent.clause or input, client_id)
+
+        tasks: list[asyncio.Task] = []
+        for intent in intents:
+            after = tasks[intent.after] if intent.after is not None else None
+            tasks.append(asyncio.create_task(run(intent, after)))
+        results: list[ResponseMixin] = await asyncio.gather(*tasks)
+        return ResponseMixin(
+            response=" ".join(r.response.strip() for r in results if r.response),
+            completed=all(r.completed for r in results),
+            meta={"results": results},
+        )
+
+    async def _execute_clause(
+        self, intent: "IntentResponse", input: str, client_id: str
+    ) -> ResponseMixin:
+        try:
+            return await self.execute_intent(intent, input, client_id)
+        except Exception as ex:
+            log.exception("clause failed", clause=input)
+            return ResponseMixin(
+                response=f"I could not handle: {input}.", meta={"error": str(ex)}
+            )
+
+    async def execute_intent(
+        self, intent: "IntentResponse", input: str, client_id: str = DEFAULT_CLIENT
+    ) -> ResponseMixin:
+        """Execute the intent on its agent
 
         Args:
             intent: The IntentResponse to execute
+            input: the transcribed input
+            client_id: the client the input came from
         """
+        if intent.intent is None or not self.agents.available(intent.intent.agent):
+            # clauses without a working agent are answered by the conversation
+            response = await self.conversations.conversate(
+                input, has_intent=intent.intent is not None, client_id=client_id
+            )
+            return ResponseMixin(response=response, completed=True)
+        return await self.agents.dispatch(
+            intent.intent, input, query=intent.query, client_id=client_id
+        )
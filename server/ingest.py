@@ -0,0 +1,242 @@
+from .models import IngestSettings
+from shared.audio import RingBuffer, EnergyVAD
+
+from dataclasses import dataclass
+from typing import Protocol
+
+import asyncio
+import json
+import os
+
+
+class WakeWordEngine(Protocol):
+    frame_length: int
+
+    def process(self, frame: memoryview) -> bool: ...
+
+
+class RecognitionEngine(Protocol):
+    def accept(self, frame: memoryview) -> str | None: ...
+
+    def reset(self): ...
+
+
+class PorcupineWakeWord:
+    """
+    Porcupine wake-word engine, requires `pvporcupine` and `PORCUPINE_ACCESS_KEY`
+
+    Args:
+        keywords: the built-in porcupine keywords
+    """
+
+    def __init__(self, keywords: list[str]):
+        try:
+            import pvporcupine
+        except ImportError:
+            raise EnvironmentError("pvporcupine is not installed for wake-word detection")
+        self._porcupine = pvporcupine.create(
+            access_key=os.getenv("PORCUPINE_ACCESS_KEY"), keywords=keywords
+        )
+        self.frame_length: int = self._porcupine.frame_length
+
+    def process(self, frame: memoryview) -> bool:
+        return self._porcupine.process(frame.cast("h")) >= 0
+
+    def close(self):
+        self._porcupine.delete()
+
+
+class AlwaysAwake:
+    """Wake-word engine for clients that detect the wake word themselves"""
+
+    def __init__(self, frame_length: int):
+        self.frame_length = frame_length
+
+    def process(self, frame: memoryview) -> bool:
+        return True
+
+
+class VoskRecognition:
+    """
+    Vosk recognition engine, requires `vosk`
+
+    Args:
+        model: the loaded vosk Model
+        sample_rate: the sample rate of the audio
+    """
+
+    def __init__(self, model, sample_rate: int):
+        from vosk import KaldiRecognizer
+
+        self._recognizer = KaldiRecognizer(model, sample_rate)
+
+    def accept(self, frame: memoryview) -> str | None:
+        if self._recognizer.AcceptWaveform(bytes(frame)):
+            text = json.loads(self._recognizer.Result()).get("text", "")
+            return text or None
+        return None
+
+    def reset(self):
+        self._recognizer.Reset()
+
+
+def load_vosk_model(model_path: str):
+    """
+    Load a vosk model, shared by every connection
+
+    Args:
+        model_path: the model folder
+    """
+    try:
+        from vosk import Model
+    except ImportError:
+        raise EnvironmentError("vosk is not installed for speech recognition")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Could not find vosk model at {model_path}")
+    return Model(model_path)
+
+
+@dataclass
+class IngestEvent:
+    event: str
+    text: str | None = None
+
+
+@dataclass
+class IngestStats:
+    frames: int = 0
+    speech_frames: int = 0
+    wake_frames: int = 0
+    recognized_frames: int = 0
+    dropped_chunks: int = 0
+    dropped_bytes: int = 0
+    transcripts: int = 0
+
+
+class AudioPipeline:
+    """
+    Per connection frame-aligned audio pipeline. Audio goes through a preallocated
+    ring buffer, an energy VAD gates the wake-word engine, and once awake the
+    recognition engine runs until it returns a final transcript
+
+    Args:
+        settings: the IngestSettings
+        wake_word: the wake-word engine, sets the frame length
+        recognition: the recognition engine
+    """
+
+    def __init__(
+        self,
+        settings: IngestSettings,
+        wake_word: WakeWordEngine,
+        recognition: RecognitionEngine,
+    ):
+        self.settings = settings
+        self.wake_word = wake_word
+        self.recognition = recognition
+        self.frame_bytes = wake_word.frame_length * 2  # 16-bit mono
+        frame_ms = wake_word.frame_length * 1000 / settings.sample_rate
+
+        self.ring = RingBuffer(int(settings.sample_rate * 2 * settings.ring_seconds))
+        self._frame = bytearray(self.frame_bytes)
+        self._frame_view = memoryview(self._frame)
+        self.vad = EnergyVAD(
+            threshold_db=settings.vad_threshold_db,
+            hangover_frames=int(settings.vad_hangover_ms / frame_ms),
+        )
+        self.awake = False
+        self._awake_frames = 0
+        self._max_awake_frames = int(settings.max_utterance_seconds * 1000 / frame_ms)
+        self.stats = IngestStats()
+
+    def feed(self, chunk: bytes) -> list[IngestEvent]:
+        """
+        Feed received audio and process every complete frame
+
+        Args:
+            chunk: 16-bit mono PCM at the configured sample rate
+        """
+        self.ring.write(chunk)
+        self.stats.dropped_bytes = self.ring.dropped
+        events = []
+        while self.ring.read_into(self._frame_view, exact=True):
+            event = self._process_frame(self._frame_view)
+            if event:
+                events.append(event)
+        return events
+
+    def _process_frame(self, frame: memoryview) -> IngestEvent | None:
+        self.stats.frames += 1
+        speech = self.vad.is_speech(frame)
+        if speech:
+            self.stats.speech_frames += 1
+
+        if not self.awake:
+            if not speech:
+                return None
+            self.stats.wake_frames += 1
+            if self.wake_word.process(frame):
+                self.awake = True
+                self._awake_frames = 0
+                self.recognition.reset()
+                return IngestEvent(event="wake")
+            return None
+
+        # Keep feeding silence while awake so the recognizer can end the utterance
+        self.stats.recognized_frames += 1
+        self._awake_frames += 1
+        text = self.recognition.accept(frame)
+        if text:
+            self.awake = False
+            self.stats.transcripts += 1
+            return IngestEvent(event="transcript", text=text)
+        if self._awake_frames >= self._max_awake_frames:
+            self.awake = False
+            return IngestEvent(event="timeout")
+        return None
+
+    def close(self):
+        """Release the engine resources"""
+        if hasattr(self.wake_word, "close"):
+            self.wake_word.close()
+
+
+class IngestEngines:
+    """
+    Builds the audio pipeline of each connection, loading the shared
+    recognition model once
+
+    Args:
+        settings: the IngestSettings
+    """
+
+    def __init__(self, settings: IngestSettings):
+        self.settings = settings
+        self._model = None
+        self._lock = asyncio.Lock()
+
+    async def _recognition_model(self):
+        async with self._lock:
+            if self._model is None:
+                self._model = await asyncio.to_thread(
+                    load_vosk_model, self.settings.vosk_model_path
+                )
+        return self._model
+
+    async def pipeline(self) -> AudioPipeline:
+        """Build a pipeline for a new connection"""
+        settings = self.settings
+        if settings.wake_engine == "porcupine":
+            wake_word = await asyncio.to_thread(PorcupineWakeWord, settings.wake_words)
+        else:
+            wake_word = AlwaysAwake(settings.frame_length)
+
+        if settings.recognition_engine == "vosk":
+            recognition = VoskRecognition(
+                await self._recognition_model(), settings.sample_rate
+            )
+        else:
+            raise NotImplementedError(
+                f"Recognition engine `{settings.recognition_engine}` is not implemented"
+            )
+        return AudioPipeline(settings, wake_word, recognition)
@@ -1,15 +1,36 @@
 from shared.mixins import ResponseMixin
-from config.prompts import INTENT_TIE_BREAK
-from .models import Intent
+from config.prompts import INTENT_TIE_BREAK, INTENT_TIE_BREAK_STRUCTURED
+from .models import Intent, IntentChoice
+from .llm import LLMContext, RETRY_STATS
 from langchain_core.language_models import BaseLanguageModel
+from shared import tracing
 
 from dataclasses import dataclass
 
+import asyncio
+import re
+
+# Clauses of a compound command, `then` makes a clause wait for the one before it
+CLAUSE_CONNECTOR = re.compile(
+    r"\s*(?:[,;]\s*)?\b(and then|after that|then|and also|and|also)\b\s*|\s*;\s*",
+    re.IGNORECASE,
+)
+SEQUENTIAL_CONNECTORS = {"and then", "after that", "then"}
+
 
 @dataclass
 class IntentResponse(ResponseMixin):
     intent: Intent = None
     query: bool = False
+    # for compound commands, the clause and the index of the intent it waits for
+    clause: str | None = None
+    after: int | None = None
+
+
+@dataclass
+class Clause:
+    text: str
+    sequential: bool = False
 
 
 class IntentEngine:
@@ -18,10 +39,14 @@ class IntentEngine:
 
     Args:
         llm: the LLM model from Langchain
+        llm_ctx: optional LLMContext, enables structured output for tie breaks
     """
 
-    def __init__(self, intents: dict, llm: BaseLanguageModel):
+    def __init__(
+        self, intents: dict, llm: BaseLanguageModel, llm_ctx: LLMContext | None = None
+    ):
         self.llm = llm
+        self.llm_ctx = llm_ctx
 
         try:
             self.intents = [Intent.model_validate(item) for item in intents["intents"]]
@@ -48,7 +73,8 @@ class IntentEngine:
             input: the user query string
         """
 
-        intent_count = await self._count_intent(input)
+        with tracing.span("intent.keyword_scan", intents=len(self.intents)):
+            intent_count = await self._count_intent(input)
         max_count = max(intent_count.values())
         if max_count == 0:  # no intents found
             return IntentResponse(response="No intent")  # todo
@@ -73,11 +99,68 @@ class IntentEngine:
                     "likely_correct_intent_score": max_for_intent,
                     "query": intent.query.when if intent.query else [],
                 }
-            chosen = await self.llm_tiebreak(
-                input=input, top_intents=intents_for_tiebreak
-            )
+            with tracing.span("intent.tiebreak", candidates=len(top_intents)):
+                chosen = await self.llm_tiebreak(
+                    input=input, top_intents=intents_for_tiebreak
+                )
             return chosen
 
+    async def segment(self, input: str) -> list[Clause]:
+        """
+        Split a compound command into clauses. A clause without any intent keyword
+        belongs to the one before it, ie `text mom and dad`
+
+        Args:
+            input: the user query string
+        """
+        parts = CLAUSE_CONNECTOR.split(input)
+        clauses: list[Clause] = []
+        connector = None
+        for index, part in enumerate(parts):
+            if index % 2:
+                connector = part
+                continue
+            part = (part or "").strip()
+            if not part:
+                continue
+            counts = await self._count_intent(part)
+            if clauses and not any(counts.values()):
+                joint = f" {connector} " if connector else "; "
+                clauses[-1].text = f"{clauses[-1].text}{joint}{part}"
+            else:
+                sequential = (connector or "").lower() in SEQUENTIAL_CONNECTORS
+                clauses.append(Clause(text=part, sequential=bool(clauses) and sequential))
+            connector = None
+        return clauses
+
+    async def determine_intents(self, input: str) -> list[IntentResponse]:
+        """
+        Determine the intent of every clause of a compound command, the clauses
+        are scored concurrently. Clauses of a compound command without an intent
+        are kept with `intent` unset, so they can be answered by the conversation
+
+        Args:
+            input: the user query string
+        """
+        clauses = await self.segment(input)
+        if len(clauses) <= 1:
+            response = await self.determine_intent(input)
+            return [response] if response and response.intent else []
+
+        responses = await asyncio.gather(
+            *(self.determine_intent(clause.text) for clause in clauses)
+        )
+        intents: list[IntentResponse] = []
+        previous: int | None = None
+        for clause, response in zip(clauses, responses):
+            if not response or not response.intent:
+                response = IntentResponse(response="No intent")
+            response.clause = clause.text
+            response.after = previous if clause.sequential else None
+            previous = len(intents)
+            intents.append(response)
+        return intents
+
     async def llm_tiebreak(
         self, input: str, top_intents: dict[str, int], tries: int = 1
     ) -> IntentResponse:
@@ -88,12 +171,19 @@ class IntentEngine:
             input: the input string
             top_intents: dictionary of the top intents
         """
+        if tries == 1 and self.llm_ctx and self.llm_ctx.supports_structured("intent"):
+            chosen = await self._structured_tiebreak(input, top_intents)
+            if chosen is not None:
+                return chosen
+
         if tries == 3:
+            RETRY_STATS.record("intent_tiebreak", "text", retries=tries - 1, failed=True)
             return None
         chain = INTENT_TIE_BREAK | self.llm
         msg_ctx = await chain.ainvoke({"input": input, "intent_data": str(top_intents)})
         response: str = msg_ctx.content
         if response.lower() == "none":
+            RETRY_STATS.record("intent_tiebreak", "text", retries=tries - 1)
             return IntentResponse(response="No intent")
         # query tag
         query = response.find("?") > 0
@@ -103,8 +193,37 @@ class IntentEngine:
         if not intent:
             tries += 1
             return await self.llm_tiebreak(input, top_intents, tries)
+        RETRY_STATS.record("intent_tiebreak", "text", retries=tries - 1)
         return IntentResponse(response="", intent=intent, query=query)
 
+    async def _structured_tiebreak(
+        self, input: str, top_intents: dict[str, int]
+    ) -> IntentResponse | None:
+        """
+        Breaks tie with a schema constrained response
+
+        Args:
+            input: the input string
+            top_intents: dictionary of the top intents
+
+        Returns:
+            the IntentResponse, or None if the output could not be used
+        """
+        prompt = await INTENT_TIE_BREAK_STRUCTURED.ainvoke(
+            {"input": input, "intent_data": str(top_intents)}
+        )
+        choice = await self.llm_ctx.structured(
+            "intent", prompt, IntentChoice, task="intent_tiebreak"
+        )
+        if choice is None:
+            return None
+        if choice.intent is None or choice.intent.lower() == "none":
+            return IntentResponse(response="No intent")
+        intent = self._get_intent_data(choice.intent)
+        if not intent:
+            return None
+        return IntentResponse(response="", intent=intent, query=choice.query)
+
     async def _count_intent(self, input: str) -> dict[str, int]:
         """
         Count the intents into a dict
@@ -0,0 +1,127 @@
+import re
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase and turn separators into single spaces, `Grocery-List` -> `grocery list`
+
+    Args:
+        text: a key or free text
+    """
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    The trigrams of every word, padded so short words and word starts count
+
+    Args:
+        text: a key or free text
+    """
+    grams: set[str] = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class KeyIndex:
+    """
+    Trigram index of memory keys, updated as keys come and go, so only the
+    closest keys have to be shown to the LLM
+    """
+
+    def __init__(self):
+        self._grams: dict[str, set[str]] = {}
+        self._postings: dict[str, set[str]] = {}
+        self._normalized: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._grams
+
+    def add(self, key: str):
+        """
+        Index a key
+
+        Args:
+            key: the memory key
+        """
+        if key in self._grams:
+            return
+        grams = self._grams[key] = trigrams(key)
+        self._normalized[normalize(key)] = key
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str):
+        """
+        Drop a key from the index
+
+        Args:
+            key: the memory key
+        """
+        normalized = normalize(key)
+        if self._normalized.get(normalized) == key:
+            del self._normalized[normalized]
+        for gram in self._grams.pop(key, ()):
+            keys = self._postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self._postings[gram]
+
+    def sync(self, keys: list[str]):
+        """
+        Only index the given keys, touching just the ones that changed
+
+        Args:
+            keys: the current memory keys
+        """
+        current = set(keys)
+        for key in self._grams.keys() - current:
+            self.remove(key)
+        for key in current - self._grams.keys():
+            self.add(key)
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """
+        The k keys closest to the query, best first. A key scores by the share
+        of trigrams it has in common with the query, relative to the key for
+        free text and to both for keys. Keys without a shared trigram fill up
+        the rest, since the LLM may still match them by meaning
+
+        Args:
+            query: a key or free text
+            k: the most keys returned
+        """
+        query_grams = trigrams(query)
+        shared: dict[str, int] = {}
+        for gram in query_grams:
+            for key in self._postings.get(gram, ()):
+                shared[key] = shared.get(key, 0) + 1
+
+        scores = []
+        for key, count in shared.items():
+            grams = len(self._grams[key])
+            dice = 2 * count / (grams + len(query_grams))
+            scores.append((key, max(dice, count / grams)))
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        if len(scores) < k:
+            rest = sorted(key for key in self._grams if key not in shared)
+            scores.extend((key, 0.0) for key in rest[: k - len(scores)])
+        return scores[:k]
+
+    def exact(self, key: str) -> str | None:
+        """
+        The indexed key that is the same key written differently,
+        `Grocery List` -> `grocery_list`. Keys that are only spelled alike,
+        such as `kate_birthday` and `nate_birthday`, are left to the LLM
+
+        Args:
+            key: the key to match
+        """
+        return self._normalized.get(normalize(key))
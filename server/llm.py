@@ -1,17 +1,23 @@
 from .models import LLMSettings
-from .settings import Settings
+from .settings import Settings, SettingsSnapshot
+from .router import ModelRouter, RouteDecision, FAST, STRONG
+from .scheduler import LLMScheduler, ProviderBudget, current_priority
 from shared.mixins import ResponseMixin
+from shared import tracing
 from config.prompts import HEAL_PROMPT_SECOND_ATTEMPT, HEAL_PROMPT_FIRST_ATTEMPT
-from langchain_openai import OpenAI, ChatOpenAI
-from langchain_core.language_models import BaseLanguageModel
+from langchain_core.language_models import BaseLanguageModel, BaseChatModel
 from langchain_core.messages import SystemMessage, AIMessage, HumanMessage
-from langchain.chains.base import Chain
-from langchain.chains.sequential import SequentialChain
 from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, ValidationError
 from dataclasses import dataclass
-from typing import Any, Callable
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+from time import perf_counter
+import asyncio
 import inspect
 
+Schema = TypeVar("Schema", bound=BaseModel)
+
 
 class LLMContext:
     """
@@ -26,31 +32,336 @@ class LLMContext:
         llm_settings = settings.llm
         self.llm_settings = llm_settings
 
-        # Reasoning LLM
-        self._reasoning_llm = construct_llm(
-            llm_settings.reasoning_llm, llm_settings.reasoning_llm_model
+        self.single_flight = SingleFlight()
+        self.router = ModelRouter(
+            threshold=llm_settings.routing_threshold,
+            latency_budget=llm_settings.routing_latency_budget,
         )
+        self.scheduler = LLMScheduler(self._budgets(llm_settings))
+        # The upstream models, swappable at runtime through the setters
+        self._models: dict[str, BaseLanguageModel] = {}
+        self.providers: dict[str, str] = {}
+        self._build_models(llm_settings)
+
+        # Chains hold on to these runnables, every call is routed through the context
+        self._reasoning_llm = self._bind("reasoning")
+        self._intent_llm = self._bind("intent")
+        self._fast_llm = self._bind("fast")
+        # Background and helper calls such as memory extraction and picking
+        self._task_llm = self._bind("task")
+        # Only calls through these are chosen by the router and feed its stats
+        self._routed = {FAST: self._bind("fast", FAST), STRONG: self._bind("reasoning", STRONG)}
+
+        settings.subscribe(self.apply_settings)
+
+    @staticmethod
+    def _budgets(llm_settings: LLMSettings) -> dict[str, ProviderBudget]:
+        return {
+            provider: ProviderBudget(**limits.model_dump())
+            for provider, limits in llm_settings.provider_limits.items()
+        }
+
+    def _build_models(self, llm_settings: LLMSettings):
+        """
+        Construct the model of each role
 
+        Args:
+            llm_settings: the LLMSettings
+        """
+        # Provider of each model role, used for the scheduler budgets
+        self.providers = {
+            "reasoning": llm_settings.reasoning_llm,
+            "intent": llm_settings.reasoning_llm,
+            "fast": llm_settings.fast_llm or llm_settings.reasoning_llm,
+            "task": llm_settings.reasoning_llm,
+        }
+        reasoning = construct_llm(
+            llm_settings.reasoning_llm, llm_settings.reasoning_llm_model
+        )
+        self._models["reasoning"] = reasoning
+        self._models["task"] = reasoning
         # Intent LLM
-        self._intent_llm = construct_llm(
+        self._models["intent"] = construct_llm(
             llm_settings.reasoning_llm, llm_settings.reasoning_llm_model
         )
+        # Fast LLM for simple conversational turns
+        if llm_settings.fast_llm and llm_settings.fast_llm_model:
+            self._models["fast"] = construct_llm(
+                llm_settings.fast_llm, llm_settings.fast_llm_model
+            )
+        else:
+            self._models["fast"] = reasoning
+
+    def apply_settings(self, snapshot: SettingsSnapshot):
+        """
+        Swap in new LLM settings, chains keep working as they call through the context
+
+        Args:
+            snapshot: the new SettingsSnapshot
+        """
+        llm_settings = snapshot.llm
+        if llm_settings == self.llm_settings:
+            return
+        previous, self.llm_settings = self.llm_settings, llm_settings
+        self.router.threshold = llm_settings.routing_threshold
+        self.router.latency_budget = llm_settings.routing_latency_budget
+        models = ("reasoning_llm", "reasoning_llm_model", "fast_llm", "fast_llm_model")
+        if any(getattr(previous, f) != getattr(llm_settings, f) for f in models):
+            self._build_models(llm_settings)
+        if previous.provider_limits != llm_settings.provider_limits:
+            self.scheduler.update_budgets(self._budgets(llm_settings))
 
     @property
-    def intent_llm(self) -> BaseLanguageModel:
+    def intent_llm(self) -> RunnableLambda:
         return self._intent_llm
 
     @property
-    def reasoning_llm(self) -> BaseLanguageModel:
+    def fast_llm(self) -> RunnableLambda:
+        return self._fast_llm
+
+    @property
+    def reasoning_llm(self) -> RunnableLambda:
         return self._reasoning_llm
 
+    @property
+    def task_llm(self) -> RunnableLambda:
+        return self._task_llm
+
     @intent_llm.setter
     def intent_llm(self, value: BaseLanguageModel):
-        self._intent_llm = value
+        self._models["intent"] = value
 
     @reasoning_llm.setter
     def reasoning_llm(self, value: BaseLanguageModel):
-        self._reasoning_llm = value
+        self._models["reasoning"] = value
+
+    @fast_llm.setter
+    def fast_llm(self, value: BaseLanguageModel):
+        self._models["fast"] = value
+
+    @task_llm.setter
+    def task_llm(self, value: BaseLanguageModel):
+        self._models["task"] = value
+
+    def route(
+        self, input: str, has_intent: bool = False, memory_request: bool = False
+    ) -> RouteDecision:
+        """
+        Decide whether a conversational turn goes to the fast or the strong model
+
+        Args:
+            input: the user input
+            has_intent: whether an intent was found for the input
+            memory_request: whether the turn asks for a memory
+        """
+        return self.router.route(input, has_intent, memory_request)
+
+    def routed_llm(self, decision: RouteDecision) -> RunnableLambda:
+        """
+        Get the LLM for a routing decision
+
+        Args:
+            decision: the RouteDecision from `route`
+        """
+        return self._routed[decision.route]
+
+    def _bind(self, role: str, route: str | None = None) -> RunnableLambda:
+        """
+        Create the runnable used by chains for a model role
+
+        Args:
+            role: the model role (reasoning, intent, fast, task)
+            route: the router route the calls are observed under, if chosen by the router
+        """
+
+        async def invoke(input):
+            return await self.ainvoke(role, input, route=route)
+
+        return RunnableLambda(invoke, name=f"{route or role}_llm")
+
+    async def ainvoke(self, role: str, input: Any, route: str | None = None, **kwargs):
+        """
+        Invoke the model for a role. Identical in-flight (model, prompt) calls
+        of the same priority share a single upstream request, which is scheduled
+        within the provider budgets at the priority of the calling context
+
+        Args:
+            role: the model role (reasoning, intent, fast, task)
+            input: the prompt value, messages or string for the model
+            route: the router route of the call, only routed calls feed the router stats
+            kwargs: additional model call parameters, such as `response_format`
+        """
+        llm = self._models[role]
+        prompt = prompt_key(input)
+        # The shared call is scheduled at the priority of the caller that started
+        # it, an interactive caller must not wait behind background work
+        key = (model_name(llm), prompt, repr(sorted(kwargs.items())), current_priority())
+        with tracing.span(f"llm.{role}", model=key[0]):
+            return await self.single_flight.run(
+                key,
+                lambda: self.scheduler.run(
+                    self.providers[role],
+                    lambda: self._observed(route, llm, input, kwargs),
+                    tokens=estimate_tokens(prompt),
+                ),
+            )
+
+    def supports_structured(self, role: str) -> bool:
+        """
+        Whether structured output is enabled and supported by the model of a role
+
+        Args:
+            role: the model role (reasoning, intent, fast, task)
+        """
+        if not self.llm_settings.structured_output:
+            return False
+        llm = self._models[role]
+        supported = getattr(llm, "supports_structured_output", None)
+        if supported is not None:
+            return bool(supported)
+        return isinstance(llm, BaseChatModel)
+
+    async def structured(
+        self, role: str, input: Any, schema: type[Schema], task: str
+    ) -> Schema | None:
+        """
+        Invoke the model for a role constrained to a JSON schema
+
+        Args:
+            role: the model role (reasoning, intent, fast, task)
+            input: the prompt value, messages or string for the model
+            schema: the pydantic model of the expected output
+            task: the task name the outcome is recorded under
+
+        Returns:
+            the validated output, or None so the caller can fall back to healing
+        """
+        try:
+            response = await self.ainvoke(
+                role, input, response_format=json_schema_format(schema)
+            )
+        except Exception:
+            # Provider rejected the schema
+            RETRY_STATS.record(task, "structured", failed=True)
+            return None
+        parsed = parse_structured(schema, response)
+        RETRY_STATS.record(task, "structured", failed=parsed is None)
+        return parsed
+
+    async def _observed(
+        self, route: str | None, llm: BaseLanguageModel, input: Any, kwargs: dict
+    ):
+        """Invoke the model, feeding the outcome of routed calls to the router stats"""
+        # Calls the router did not choose must not sway its routes
+        if route is None:
+            return await llm.ainvoke(input, **kwargs)
+        start = perf_counter()
+        try:
+            response = await llm.ainvoke(input, **kwargs)
+        except Exception:
+            self.router.observe(route, perf_counter() - start, error=True)
+            raise
+        self.router.observe(route, perf_counter() - start)
+        return response
+
+    def stats(self) -> dict:
+        """Returns the runtime statistics of the LLM context"""
+        return {
+            "single_flight": self.single_flight.stats(),
+            "router": self.router.stats(),
+            "retries": RETRY_STATS.stats(),
+            "scheduler": self.scheduler.stats(),
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one upstream future
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+        self._waiters: dict[Hashable, int] = {}
+        self.upstream_calls = 0
+        self.coalesced_callers = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        """
+        Run the factory, or join the call already in flight for the key
+
+        Args:
+            key: the hashable identity of the call
+            factory: creates the awaitable when no call is in flight
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced_callers += 1
+            self._waiters[key] += 1
+        else:
+            future = asyncio.ensure_future(factory())
+            self.upstream_calls += 1
+            self._in_flight[key] = future
+            self._waiters[key] = 1
+            future.add_done_callback(lambda done: self._complete(key, done))
+
+        # A cancelled caller must not cancel the call for the others
+        return await asyncio.shield(future)
+
+    def _complete(self, key: Hashable, future: asyncio.Future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+            del self._waiters[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        """Returns the coalescing statistics"""
+        return {
+            "upstream_calls": self.upstream_calls,
+            "coalesced_callers": self.coalesced_callers,
+            "in_flight": len(self._in_flight),
+            "waiting_callers": sum(self._waiters.values()),
+        }
+
+
+class RetryStats:
+    """
+    Tracks LLM output retries per task and mode (structured or text with healing)
+    """
+
+    def __init__(self):
+        self.tasks: dict[str, dict[str, dict[str, int]]] = {}
+
+    def record(self, task: str, mode: str, retries: int = 0, failed: bool = False):
+        """
+        Record an LLM output task
+
+        Args:
+            task: the task name
+            mode: the output mode [structured, text]
+            retries: how many additional LLM calls were needed
+            failed: whether no valid output was produced
+        """
+        counts = self.tasks.setdefault(task, {}).setdefault(
+            mode, {"calls": 0, "retries": 0, "failures": 0}
+        )
+        counts["calls"] += 1
+        counts["retries"] += retries
+        counts["failures"] += int(failed)
+
+    def stats(self) -> dict:
+        """Returns the counts and retry rates per task and mode"""
+        return {
+            task: {
+                mode: {**counts, "retry_rate": counts["retries"] / counts["calls"]}
+                for mode, counts in modes.items()
+            }
+            for task, modes in self.tasks.items()
+        }
+
+
+RETRY_STATS = RetryStats()
 
 
 @dataclass
@@ -65,6 +376,7 @@ def heal(
     llm: BaseLanguageModel,
     action: Callable[[Any], ResponseMixin],
     retry_max: int = 3,
+    task: str | None = None,
 ):
     """
     Heals any functions from a bad LLM response. You must return a `ResponseMixin`
@@ -74,6 +386,7 @@ def heal(
         llm: The BaseLanguageModel (llama, openai, anthropic, ..etc)
         action: the Runnable function that takes in a parameter. Must return a ResponseMixin
         retry_max: default set to 3, how many times to retry
+        task: the task name retries are recorded under, defaults to the action name
 
     Examples:
         ```py
@@ -82,7 +395,14 @@ def heal(
         ```
     """
 
+    task = task or action.__name__
+
     async def healer(input, retry: int = 0):
+        # each attempt shows up as an LLM span under the heal span
+        with tracing.span("llm.heal", task=task):
+            return await attempts(input, retry)
+
+    async def attempts(input, retry: int = 0):
         original_input = input
 
         async def invoke(local_input):
@@ -94,6 +414,7 @@ def heal(
         while retry < retry_max:
             llm_response, response = await invoke(input)
             if not response.retry:
+                RETRY_STATS.record(task, "text", retries=retry)
                 return response
 
             # If provided a helper
@@ -128,6 +449,7 @@ def heal(
                     )
             retry += 1
 
+        RETRY_STATS.record(task, "text", retries=retry - 1, failed=True)
         return response
 
     return RunnableLambda(healer)
@@ -142,9 +464,86 @@ def construct_llm(llm: str, llm_model: str) -> BaseLanguageModel:
         llm_model: the LLM model
     """
     if llm == "openai":
+        # The provider SDK is only imported once a model of it is configured
+        from langchain_openai import OpenAI, ChatOpenAI
+
         if "davinci" in llm_model or "babbage" in llm_model:
             return OpenAI(model=llm_model)
         else:
             return ChatOpenAI(model=llm_model)
     elif llm == "llama":
         raise NotImplementedError("LLama is not implemented yet")
+
+
+def model_name(llm: BaseLanguageModel) -> str:
+    """
+    Get the model identifier of an LLM
+
+    Args:
+        llm: the LLM model
+    """
+    return (
+        getattr(llm, "model_name", None)
+        or getattr(llm, "model", None)
+        or type(llm).__name__
+    )
+
+
+def estimate_tokens(prompt: str, completion: int = 256) -> int:
+    """
+    Roughly estimate the tokens of a call, about 4 characters per token
+
+    Args:
+        prompt: the prompt string
+        completion: the expected completion tokens
+    """
+    return len(prompt) // 4 + completion
+
+
+def prompt_key(input: Any) -> str:
+    """
+    Get a comparable representation of a model input
+
+    Args:
+        input: the prompt value, messages or string
+    """
+    if isinstance(input, str):
+        return input
+    if hasattr(input, "to_string"):
+        return input.to_string()
+    return repr(input)
+
+
+@lru_cache
+def json_schema_format(schema: type[BaseModel]) -> dict:
+    """
+    Build the JSON schema response format for a schema once
+
+    Args:
+        schema: the pydantic model
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema()},
+    }
+
+
+def parse_structured(schema: type[Schema], response: Any) -> Schema | None:
+    """
+    Validate a structured LLM response against its schema
+
+    Args:
+        schema: the pydantic model
+        response: the AIMessage or string returned by the model
+    """
+    content = response if isinstance(response, str) else getattr(response, "content", None)
+    if not isinstance(content, str):
+        return None
+    content = content.strip()
+    # Some models still fence their JSON
+    if content.startswith("```"):
+        content = content.strip("`").removeprefix("json").strip()
+    try:
+        return schema.model_validate_json(content)
+    except ValidationError:
+        return None
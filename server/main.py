@@ -1,29 +1,283 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from contextlib import asynccontextmanager
+from pydantic import BaseModel
 from .homelink import HomeLink
+from .ingest import AudioPipeline, IngestEngines, IngestEvent
+from .models import ServerSettings, DEFAULT_CLIENT
+from .transport import PCMStreamServer
+from .workers import TurnPool, PoolFull, PoolClosed, LoopLagMonitor
+from shared.audio import AUDIO_FORMATS, PCM_SAMPLE_RATE, negotiate_format
+from shared.utils import load_yaml
+from shared import tracing
+from shared import log
 
-
-import pvporcupine
-import os
 import asyncio
+import io
+import os
+import uvicorn
+
+
+class TurnRequest(BaseModel):
+    input: str
+    client_id: str = DEFAULT_CLIENT
+
+
+def default_config_folder() -> str:
+    """Returns the config folder, overridable with `HOMELINK_CONFIG`"""
+    return os.getenv("HOMELINK_CONFIG") or os.path.join(os.getcwd(), "config")
+
+
+def stream_audio(audio: io.BytesIO, chunk_size: int):
+    """
+    Stream the audio buffer in chunks without copying it
+
+    Args:
+        audio: the audio from `Voice.tts`
+        chunk_size: the size of each chunk
+    """
+    buffer = audio.getbuffer()
+    for start in range(0, len(buffer), chunk_size):
+        yield bytes(buffer[start : start + chunk_size])
+
+
+def create_app(config_folder: str | None = None, homelink: HomeLink | None = None) -> FastAPI:
+    """
+    Create the HomeLink server app
+
+    Args:
+        config_folder: the configuration folder, see `default_config_folder`
+        homelink: optional HomeLink to serve, created on startup if not given
+    """
+
+    @asynccontextmanager
+    async def on_fastapi_lifecycle(app: FastAPI):
+        link = homelink or HomeLink(config_folder=config_folder or default_config_folder())
+        log.configure(**link.settings.logging.model_dump())
+        tracing_settings = link.settings.tracing
+        if tracing_settings.enabled:
+            tracing.configure(
+                tracing_settings.service,
+                file=tracing_settings.file,
+                endpoint=tracing_settings.endpoint,
+                sample_rate=tracing_settings.sample_rate,
+            )
+        await link.warm_up()
+
+        server_settings = link.settings.server
+        pool = TurnPool(
+            workers=server_settings.workers, max_pending=server_settings.max_pending
+        )
+        await pool.start()
+        monitor = LoopLagMonitor()
+        await monitor.start()
+
+        app.state.homelink = link
+        app.state.pool = pool
+        app.state.loop_monitor = monitor
+        app.state.ingest = IngestEngines(link.settings.ingest)
+        app.state.transport = None
+        if link.settings.ingest.tcp_port is not None:
+            transport = PCMStreamServer(
+                app.state.ingest,
+                pool,
+                link.execute_link,
+                chunk_size=server_settings.stream_chunk_size,
+            )
+            await transport.start(server_settings.host, link.settings.ingest.tcp_port)
+            app.state.transport = transport
+        try:
+            yield
+        finally:
+            if app.state.transport:
+                await app.state.transport.stop()
+            # drain the turns still in flight before shutting down
+            await pool.drain(timeout=server_settings.drain_timeout)
+            await link.close()
+            await monitor.close()
+            tracing.shutdown()
+            log.shutdown()
+
+    app = FastAPI(title="HomeLink server", lifespan=on_fastapi_lifecycle)
+
+    async def run_turn(func, *args):
+        try:
+            return await app.state.pool.submit(func, *args)
+        except PoolFull:
+            raise HTTPException(status_code=503, detail="Server is busy", headers={"Retry-After": "1"})
+        except PoolClosed:
+            raise HTTPException(status_code=503, detail="Server is shutting down")
+
+    @app.get("/")
+    def get_root():
+        return {
+            "status": "active",
+            "pool": app.state.pool.stats(),
+            "loop": app.state.loop_monitor.stats(),
+        }
+
+    @app.post("/awake")
+    async def awake(
+        turn: TurnRequest,
+        accept: str | None = Header(default=None),
+        traceparent: str | None = Header(default=None),
+    ):
+        link: HomeLink = app.state.homelink
+        audio_format = negotiate_format(accept, link.settings.voice.audio_formats)
+        parent = tracing.SpanContext.from_traceparent(traceparent)
+        with tracing.span("server.awake", parent=parent, client_id=turn.client_id):
+            result = await run_turn(link.execute_link, turn.input, turn.client_id, audio_format)
+        if not result:
+            return Response(status_code=204)
+
+        continous_convo, audio = result
+        media_type = AUDIO_FORMATS[audio_format]
+        if audio_format == "pcm":
+            media_type = f"{media_type};rate={PCM_SAMPLE_RATE}"
+        return StreamingResponse(
+            stream_audio(audio, link.settings.server.stream_chunk_size),
+            media_type=media_type,
+            headers={
+                "X-Continuous-Conversation": str(continous_convo).lower(),
+                "X-Audio-Format": audio_format,
+            },
+        )
+
+    @app.post("/chat")
+    async def chat(turn: TurnRequest, traceparent: str | None = Header(default=None)):
+        link: HomeLink = app.state.homelink
+        parent = tracing.SpanContext.from_traceparent(traceparent)
+        with tracing.span("server.chat", parent=parent, client_id=turn.client_id):
+            return await run_turn(link.send_chat, turn.input, turn.client_id)
+
+    @app.websocket("/audio/stream")
+    async def audio_stream(websocket: WebSocket):
+        await websocket.accept()
+        try:
+            pipeline = await app.state.ingest.pipeline()
+        except (EnvironmentError, NotImplementedError) as ex:
+            await websocket.close(code=1011, reason=str(ex))
+            return
+
+        try:
+            client_id = websocket.query_params.get("client_id", DEFAULT_CLIENT)
+            await AudioStreamSession(app, websocket, pipeline, client_id).run()
+        finally:
+            pipeline.close()
+
+    return app
+
+
+class AudioStreamSession:
+    """
+    Streams 16-bit mono PCM from a websocket through the audio pipeline.
+    Received chunks go on a bounded queue, when processing falls behind the
+    receiver waits briefly and then drops the oldest audio so the stream stays live
+
+    Args:
+        app: the server app
+        websocket: the accepted websocket
+        pipeline: the AudioPipeline of the connection
+        client_id: the client streaming, its turns share one conversation
+    """
+
+    def __init__(
+        self,
+        app: FastAPI,
+        websocket: WebSocket,
+        pipeline: AudioPipeline,
+        client_id: str = DEFAULT_CLIENT,
+    ):
+        self.app = app
+        self.websocket = websocket
+        self.pipeline = pipeline
+        self.client_id = client_id
+        self.settings = pipeline.settings
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=self.settings.queue_max_chunks)
+        self._send_lock = asyncio.Lock()
+        self._turns: set[asyncio.Task] = set()
+
+    async def run(self):
+        processor = asyncio.create_task(self._process())
+        try:
+            await self._receive()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            processor.cancel()
+            for turn in self._turns:
+                turn.cancel()
+            await asyncio.gather(processor, *self._turns, return_exceptions=True)
+
+    async def _receive(self):
+        behind = False
+        while True:
+            chunk = await self.websocket.receive_bytes()
+            try:
+                await asyncio.wait_for(
+                    self.queue.put(chunk), timeout=self.settings.backpressure_timeout
+                )
+                behind = False
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            # Processing fell behind, drop the oldest audio
+            self.queue.get_nowait()
+            self.queue.put_nowait(chunk)
+            self.pipeline.stats.dropped_chunks += 1
+            if not behind:
+                behind = True
+                await self._send_json(
+                    {
+                        "event": "backpressure",
+                        "dropped_chunks": self.pipeline.stats.dropped_chunks,
+                    }
+                )
+
+    async def _process(self):
+        while True:
+            chunk = await self.queue.get()
+            # Frame processing is CPU bound, keep it off the event loop
+            events: list[IngestEvent] = await asyncio.to_thread(self.pipeline.feed, chunk)
+            for event in events:
+                await self._send_json({"event": event.event, "text": event.text})
+                if event.event == "transcript":
+                    turn = asyncio.create_task(self._turn(event.text))
+                    self._turns.add(turn)
+                    turn.add_done_callback(self._turns.discard)
 
-# app = FastAPI()
+    async def _turn(self, text: str):
+        link: HomeLink = self.app.state.homelink
+        try:
+            result = await self.app.state.pool.submit(link.execute_link, text, self.client_id)
+        except (PoolFull, PoolClosed) as ex:
+            await self._send_json({"event": "error", "text": str(ex)})
+            return
+        if not result:
+            await self._send_json({"event": "audio_end", "continuous": False})
+            return
 
-# @app.websocket("/audio/stream")
-# async def audio_stream(websocket: WebSocket):
-#     await websocket.accept()
+        continous_convo, audio = result
+        async with self._send_lock:
+            for chunk in stream_audio(audio, link.settings.server.stream_chunk_size):
+                await self.websocket.send_bytes(chunk)
+            await self.websocket.send_json({"event": "audio_end", "continuous": continous_convo})
 
-#     porcupine: pvporcupine.Porcupine = pvporcupine.create(keywords=["hey"])
-#     while True:
-#         chunk = await websocket.receive_bytes()
-#         if porcupine.process(chunk):
-#             await websocket.send_text("Detected")
+    async def _send_json(self, data: dict):
+        async with self._send_lock:
+            await self.websocket.send_json(data)
 
 
+app = create_app()
 
-async def entry():
-    dir = os.path.join(os.getcwd(), "config/")
-    homelink = HomeLink(config_folder=dir)
-    await homelink.execute_link("Add eggs to grocery list")
-    
 
-asyncio.run(entry())
\ No newline at end of file
+if __name__ == "__main__":
+    settings = load_yaml(os.path.join(default_config_folder(), "settings.yml")) or {}
+    server_settings = ServerSettings.model_validate(settings.get("server") or {})
+    uvicorn.run(
+        "server.main:app",
+        host=server_settings.host,
+        port=server_settings.port,
+        timeout_graceful_shutdown=server_settings.drain_timeout,
+    )
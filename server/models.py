@@ -1,6 +1,9 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from langchain_core.chat_history import InMemoryChatMessageHistory
+from typing import Literal
+
+# Client id of turns that do not say where they came from
+DEFAULT_CLIENT = "default"
 
 
 class IntentQuery(BaseModel):
@@ -15,6 +18,34 @@ class Intent(BaseModel):
     query: IntentQuery | None = None
 
 
+# Structured LLM outputs
+
+
+class MemoryCommand(BaseModel):
+    key: str
+    action: Literal["str", "list", "clear"]
+    memory: str | list[str] | None = None
+    # seconds until a short lived memory expires, ie where the car is parked
+    ttl: int | None = None
+
+
+class MemoryExtraction(BaseModel):
+    memories: list[MemoryCommand] = Field(default_factory=list)
+
+
+class IntentChoice(BaseModel):
+    intent: str | None = None
+    query: bool = False
+
+
+class KeyMatch(BaseModel):
+    key: str | None = None
+
+
+class MemoryPick(BaseModel):
+    keys: list[str] = Field(default_factory=list)
+
+
 # Settings
 
 
@@ -23,6 +54,14 @@ class VoiceSettings(BaseModel):
     voice_agent: str
     voice_model: str
     voice_pitch: float
+    # reply formats the voice library can produce, see `shared.audio.AUDIO_FORMATS`
+    audio_formats: list[str] = Field(default_factory=lambda: ["pcm", "opus", "mp3"])
+
+
+class ProviderLimits(BaseModel):
+    max_concurrency: int = 4
+    background_concurrency: int | None = None
+    tokens_per_minute: int | None = None
 
 
 class LLMSettings(BaseModel):
@@ -30,19 +69,106 @@ class LLMSettings(BaseModel):
     reasoning_llm_model: str
     intent_llm: str
     intent_llm_model: str
+    fast_llm: str | None = None
+    fast_llm_model: str | None = None
+    routing_threshold: float = 2.0
+    routing_latency_budget: float = 2.5
+    structured_output: bool = True
+    provider_limits: dict[str, ProviderLimits] = Field(default_factory=dict)
+
+
+class ServerSettings(BaseModel):
+    host: str = "0.0.0.0"
+    port: int = 6455
+    workers: int = 4
+    max_pending: int = 32
+    drain_timeout: float = 30
+    stream_chunk_size: int = 65536
+    # eager, background or lazy, see `HomeLink.warm_up`
+    startup: Literal["eager", "background", "lazy"] = "eager"
+
+
+class IngestSettings(BaseModel):
+    sample_rate: int = 16000
+    frame_length: int = 512
+    ring_seconds: float = 2
+    queue_max_chunks: int = 64
+    backpressure_timeout: float = 0.2
+    vad_threshold_db: float = -45
+    vad_hangover_ms: int = 300
+    max_utterance_seconds: float = 10
+    wake_engine: str = "porcupine"
+    wake_words: list[str] = Field(default_factory=lambda: ["jarvis"])
+    recognition_engine: str = "vosk"
+    vosk_model_path: str = "vosk-model-small-en-us-0.15"
+    tcp_port: int | None = 6456
+    jitter_min_ms: float = 20
+    jitter_max_ms: float = 200
+    max_frame_bytes: int = 65536
+
+
+class AgentSpec(BaseModel):
+    # `package.module` or `package.module:Class`, defaults to `<package>.<name>`
+    module: str | None = None
+    timeout: float | None = None
+    max_concurrency: int | None = None
+    isolation: Literal["thread", "process"] | None = None
+
+
+class AgentSettings(BaseModel):
+    package: str = "config.agents"
+    timeout: float = 10
+    max_concurrency: int = 2
+    # where blocking `execute` methods run, async ones run on the event loop
+    isolation: Literal["thread", "process"] = "thread"
+    thread_workers: int = 8
+    process_workers: int = 2
+    agents: dict[str, AgentSpec] = Field(default_factory=dict)
+
+
+class MemorySettings(BaseModel):
+    # memories beyond this are evicted, least used first
+    max_memories: int = 500
+    # seconds a memory lives without a ttl of its own, None keeps it
+    default_ttl: int | None = None
+    # ttl per key pattern, ie `parking*: 86400`
+    ttls: dict[str, int] = Field(default_factory=dict)
+    # hours for the weight of a use to halve
+    decay_half_life_hours: float = 168
+    # the most keys shown to the LLM when matching a key or picking memories
+    key_candidates: int = 10
+    # seconds between reconciling the key index with Redis, for expired keys
+    # and keys stored by other workers
+    key_index_refresh: float = 30
+
+
+class TracingSettings(BaseModel):
+    enabled: bool = False
+    service: str = "homelink-server"
+    sample_rate: float = 1.0
+    # OTLP JSON lines file, ignored when a collector endpoint is set
+    file: str | None = "traces/server.otlp.jsonl"
+    endpoint: str | None = None
+
+
+class LoggingSettings(BaseModel):
+    # verbose payloads such as the conversation history are only logged at DEBUG
+    level: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
+    format: Literal["text", "json"] = "text"
+    file: str | None = None
+    rate_limit: float | None = 10
+    burst: int = 20
+    sample_rates: dict[str, float] = Field(default_factory=dict)
 
 
 class SettingsModel(BaseModel):
     voice_agent: str
 
 
-class ConversationMemory(InMemoryChatMessageHistory):
-    """Higher order implementation of InMemoryChatMessageHistory
-    to help with conversational awareness
-    """
+def __getattr__(name: str):
+    # ConversationMemory pulls in langchain, only load it when asked for
+    if name == "ConversationMemory":
+        from .history import ConversationMemory
 
-    start_datetime: datetime
-    last_datetime: datetime | None = None
-    end_reason: str | None = None
-    ended_conversation: bool = False
-    conversation_highlights: list[str] = Field(default_factory=list)
+        return ConversationMemory
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,331 @@
+from .agent import AgentBase, AgentConfig
+from .models import AgentSettings, AgentSpec, Intent, DEFAULT_CLIENT
+from .settings import Settings, SettingsSnapshot
+
+from shared.mixins import ResponseMixin
+from shared import tracing
+from shared.log import get_logger
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from importlib import import_module
+from time import perf_counter
+
+import asyncio
+import inspect
+import threading
+
+log = get_logger(__name__)
+
+
+@dataclass
+class AgentStats:
+    calls: int = 0
+    completed: int = 0
+    failed: int = 0
+    timeouts: int = 0
+    in_flight: int = 0
+    total_seconds: float = 0.0
+
+
+def load_agent_class(path: str) -> type[AgentBase]:
+    """
+    Import an agent class
+
+    Args:
+        path: `package.module:Class`, or `package.module` for the only agent defined in it
+    """
+    module_name, _, class_name = path.partition(":")
+    try:
+        module = import_module(module_name)
+    except ImportError as ex:
+        raise AttributeError(f"Could not import agent module `{module_name}`") from ex
+
+    if class_name:
+        cls = getattr(module, class_name, None)
+    else:
+        found = [
+            obj
+            for obj in vars(module).values()
+            if inspect.isclass(obj)
+            and issubclass(obj, AgentBase)
+            and obj.__module__ == module.__name__
+        ]
+        cls = found[0] if len(found) == 1 else None
+
+    if not (inspect.isclass(cls) and issubclass(cls, AgentBase)):
+        raise AttributeError(f"`{path}` does not name a single AgentBase subclass")
+    return cls
+
+
+# Agents isolated in a process are built there once, without the shared config
+_process_agents: dict[str, AgentBase] = {}
+
+
+def _execute_in_process(path: str, input: str, intent: Intent, query: bool, client_id: str):
+    agent = _process_agents.get(path)
+    if agent is None:
+        agent = _process_agents[path] = load_agent_class(path)(config=None)
+    return agent.execute(input, intent, query, client_id)
+
+
+class AgentRegistry:
+    """
+    Resolves `Intent.agent` names to agents and dispatches intents to them.
+    Agent modules are imported on first use and the instances are cached.
+    Each agent runs under its own timeout and concurrency limit, blocking
+    `execute` methods run in a thread or process pool so a slow integration
+    never stalls the event loop
+
+    Args:
+        config: the AgentConfig the agents are built with
+        settings: the Settings, the `agents` section configures the registry
+        intents: the intents whose agents are checked up front
+    """
+
+    def __init__(
+        self, config: AgentConfig, settings: Settings, intents: list[Intent] | None = None
+    ):
+        self.config = config
+        self.agent_settings: AgentSettings = settings.agents
+        self._classes: dict[str, type[AgentBase]] = {}
+        self._agents: dict[str, AgentBase] = {}
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        self._stats: dict[str, AgentStats] = {}
+        self._threads: ThreadPoolExecutor | None = None
+        self._processes: ProcessPoolExecutor | None = None
+        # Agents are built on worker threads
+        self._lock = threading.Lock()
+        # agents that cannot be dispatched to and why
+        self._unavailable: dict[str, str] = {}
+        self._checked: set[str] = set()
+        self._intent_agents = sorted({intent.agent for intent in intents or []})
+
+        settings.subscribe(self.apply_settings)
+        self.validate()
+
+    def validate(self):
+        """
+        Check that the agent of every intent imports and implements `execute`.
+        Agents that do not are reported once, their intents fall back to the
+        conversation
+        """
+        for name in self._intent_agents:
+            self._check(name)
+
+    def _check(self, name: str):
+        try:
+            cls = self.resolve(name)
+        except Exception as ex:
+            # any import time failure, ie a missing dependency or a syntax error
+            reason = str(ex) or type(ex).__name__
+        else:
+            reason = None
+            if inspect.isabstract(cls):
+                reason = f"{cls.__name__} does not implement execute"
+        self._checked.add(name)
+        if reason is None:
+            self._unavailable.pop(name, None)
+            return
+        self._unavailable[name] = reason
+        log.warning(
+            "agent unavailable, its intents go to the conversation", agent=name, reason=reason
+        )
+
+    def available(self, name: str) -> bool:
+        """
+        Whether intents can be dispatched to an agent
+
+        Args:
+            name: the agent name
+        """
+        if name not in self._checked:
+            self._check(name)
+        return name not in self._unavailable
+
+    def spec(self, name: str) -> AgentSpec:
+        """
+        Get the settings of an agent
+
+        Args:
+            name: the agent name
+        """
+        return self.agent_settings.agents.get(name) or AgentSpec()
+
+    def path(self, name: str) -> str:
+        """
+        Get the import path of an agent
+
+        Args:
+            name: the agent name
+        """
+        return self.spec(name).module or f"{self.agent_settings.package}.{name}"
+
+    def resolve(self, name: str) -> type[AgentBase]:
+        """
+        Get the class of an agent, importing its module on first use
+
+        Args:
+            name: the agent name
+        """
+        with self._lock:
+            cls = self._classes.get(name)
+            if cls is None:
+                cls = self._classes[name] = load_agent_class(self.path(name))
+            return cls
+
+    def get(self, name: str) -> AgentBase:
+        """
+        Get the cached instance of an agent
+
+        Args:
+            name: the agent name
+        """
+        cls = self.resolve(name)
+        with self._lock:
+            agent = self._agents.get(name)
+            if agent is None:
+                agent = self._agents[name] = cls(config=self.config)
+            return agent
+
+    def _limit(self, name: str) -> asyncio.Semaphore:
+        limit = self._limits.get(name)
+        if limit is None:
+            spec = self.spec(name)
+            limit = self._limits[name] = asyncio.Semaphore(
+                spec.max_concurrency or self.agent_settings.max_concurrency
+            )
+        return limit
+
+    def _executor(self, isolation: str) -> Executor:
+        if isolation == "process":
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(self.agent_settings.process_workers)
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                self.agent_settings.thread_workers, thread_name_prefix="agent"
+            )
+        return self._threads
+
+    async def _start(
+        self, name: str, input: str, intent: Intent, query: bool, client_id: str, release
+    ) -> asyncio.Future:
+        """
+        Start an agent, `release` is called once it really stopped running
+        """
+        # importing and building an integration may block
+        cls = self._classes.get(name) or await asyncio.to_thread(self.resolve, name)
+        isolation = self.spec(name).isolation or self.agent_settings.isolation
+        is_async = inspect.iscoroutinefunction(cls.execute)
+        if is_async or isolation != "process":
+            agent = self._agents.get(name) or await asyncio.to_thread(self.get, name)
+
+        if is_async:
+            task = asyncio.create_task(agent.execute(input, intent, query, client_id))
+            task.add_done_callback(lambda _: release())
+            return task
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor(isolation)
+        if isolation == "process":
+            future = executor.submit(
+                _execute_in_process, self.path(name), input, intent, query, client_id
+            )
+        else:
+            future = executor.submit(agent.execute, input, intent, query, client_id)
+        # a timed out thread keeps its slot until it returns
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+        return asyncio.wrap_future(future)
+
+    async def dispatch(
+        self,
+        intent: Intent,
+        input: str,
+        query: bool = False,
+        client_id: str = DEFAULT_CLIENT,
+    ) -> ResponseMixin:
+        """
+        Execute an intent on its agent
+
+        Args:
+            intent: the matched intent
+            input: the transcribed input
+            query: whether the input asks for information
+            client_id: the client the input came from
+        """
+        name = intent.agent
+        stats = self._stats.setdefault(name, AgentStats())
+        timeout = self.spec(name).timeout or self.agent_settings.timeout
+        limit = self._limit(name)
+        stats.calls += 1
+        start = perf_counter()
+        try:
+            with tracing.span("agent.dispatch", agent=name):
+                async with asyncio.timeout(timeout):
+                    await limit.acquire()
+                    stats.in_flight += 1
+
+                    def release():
+                        stats.in_flight -= 1
+                        limit.release()
+
+                    try:
+                        running = await self._start(name, input, intent, query, client_id, release)
+                    except BaseException:
+                        release()
+                        raise
+                    result = await running
+        except TimeoutError:
+            stats.timeouts += 1
+            return ResponseMixin(
+                response=f"The {name} agent took too long to respond.",
+                retry=True,
+                meta={"agent": name, "timeout": timeout},
+            )
+        except Exception as ex:
+            stats.failed += 1
+            log.warning("agent failed", agent=name, error=repr(ex))
+            return ResponseMixin(
+                response=f"The {name} agent could not complete the request.",
+                meta={"agent": name, "error": str(ex)},
+            )
+        finally:
+            stats.total_seconds += perf_counter() - start
+
+        stats.completed += 1
+        if isinstance(result, ResponseMixin):
+            return result
+        return ResponseMixin(response="" if result is None else str(result), completed=True)
+
+    def apply_settings(self, snapshot: SettingsSnapshot):
+        """
+        Swap in new agent settings, running agents finish under the old limits
+
+        Args:
+            snapshot: the new SettingsSnapshot
+        """
+        if snapshot.agents == self.agent_settings:
+            return
+        previous = {name: self.path(name) for name in self._classes}
+        self.agent_settings = snapshot.agents
+        self._limits = {}
+        with self._lock:
+            for name, path in previous.items():
+                if self.path(name) != path:
+                    self._classes.pop(name, None)
+                    self._agents.pop(name, None)
+        self._checked.clear()
+        self._unavailable.clear()
+        self.validate()
+
+    def stats(self) -> dict:
+        """Returns the counters of every dispatched agent"""
+        return {name: asdict(stats) for name, stats in self._stats.items()}
+
+    def close(self):
+        """Shut the pools down without waiting for running agents"""
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
@@ -0,0 +1,208 @@
+from shared.utils import get_datetime
+
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+
+import re
+
+FAST = "fast"
+STRONG = "strong"
+
+QUESTION_WORDS = {"how", "why", "what", "which", "when", "where", "who", "should", "could", "would"}
+COMPLEX_MARKERS = ("explain", "compare", "step", "plan", "difference", "and then", "pros and cons")
+SMALL_TALK = {"thanks", "thank you", "ok", "okay", "cool", "nice", "hi", "hello", "hey", "bye", "goodnight", "yes", "no"}
+MEMORY_MARKERS = ("remember", "forget", "my ", "did i", "list")
+
+_WORDS = re.compile(r"[a-z']+")
+
+
+@dataclass
+class TurnFeatures:
+    length: int
+    words: int
+    question_words: int
+    complex_markers: int
+    small_talk: bool
+    has_intent: bool
+    memory_request: bool
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    score: float
+    reason: str
+    features: TurnFeatures
+    created: datetime = field(default_factory=get_datetime)
+
+
+class RouteStats:
+    """
+    Rolling latency and error-rate stats of a route
+
+    Args:
+        window: how many calls to keep
+    """
+
+    def __init__(self, window: int):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.errors: deque[bool] = deque(maxlen=window)
+
+    def observe(self, latency: float, error: bool):
+        self.latencies.append(latency)
+        self.errors.append(error)
+
+    @property
+    def samples(self) -> int:
+        return len(self.errors)
+
+    def p95(self) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    def error_rate(self) -> float:
+        if not self.errors:
+            return 0.0
+        return sum(self.errors) / len(self.errors)
+
+
+class ModelRouter:
+    """
+    Routes conversational turns to a fast or a strong model from cheap features,
+    adapting to the rolling latency and error rate of each route
+
+    Args:
+        threshold: the complexity score at which turns go to the strong model
+        latency_budget: the p95 latency in seconds the strong route should stay under
+        max_error_rate: the error rate at which a route is considered unhealthy
+        window: how many calls the rolling stats keep
+        min_samples: calls needed before the stats influence routing
+    """
+
+    def __init__(
+        self,
+        threshold: float = 2.0,
+        latency_budget: float = 2.5,
+        max_error_rate: float = 0.25,
+        window: int = 50,
+        min_samples: int = 5,
+    ):
+        self.threshold = threshold
+        self.latency_budget = latency_budget
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.route_stats = {FAST: RouteStats(window), STRONG: RouteStats(window)}
+        self.decisions: deque[RouteDecision] = deque(maxlen=100)
+
+    def features(
+        self, input: str, has_intent: bool = False, memory_request: bool = False
+    ) -> TurnFeatures:
+        """
+        Extract the cheap routing features of a turn
+
+        Args:
+            input: the user input
+            has_intent: whether an intent was found for the input
+            memory_request: whether the turn asks for a memory
+        """
+        lowered = input.lower().strip()
+        words = _WORDS.findall(lowered)
+        return TurnFeatures(
+            length=len(lowered),
+            words=len(words),
+            question_words=sum(word in QUESTION_WORDS for word in words),
+            complex_markers=sum(marker in lowered for marker in COMPLEX_MARKERS),
+            small_talk=lowered.strip("!?. ") in SMALL_TALK,
+            has_intent=has_intent,
+            memory_request=memory_request
+            or any(marker in lowered for marker in MEMORY_MARKERS),
+        )
+
+    def score(self, features: TurnFeatures) -> float:
+        """
+        Score the complexity of a turn
+
+        Args:
+            features: the turn features
+        """
+        if features.small_talk:
+            return 0.0
+        score = 0.0
+        if features.words > 12:
+            score += 1
+        if features.words > 25:
+            score += 1
+        score += min(features.question_words, 2) * 0.75
+        score += features.complex_markers * 1.5
+        if features.memory_request:
+            score += 1
+        if features.has_intent:
+            score += 1
+        return score
+
+    def route(
+        self, input: str, has_intent: bool = False, memory_request: bool = False
+    ) -> RouteDecision:
+        """
+        Decide the route for a turn
+
+        Args:
+            input: the user input
+            has_intent: whether an intent was found for the input
+            memory_request: whether the turn asks for a memory
+        """
+        features = self.features(input, has_intent, memory_request)
+        score = self.score(features)
+        route = STRONG if score >= self.threshold else FAST
+        reason = "complexity"
+
+        other = FAST if route == STRONG else STRONG
+        if not self._healthy(route) and self._healthy(other):
+            route, reason = other, "failover"
+        elif route == STRONG and score < self.threshold + 1 and self._slow(STRONG):
+            # Borderline turns move off a strong model that is over budget
+            route, reason = FAST, "latency"
+
+        decision = RouteDecision(route=route, score=score, reason=reason, features=features)
+        self.decisions.append(decision)
+        return decision
+
+    def observe(self, route: str, latency: float, error: bool = False):
+        """
+        Record the outcome of a call on a route
+
+        Args:
+            route: the route [fast, strong]
+            latency: the call latency in seconds
+            error: whether the call failed
+        """
+        self.route_stats[route].observe(latency, error)
+
+    def _healthy(self, route: str) -> bool:
+        stats = self.route_stats[route]
+        if stats.samples < self.min_samples:
+            return True
+        return stats.error_rate() < self.max_error_rate
+
+    def _slow(self, route: str) -> bool:
+        stats = self.route_stats[route]
+        if stats.samples < self.min_samples:
+            return False
+        return stats.p95() > self.latency_budget
+
+    def stats(self) -> dict:
+        """Returns the route stats and the recent routing decisions"""
+        return {
+            "routes": {
+                route: {
+                    "samples": stats.samples,
+                    "p95": stats.p95(),
+                    "error_rate": stats.error_rate(),
+                }
+                for route, stats in self.route_stats.items()
+            },
+            "decisions": [asdict(decision) for decision in self.decisions],
+        }
@@ -0,0 +1,268 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import IntEnum
+from time import monotonic
+from typing import Awaitable, Callable
+
+import asyncio
+import heapq
+import itertools
+
+
+class Priority(IntEnum):
+    """Priority classes of outbound LLM calls, lower runs first"""
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: Priority):
+    """
+    Run the LLM calls made within the block at a priority
+
+    Args:
+        priority: the Priority class
+
+    Examples:
+        ```py
+        with llm_priority(Priority.BACKGROUND):
+            await chain.ainvoke({})
+        ```
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    """Returns the priority of the current context"""
+    return _priority.get()
+
+
+@dataclass
+class ProviderBudget:
+    """
+    Limits of a provider
+
+    Args:
+        max_concurrency: the maximum calls in flight
+        background_concurrency: the maximum background calls in flight,
+            defaults to leaving one slot free for interactive calls
+        tokens_per_minute: the token rate budget, unlimited if None
+    """
+
+    max_concurrency: int = 4
+    background_concurrency: int | None = None
+    tokens_per_minute: int | None = None
+
+    @property
+    def background_limit(self) -> int:
+        if self.background_concurrency is not None:
+            return min(self.background_concurrency, self.max_concurrency)
+        return max(1, self.max_concurrency - 1)
+
+
+class TokenBucket:
+    """
+    Token rate limiter refilling continuously up to a minute of budget
+
+    Args:
+        tokens_per_minute: the refill rate
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60
+        self.tokens = self.capacity
+        self.updated = monotonic()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: int) -> float:
+        """
+        Seconds until the tokens are available
+
+        Args:
+            tokens: the tokens needed
+        """
+        self._refill()
+        # A single oversized call may use the whole bucket
+        needed = min(tokens, self.capacity) - self.tokens
+        return max(needed, 0) / self.rate
+
+    def take(self, tokens: int):
+        self._refill()
+        self.tokens -= min(tokens, self.capacity)
+
+
+@dataclass
+class _Waiter:
+    priority: Priority
+    tokens: int
+    future: asyncio.Future
+    enqueued: float
+
+
+class _ProviderQueue:
+    def __init__(self, budget: ProviderBudget):
+        self.budget = budget
+        self.bucket = TokenBucket(budget.tokens_per_minute) if budget.tokens_per_minute else None
+        self.heap: list[tuple[int, int, _Waiter]] = []
+        self.in_flight = {Priority.INTERACTIVE: 0, Priority.BACKGROUND: 0}
+        self.completed = {Priority.INTERACTIVE: 0, Priority.BACKGROUND: 0}
+        self.max_wait = {Priority.INTERACTIVE: 0.0, Priority.BACKGROUND: 0.0}
+        self.timer: asyncio.TimerHandle | None = None
+
+    def depth(self, priority: Priority) -> int:
+        return sum(
+            1
+            for _, _, waiter in self.heap
+            if waiter.priority == priority and not waiter.future.done()
+        )
+
+
+class LLMScheduler:
+    """
+    Schedules outbound LLM calls per provider with concurrency and token-rate
+    budgets. Interactive calls are always dispatched before background calls
+
+    Args:
+        budgets: the ProviderBudget per provider name
+    """
+
+    def __init__(self, budgets: dict[str, ProviderBudget] | None = None):
+        self.budgets = budgets or {}
+        self._queues: dict[str, _ProviderQueue] = {}
+        self._sequence = itertools.count()
+
+    def _queue(self, provider: str) -> _ProviderQueue:
+        if provider not in self._queues:
+            budget = self.budgets.get(provider, ProviderBudget())
+            self._queues[provider] = _ProviderQueue(budget)
+        return self._queues[provider]
+
+    def update_budgets(self, budgets: dict[str, ProviderBudget]):
+        """
+        Swap the provider budgets, keeping the queued and in-flight calls
+
+        Args:
+            budgets: the ProviderBudget per provider name
+        """
+        self.budgets = budgets
+        for provider, queue in self._queues.items():
+            budget = budgets.get(provider, ProviderBudget())
+            if budget == queue.budget:
+                continue
+            if budget.tokens_per_minute != queue.budget.tokens_per_minute:
+                queue.bucket = (
+                    TokenBucket(budget.tokens_per_minute) if budget.tokens_per_minute else None
+                )
+                if queue.timer is not None:
+                    queue.timer.cancel()
+                    queue.timer = None
+            queue.budget = budget
+            # A raised limit may grant waiting calls right away
+            self._dispatch(queue)
+
+    async def run(
+        self,
+        provider: str,
+        factory: Callable[[], Awaitable],
+        priority: Priority | None = None,
+        tokens: int = 0,
+    ):
+        """
+        Run a call once the provider has capacity for it
+
+        Args:
+            provider: the provider name
+            factory: creates the awaitable of the call
+            priority: the Priority class, defaults to the context priority
+            tokens: the estimated tokens used by the call
+        """
+        priority = current_priority() if priority is None else priority
+        queue = self._queue(provider)
+        await self._acquire(queue, priority, tokens)
+        try:
+            return await factory()
+        finally:
+            queue.in_flight[priority] -= 1
+            queue.completed[priority] += 1
+            self._dispatch(queue)
+
+    async def _acquire(self, queue: _ProviderQueue, priority: Priority, tokens: int):
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, tokens, loop.create_future(), monotonic())
+        heapq.heappush(queue.heap, (priority, next(self._sequence), waiter))
+        self._dispatch(queue)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted while being cancelled, hand the slot back
+                queue.in_flight[priority] -= 1
+                self._dispatch(queue)
+            else:
+                waiter.future.cancel()
+            raise
+
+    def _has_slot(self, queue: _ProviderQueue, priority: Priority) -> bool:
+        total = sum(queue.in_flight.values())
+        if total >= queue.budget.max_concurrency:
+            return False
+        if priority == Priority.BACKGROUND:
+            return queue.in_flight[Priority.BACKGROUND] < queue.budget.background_limit
+        return True
+
+    def _dispatch(self, queue: _ProviderQueue):
+        """Grant queued calls in priority order while the budgets allow"""
+        while queue.heap:
+            _, _, waiter = queue.heap[0]
+            if waiter.future.done():
+                heapq.heappop(queue.heap)
+                continue
+            if not self._has_slot(queue, waiter.priority):
+                return
+            if queue.bucket:
+                wait = queue.bucket.wait_time(waiter.tokens)
+                if wait > 0:
+                    # Lower priorities keep waiting behind the head of the queue
+                    if queue.timer is None:
+                        loop = asyncio.get_running_loop()
+                        queue.timer = loop.call_later(wait, self._wake, queue)
+                    return
+                queue.bucket.take(waiter.tokens)
+            heapq.heappop(queue.heap)
+            queue.in_flight[waiter.priority] += 1
+            elapsed = monotonic() - waiter.enqueued
+            queue.max_wait[waiter.priority] = max(queue.max_wait[waiter.priority], elapsed)
+            waiter.future.set_result(None)
+
+    def _wake(self, queue: _ProviderQueue):
+        queue.timer = None
+        self._dispatch(queue)
+
+    def stats(self) -> dict:
+        """Returns the queue depth and in-flight metrics per provider and priority"""
+        return {
+            provider: {
+                priority.name.lower(): {
+                    "queue_depth": queue.depth(priority),
+                    "in_flight": queue.in_flight[priority],
+                    "completed": queue.completed[priority],
+                    "max_wait": queue.max_wait[priority],
+                }
+                for priority in Priority
+            }
+            for provider, queue in self._queues.items()
+        }
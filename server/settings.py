@@ -1,9 +1,31 @@
-from .models import VoiceSettings, LLMSettings, SettingsModel
+from .models import (
+    VoiceSettings,
+    LLMSettings,
+    ServerSettings,
+    IngestSettings,
+    AgentSettings,
+    MemorySettings,
+    TracingSettings,
+    LoggingSettings,
+    SettingsModel,
+)
 from shared.utils import load_yaml
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from shared.mixins import ResponseMixin
+from shared.log import get_logger
+from types import MappingProxyType
+from typing import Any, Callable, Mapping
+import asyncio
+import copy
+import json
 import os
-from redis import Redis
+from redis import Redis, RedisError
+
+log = get_logger(__name__)
+
+SETTINGS_KEY = "homelink_settings"
+SETTINGS_VERSION_KEY = "homelink_settings_version"
+SETTINGS_CHANNEL = "homelink_settings"
 
 
 @dataclass
@@ -11,7 +33,140 @@ class SettingsResponse(ResponseMixin):
     response: any  # Redefine response
 
 
+def freeze(value: Any) -> Any:
+    """
+    Make a read only view of nested settings
+
+    Args:
+        value: the settings value
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def compile_option(key: str, opts: Any) -> Callable[[Any], None] | None:
+    """
+    Compile the validator of a `SETTINGS_OPT.yml` entry
+
+    Args:
+        key: the option key
+        opts: the allowed options, a list or a type marker like `float!`
+    """
+    if type(opts) is list:
+        allowed = frozenset(opts)
+
+        def one_of(val):
+            if val not in allowed:
+                raise AttributeError(f"Option: `{val}` is not a valid option")
+
+        return one_of
+    if opts == "number!":
+
+        def number(val):
+            if not isinstance(val, int):
+                raise AttributeError(f"Option `{key}` must be number")
+
+        return number
+    if opts == "float!":
+
+        def floating(val):
+            if not isinstance(val, (float, int)):
+                raise AttributeError(f"Option `{key}` must be float")
+
+        return floating
+    if type(opts) is str:
+
+        def within(val):
+            if not opts.find(str(val)) >= 0:
+                raise AttributeError(f"Option: `{val}` is not a valid option")
+
+        return within
+    return None
+
+
+def thaw(value: Any) -> Any:
+    """
+    Make a mutable copy of frozen settings
+
+    Args:
+        value: the frozen settings value
+    """
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """
+    Immutable settings at a version, components swap a whole snapshot at once
+
+    Args:
+        version: the settings version in Redis
+        data: the read only settings
+    """
+
+    version: int
+    data: Mapping[str, Mapping]
+    llm: LLMSettings
+    voice: VoiceSettings
+    server: ServerSettings
+    ingest: IngestSettings
+    agents: AgentSettings
+    memory: MemorySettings
+    tracing: TracingSettings
+    logging: LoggingSettings
+    responses: Mapping[str, SettingsResponse] = field(repr=False)
+
+    @classmethod
+    def build(cls, version: int, settings: dict[str, dict]) -> "SettingsSnapshot":
+        """
+        Validate the models once and freeze the settings
+
+        Args:
+            version: the settings version
+            settings: the settings dictionary
+        """
+        data = freeze(settings)
+        return cls(
+            version=version,
+            data=data,
+            llm=LLMSettings.model_validate(settings.get("llm")),
+            voice=VoiceSettings.model_validate(settings.get("voice")),
+            server=ServerSettings.model_validate(settings.get("server") or {}),
+            ingest=IngestSettings.model_validate(settings.get("ingest") or {}),
+            agents=AgentSettings.model_validate(settings.get("agents") or {}),
+            memory=MemorySettings.model_validate(settings.get("memory") or {}),
+            tracing=TracingSettings.model_validate(settings.get("tracing") or {}),
+            logging=LoggingSettings.model_validate(settings.get("logging") or {}),
+            responses=MappingProxyType(
+                {
+                    key: SettingsResponse(response=value, completed=True)
+                    for key, value in data.items()
+                    if value
+                }
+            ),
+        )
+
+
 class Settings:
+    """
+    Versioned runtime settings. The settings file is the base, changes are kept
+    in Redis and broadcast over pub/sub so every worker swaps in the new
+    snapshot
+
+    Args:
+        settings_opt: the SETTINGS_OPT.yml file
+        settings: the settings.yml file
+        client: the client.yml file
+        redis: the Redis object
+    """
+
     def __init__(self, settings_opt: str, settings: str, client: str, redis: Redis):
         self.redis = redis
         try:
@@ -20,25 +175,143 @@ class Settings:
             raise AttributeError("Error trying to load settings options.") from ex
 
         try:
-            self.settings: dict[str, dict] = load_yaml(settings)
+            self.base_settings: dict[str, dict] = load_yaml(settings)
         except Exception as ex:
             raise AttributeError("Error trying to load runtime settings file") from ex
-        
+
         # try:
         #     self.client: dict[str, str] = load_yaml(client)
         # except Exception as ex:
         #     raise AttributeError("Error trying to load client settings.") from ex
 
-        self.ensure_options(self.settings)
+        # Option validators are compiled once, a change only runs its own
+        self.validators: dict[str, Callable[[Any], None]] = {}
+        for opt_key, opts in (self.settings_opt or {}).items():
+            if opt_key.endswith("_options"):
+                validator = compile_option(opt_key[: -len("_options")], opts)
+                if validator:
+                    self.validators[opt_key[: -len("_options")]] = validator
 
-        self.refresh_settings()
+        self.ensure_options(self.base_settings)
+
+        self._subscribers: list[Callable[[SettingsSnapshot], None]] = []
+        self._listener = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.snapshot: SettingsSnapshot = self.load()
+
+    @property
+    def settings(self) -> Mapping[str, Mapping]:
+        return self.snapshot.data
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def llm(self) -> LLMSettings:
+        return self.snapshot.llm
 
-    def refresh_settings(self):
+    @property
+    def voice(self) -> VoiceSettings:
+        return self.snapshot.voice
+
+    @property
+    def server(self) -> ServerSettings:
+        return self.snapshot.server
+
+    @property
+    def ingest(self) -> IngestSettings:
+        return self.snapshot.ingest
+
+    @property
+    def agents(self) -> AgentSettings:
+        return self.snapshot.agents
+
+    @property
+    def memory(self) -> MemorySettings:
+        return self.snapshot.memory
+
+    @property
+    def tracing(self) -> TracingSettings:
+        return self.snapshot.tracing
+
+    @property
+    def logging(self) -> LoggingSettings:
+        return self.snapshot.logging
+
+    def load(self) -> SettingsSnapshot:
+        """
+        Build a snapshot from the settings file and the changes stored in Redis
+        """
+        settings = copy.deepcopy(self.base_settings)
+        pipe = self.redis.pipeline()
+        pipe.get(SETTINGS_VERSION_KEY)
+        pipe.hgetall(SETTINGS_KEY)
+        try:
+            version, changes = pipe.execute()
+        except RedisError as ex:
+            # Serve the settings file, `HomeLink.warm_up` reports the connection
+            log.warning("could not load settings from redis", error=str(ex))
+            version, changes = 0, {}
+
+        for field_name, raw in (changes or {}).items():
+            key, _, sub_key = field_name.partition(":")
+            if key not in settings or not sub_key:
+                continue
+            try:
+                value = json.loads(raw)
+                self.ensure_option(sub_key, value)
+            except (ValueError, AttributeError) as ex:
+                log.warning("ignoring stored setting", field=field_name, error=str(ex))
+                continue
+            settings[key][sub_key] = value
+        return SettingsSnapshot.build(int(version or 0), settings)
+
+    def refresh_settings(self, snapshot: SettingsSnapshot | None = None):
         """
-        Refresh the models
+        Reload the settings from Redis and notify the subscribers when they changed
+
+        Args:
+            snapshot: an already loaded SettingsSnapshot, so the Redis round-trip
+                can run off the event loop
+        """
+        snapshot = snapshot or self.load()
+        if snapshot.version != self.snapshot.version or snapshot.data != self.snapshot.data:
+            self._swap(snapshot)
+
+    def _swap_newer(self, snapshot: SettingsSnapshot):
+        # Loads from the pub/sub thread may finish after a newer local one
+        if snapshot.version > self.snapshot.version:
+            self._swap(snapshot)
+
+    def _swap(self, snapshot: SettingsSnapshot):
+        self.snapshot = snapshot
+        for callback in self._subscribers:
+            try:
+                callback(snapshot)
+            except Exception as ex:
+                log.exception("settings subscriber failed")
+
+    def subscribe(self, callback: Callable[[SettingsSnapshot], None]):
         """
-        self.llm = LLMSettings.model_validate(self.settings.get("llm"))
-        self.voice = VoiceSettings.model_validate(self.settings.get("voice"))
+        Call back with every new settings snapshot
+
+        Args:
+            callback: receives the new SettingsSnapshot
+        """
+        self._subscribers.append(callback)
+
+    def ensure_option(self, key: str, val: Any):
+        """
+        Ensure a single option is within boundaries
+
+        Args:
+            key: the option key
+            val: the value
+        """
+        validator = self.validators.get(key)
+        if validator:
+            validator(val)
 
     def ensure_options(self, settings: dict[str, dict]):
         """
@@ -46,36 +319,21 @@ class Settings:
         """
         for _, row in settings.items():
             for key, val in row.items():
-                opts_for_key = self.settings_opt.get(f"{key}_options")
-
-                if not opts_for_key:
-                    continue
-
-                if type(opts_for_key) is list:
-                    if val not in opts_for_key:
-                        raise AttributeError(f"Option: `{val}` is not a valid option")
-                elif type(opts_for_key) is str:
-                    if opts_for_key == "number!" and isinstance(val) is not int:
-                        raise AttributeError(f"Option `{key}` must be number")
-                    elif opts_for_key == "float!":
-                        if not isinstance(val, (float, int)):
-                            raise AttributeError(f"Option `{key}` must be float")
-                    elif not opts_for_key.find(str(val)) >= 0:
-                        raise AttributeError(f"Option: `{val}` is not a valid option")
+                self.ensure_option(key, val)
 
     def get(self, key: str):
         """
         Get settings by key
         """
-        data = self.settings.get(key)
-        if not data:
+        response = self.snapshot.responses.get(key)
+        if not response:
             metadata = self.settings.keys()
             return SettingsResponse(
                 response="Could not find setting.",
                 retry=True,
                 meta={"list_of_keys", metadata},
             )
-        return SettingsResponse(response=self.settings.get(key), completed=True)
+        return response
 
     def set(self, key: str, sub_key: str, value: str):
         """
@@ -90,29 +348,63 @@ class Settings:
         row = self.settings.get(key)
         if not row:
             return SettingsResponse(
-                respone="Setting does not exist",
+                response="Setting does not exist",
                 retry=True,
                 meta={"list_of_keys": self.settings.keys()},
             )
 
-        field = row.get(sub_key)
-        if not field:
+        if sub_key not in row:
             return SettingsResponse(
                 response=f"This field does not exist within `{key}`",
                 retry=True,
                 meta={"list_of_fields": row.keys()},
             )
 
-        settings_copy = self.settings.copy()
-        settings_copy.get(key)[sub_key] = value
-        self.redis.hset("homelink_settings", f"{key}_{sub_key}", value)
-
         try:
-            self.ensure_options(settings_copy)
+            self.ensure_option(sub_key, value)
+            settings = thaw(self.settings)
+            settings[key][sub_key] = value
+            # Validate the models before anything is stored
+            SettingsSnapshot.build(self.version, settings)
         except Exception as ex:
             return SettingsResponse(
                 response="Incorrect value type", retry=True, meta=ex
             )
 
-        self.settings = settings_copy
+        pipe = self.redis.pipeline()
+        pipe.hset(SETTINGS_KEY, f"{key}:{sub_key}", json.dumps(value))
+        pipe.incr(SETTINGS_VERSION_KEY)
+        _, version = pipe.execute()
+        self.redis.publish(SETTINGS_CHANNEL, json.dumps({"version": version}))
+
+        # The local settings may miss changes of the other workers, take the stored ones
+        self.refresh_settings()
         return SettingsResponse(response="Updated settings", completed=True)
+
+    def start_listener(self):
+        """
+        Listen for settings changes from the other workers, call from the event loop
+        """
+        if self._listener is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{SETTINGS_CHANNEL: self._on_message})
+        self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _on_message(self, message: dict):
+        # Runs on the pub/sub thread
+        try:
+            version = json.loads(message["data"])["version"]
+        except (ValueError, KeyError, TypeError):
+            return
+        if version > self.snapshot.version:
+            # Load here, the subscribers are called on the event loop
+            snapshot = self.load()
+            self._loop.call_soon_threadsafe(self._swap_newer, snapshot)
+
+    def stop_listener(self):
+        """Stop listening for settings changes"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
@@ -0,0 +1,161 @@
+from pydantic import BaseModel
+
+from dataclasses import dataclass, field
+from types import NoneType, UnionType
+from typing import Any, Callable, Literal, Union, get_args, get_origin, get_type_hints
+
+import inspect
+import json
+
+_SIMPLE_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    dict: "object",
+}
+
+
+@dataclass(frozen=True)
+class ToolSchema:
+    """
+    A method compiled to a tool the LLM can call
+
+    Args:
+        name: the method name
+        description: the docstring summary
+        parameters: the JSON schema of the arguments
+    """
+
+    name: str
+    description: str
+    parameters: dict[str, Any]
+    # the OpenAI function format, accepted by `bind_tools`
+    spec: dict[str, Any] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        spec = {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters,
+            },
+        }
+        object.__setattr__(self, "spec", spec)
+
+
+def parse_docstring(doc: str | None) -> tuple[str, dict[str, str]]:
+    """
+    Split a Google style docstring into its summary and argument descriptions
+
+    Args:
+        doc: the docstring
+    """
+    summary: list[str] = []
+    args: dict[str, str] = {}
+    section = None
+    current = None
+    for line in inspect.cleandoc(doc or "").splitlines():
+        stripped = line.strip()
+        if stripped.endswith(":") and stripped[:-1] in ("Args", "Returns", "Raises"):
+            section = stripped[:-1]
+            continue
+        if section is None:
+            if stripped:
+                summary.append(stripped)
+        elif section == "Args" and stripped:
+            name, sep, desc = stripped.partition(":")
+            if sep and line.startswith(" " * 4) and not line.startswith(" " * 8):
+                current = name.split(" ")[0]
+                args[current] = desc.strip()
+            elif current:
+                args[current] = f"{args[current]} {stripped}"
+    return " ".join(summary), args
+
+
+def json_schema(annotation: Any) -> dict:
+    """
+    Convert a type annotation to JSON schema
+
+    Args:
+        annotation: the annotation, `inspect.Parameter.empty` for any
+    """
+    if annotation is inspect.Parameter.empty or annotation is Any:
+        return {}
+    if annotation in _SIMPLE_TYPES:
+        return {"type": _SIMPLE_TYPES[annotation]}
+    if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+        return annotation.model_json_schema()
+
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin in (Union, UnionType):
+        options = [json_schema(arg) for arg in args if arg is not NoneType]
+        return options[0] if len(options) == 1 else {"anyOf": options}
+    if origin is Literal:
+        return {"enum": list(args)}
+    if annotation in (list, tuple, set) or origin in (list, tuple, set):
+        return {"type": "array", "items": json_schema(args[0]) if args else {}}
+    if origin is dict:
+        return {"type": "object"}
+    return {}
+
+
+def compile_tool(func: Callable) -> ToolSchema:
+    """
+    Compile a method to a ToolSchema from its signature and docstring
+
+    Args:
+        func: the function, as defined on the class
+    """
+    description, arg_docs = parse_docstring(func.__doc__)
+    try:
+        hints = get_type_hints(func)
+    except Exception:
+        hints = {}
+
+    properties: dict[str, dict] = {}
+    required: list[str] = []
+    for index, param in enumerate(inspect.signature(func).parameters.values()):
+        if index == 0 and param.name in ("self", "cls"):
+            continue
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        schema = json_schema(hints.get(param.name, param.annotation))
+        if param.name in arg_docs:
+            schema["description"] = arg_docs[param.name]
+        if param.default is param.empty:
+            required.append(param.name)
+        else:
+            try:
+                json.dumps(param.default)
+                schema["default"] = param.default
+            except TypeError:
+                pass
+        properties[param.name] = schema
+
+    return ToolSchema(
+        name=func.__name__,
+        description=description,
+        parameters={"type": "object", "properties": properties, "required": required},
+    )
+
+
+def compile_tools(cls: type, exclude: set[str] = frozenset()) -> tuple[ToolSchema, ...]:
+    """
+    Compile the public methods of a class, inherited ones included
+
+    Args:
+        cls: the class
+        exclude: method names that are not tools
+    """
+    tools = []
+    for name in sorted(dir(cls)):
+        if name.startswith("_") or name in exclude:
+            continue
+        attr = inspect.getattr_static(cls, name)
+        if isinstance(attr, (staticmethod, classmethod)):
+            attr = attr.__func__
+        if inspect.isfunction(attr):
+            tools.append(compile_tool(attr))
+    return tuple(tools)
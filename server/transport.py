@@ -0,0 +1,307 @@
+from .ingest import AudioPipeline, IngestEngines
+from .workers import TurnPool, PoolFull, PoolClosed
+from shared.audio import (
+    FRAME_HEADER,
+    FLAG_AUDIO,
+    FLAG_COMPRESSED,
+    FLAG_EVENT,
+    JitterBuffer,
+    pack_header,
+)
+
+from time import monotonic
+from typing import Callable
+
+import asyncio
+import json
+import socket
+import zlib
+
+
+class ConnectionClosed(Exception):
+    """Raised when the peer closes the stream"""
+
+
+class PCMConnection:
+    """
+    A length-prefixed PCM stream from a remote client. Frames are read with
+    `sock_recv_into` into preallocated buffers, pass through an adaptive jitter
+    buffer and are fed to the audio pipeline at the cadence of the frames on
+    the wire, which need not match the pipeline frame
+
+    Args:
+        sock: the connected non-blocking socket
+        pipeline: the AudioPipeline of the connection
+        pool: the TurnPool to run the recognized turns on
+        execute: the turn function, `HomeLink.execute_link`
+        client_id: the client streaming, its turns share one conversation
+        max_frame_bytes: the largest accepted payload
+        chunk_size: the size of the audio chunks sent back
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        pipeline: AudioPipeline,
+        pool: TurnPool,
+        execute: Callable,
+        client_id: str,
+        max_frame_bytes: int = 65536,
+        chunk_size: int = 65536,
+    ):
+        self.sock = sock
+        self.client_id = client_id
+        self.pipeline = pipeline
+        self.pool = pool
+        self.execute = execute
+        self.chunk_size = chunk_size
+        settings = pipeline.settings
+        self.sample_rate = settings.sample_rate
+        # Timed from the pipeline frame until the first frame arrives
+        self.frame_ms = pipeline.frame_bytes / 2 * 1000 / settings.sample_rate
+        self.jitter = JitterBuffer(
+            frame_ms=self.frame_ms,
+            min_delay_ms=settings.jitter_min_ms,
+            max_delay_ms=settings.jitter_max_ms,
+        )
+        self._header = bytearray(FRAME_HEADER.size)
+        self._header_view = memoryview(self._header)
+        self._payload = bytearray(max_frame_bytes)
+        self._payload_view = memoryview(self._payload)
+        self._silence = bytes(pipeline.frame_bytes)
+        self._send_header = bytearray(FRAME_HEADER.size)
+        self._send_lock = asyncio.Lock()
+        self._send_seq = 0
+        self._turns: set[asyncio.Task] = set()
+
+    async def _recv_exact(self, view: memoryview):
+        loop = asyncio.get_running_loop()
+        received = 0
+        while received < len(view):
+            size = await loop.sock_recv_into(self.sock, view[received:])
+            if size == 0:
+                raise ConnectionClosed()
+            received += size
+
+    async def run(self):
+        playout = asyncio.create_task(self._playout())
+        try:
+            await self._receive()
+        except (ConnectionClosed, ConnectionError):
+            pass
+        finally:
+            playout.cancel()
+            for turn in self._turns:
+                turn.cancel()
+            await asyncio.gather(playout, *self._turns, return_exceptions=True)
+            self.sock.close()
+
+    async def _receive(self):
+        while True:
+            await self._recv_exact(self._header_view)
+            seq, timestamp_ms, flags, length = FRAME_HEADER.unpack(self._header)
+            if length > len(self._payload):
+                raise ConnectionClosed(f"Frame of {length} bytes is too large")
+            payload = self._payload_view[:length]
+            await self._recv_exact(payload)
+            if flags & FLAG_COMPRESSED:
+                data = self._decompress(payload)
+            else:
+                data = bytes(payload)
+            if len(data) != len(self._silence):
+                self._retime(len(data))
+            self.jitter.push(seq, timestamp_ms, data, monotonic() * 1000)
+
+    def _retime(self, size: int):
+        """
+        Time the jitter buffer and the playout from the frames the client sends
+
+        Args:
+            size: the PCM bytes of the received frame
+        """
+        if not size:
+            return
+        self.frame_ms = size / 2 * 1000 / self.sample_rate
+        self.jitter.frame_ms = self.frame_ms
+        self._silence = bytes(size)
+
+    def _decompress(self, payload) -> bytes:
+        """
+        Inflate a compressed payload, a frame may not expand beyond the
+        largest accepted payload
+
+        Args:
+            payload: the compressed frame payload
+        """
+        decompressor = zlib.decompressobj()
+        try:
+            data = decompressor.decompress(payload, len(self._payload))
+        except zlib.error as ex:
+            raise ConnectionClosed(f"Malformed compressed frame: {ex}") from ex
+        if decompressor.unconsumed_tail:
+            raise ConnectionClosed("Compressed frame expands beyond the frame limit")
+        if not decompressor.eof:
+            raise ConnectionClosed("Compressed frame is truncated")
+        return data
+
+    async def _playout(self):
+        while True:
+            await asyncio.sleep(self.frame_ms / 1000)
+            ready = self.jitter.pop_ready(monotonic() * 1000)
+            if not ready:
+                continue
+            chunks = [frame if frame is not None else self._silence for frame in ready]
+            events = await asyncio.to_thread(self._feed, chunks)
+            for event in events:
+                await self.send_event({"event": event.event, "text": event.text})
+                if event.event == "transcript":
+                    turn = asyncio.create_task(self._turn(event.text))
+                    self._turns.add(turn)
+                    turn.add_done_callback(self._turns.discard)
+
+    def _feed(self, chunks: list[bytes]):
+        events = []
+        for chunk in chunks:
+            events.extend(self.pipeline.feed(chunk))
+        return events
+
+    async def _turn(self, text: str):
+        try:
+            result = await self.pool.submit(self.execute, text, self.client_id)
+        except (PoolFull, PoolClosed) as ex:
+            await self.send_event({"event": "error", "text": str(ex)})
+            return
+        if not result:
+            await self.send_event({"event": "audio_end", "continuous": False})
+            return
+        continous_convo, audio = result
+        buffer = audio.getbuffer()
+        for start in range(0, len(buffer), self.chunk_size):
+            await self._send(FLAG_AUDIO, buffer[start : start + self.chunk_size])
+        await self.send_event({"event": "audio_end", "continuous": continous_convo})
+
+    async def send_event(self, event: dict):
+        """
+        Send an event frame to the client
+
+        Args:
+            event: the JSON serializable event
+        """
+        await self._send(FLAG_EVENT, json.dumps(event).encode())
+
+    async def _send(self, flags: int, payload):
+        loop = asyncio.get_running_loop()
+        async with self._send_lock:
+            pack_header(
+                self._send_header,
+                self._send_seq,
+                int(monotonic() * 1000),
+                flags,
+                len(payload),
+            )
+            self._send_seq += 1
+            await loop.sock_sendall(self.sock, self._send_header)
+            await loop.sock_sendall(self.sock, payload)
+
+    def stats(self) -> dict:
+        """Returns the transport counters"""
+        return {
+            "late_frames": self.jitter.late,
+            "lost_frames": self.jitter.lost,
+            "overflow_frames": self.jitter.overflow,
+            "jitter_ms": self.jitter.jitter,
+            "playout_delay_ms": self.jitter.target_delay,
+        }
+
+
+class PCMStreamServer:
+    """
+    TCP server for length-prefixed PCM streams from `remote_test_client`
+
+    Args:
+        engines: the IngestEngines building each connection pipeline
+        pool: the TurnPool to run the recognized turns on
+        execute: the turn function, `HomeLink.execute_link`
+        chunk_size: the size of the audio chunks sent back
+    """
+
+    def __init__(
+        self,
+        engines: IngestEngines,
+        pool: TurnPool,
+        execute: Callable,
+        chunk_size: int = 65536,
+    ):
+        self.engines = engines
+        self.pool = pool
+        self.execute = execute
+        self.chunk_size = chunk_size
+        self.connections: set[PCMConnection] = set()
+        self._listener: socket.socket | None = None
+        self._accept_task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self, host: str, port: int):
+        """
+        Start accepting connections
+
+        Args:
+            host: the host to bind
+            port: the port to bind
+        """
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        listener.listen()
+        listener.setblocking(False)
+        self._listener = listener
+        self._accept_task = asyncio.create_task(self._accept())
+
+    @property
+    def port(self) -> int | None:
+        return self._listener.getsockname()[1] if self._listener else None
+
+    async def _accept(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            sock, address = await loop.sock_accept(self._listener)
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # Each streaming device is its own client, keyed by its address
+            task = asyncio.create_task(self._serve(sock, address[0]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _serve(self, sock: socket.socket, client_id: str):
+        try:
+            pipeline = await self.engines.pipeline()
+        except (EnvironmentError, NotImplementedError):
+            sock.close()
+            return
+        connection = PCMConnection(
+            sock,
+            pipeline,
+            self.pool,
+            self.execute,
+            client_id,
+            max_frame_bytes=pipeline.settings.max_frame_bytes,
+            chunk_size=self.chunk_size,
+        )
+        self.connections.add(connection)
+        try:
+            await connection.run()
+        finally:
+            self.connections.discard(connection)
+            pipeline.close()
+
+    async def stop(self):
+        """Stop accepting and close every connection"""
+        if self._accept_task:
+            self._accept_task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(
+            *[t for t in (self._accept_task, *self._tasks) if t], return_exceptions=True
+        )
+        if self._listener:
+            self._listener.close()
@@ -1,10 +1,11 @@
 from openai import AsyncClient
 from openai.resources.audio import AsyncSpeech
-from .settings import Settings
+from .settings import Settings, SettingsSnapshot
 
 from tempfile import TemporaryFile
 
 from .models import VoiceSettings
+from shared import tracing
 
 import io
 
@@ -21,6 +22,19 @@ class Voice:
         self.voice_settings = settings.voice
 
         self.speech_system = self.construct_speech_system()
+        settings.subscribe(self.apply_settings)
+
+    def apply_settings(self, snapshot: SettingsSnapshot):
+        """
+        Swap in new voice settings
+
+        Args:
+            snapshot: the new SettingsSnapshot
+        """
+        previous = self.voice_settings
+        self.voice_settings = snapshot.voice
+        if previous.voice_lib != snapshot.voice.voice_lib:
+            self.speech_system = self.construct_speech_system()
 
     def refresh_speech_system(self):
         self.tts = self.construct_speech_system()
@@ -47,22 +61,26 @@ class Voice:
         if self.cache_vs.voice_agent != vs.voice_agent:
             ...
 
-    async def tts(self, input: str, *args):
+    async def tts(self, input: str, response_format: str = "mp3", *args):
         """
         Use speech system to execute text to speech
 
         Args:
             input: the string to turn to speech
+            response_format: the audio format, one of `VoiceSettings.audio_formats`
         """
         vs = self.voice_settings
+        if response_format not in vs.audio_formats:
+            raise NotImplementedError(f"Audio format `{response_format}` is not supported")
         if vs.voice_lib == "openai":
-            data = await AsyncSpeech(client=self.openai_client).create(
-                input=input,
-                model=vs.voice_model,
-                voice=vs.voice_agent,
-                response_format="mp3",
-                speed=vs.voice_pitch,
-            )
+            with tracing.span("voice.tts", format=response_format, characters=len(input)):
+                data = await AsyncSpeech(client=self.openai_client).create(
+                    input=input,
+                    model=vs.voice_model,
+                    voice=vs.voice_agent,
+                    response_format=response_format,
+                    speed=vs.voice_pitch,
+                )
             temp_bytes = io.BytesIO()
             temp_bytes.write(data.content)
             temp_bytes.seek(0)
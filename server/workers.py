@@ -0,0 +1,191 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from collections import deque
+
+import asyncio
+import contextvars
+
+
+class PoolFull(Exception):
+    """Raised when the pool has no room for another turn"""
+
+
+class PoolClosed(Exception):
+    """Raised when the pool is draining and not accepting turns"""
+
+
+@dataclass
+class _Job:
+    func: Callable[..., Awaitable]
+    args: tuple
+    future: asyncio.Future
+    # the submitter's context, so the turn runs under its trace span
+    context: contextvars.Context
+
+
+class TurnPool:
+    """
+    Async worker pool bounding how many HomeLink turns run at once
+
+    Args:
+        workers: how many turns run concurrently
+        max_pending: how many turns may wait for a worker before rejecting
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 32):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue: asyncio.Queue[_Job] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._closed = False
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Start the workers"""
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._closed = False
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"turn-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def submit(self, func: Callable[..., Awaitable], *args) -> Any:
+        """
+        Run a turn on the pool and wait for its result
+
+        Args:
+            func: the coroutine function of the turn
+            args: the arguments for the function
+        """
+        if self._closed or self._queue is None:
+            raise PoolClosed("The server is shutting down")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_Job(func, args, future, contextvars.copy_context()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise PoolFull("Too many turns are pending")
+        return await future
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.future.cancelled():
+                    continue
+                self.in_flight += 1
+                try:
+                    result = await asyncio.create_task(
+                        job.func(*job.args), context=job.context
+                    )
+                except asyncio.CancelledError:
+                    if not job.future.done():
+                        job.future.set_exception(PoolClosed("The turn was cancelled on shutdown"))
+                    raise
+                except Exception as ex:
+                    self.failed += 1
+                    if not job.future.done():
+                        job.future.set_exception(ex)
+                else:
+                    self.completed += 1
+                    if not job.future.done():
+                        job.future.set_result(result)
+                finally:
+                    self.in_flight -= 1
+            finally:
+                self._queue.task_done()
+
+    async def drain(self, timeout: float = 30):
+        """
+        Stop accepting turns and wait for the pending and in-flight turns to finish
+
+        Args:
+            timeout: seconds to wait before cancelling the remaining turns
+        """
+        self._closed = True
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Turns that never reached a worker
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            if not job.future.done():
+                job.future.set_exception(PoolClosed("The server is shutting down"))
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self) -> dict:
+        """Returns the pool metrics"""
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "accepting": not self._closed,
+        }
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a sleep. Lag means turns,
+    sockets and timers are all waiting behind blocking work
+
+    Args:
+        interval: seconds between samples
+        window: seconds of samples the stats cover
+    """
+
+    def __init__(self, interval: float = 0.05, window: float = 5.0):
+        self.interval = interval
+        self.samples: deque[tuple[float, float]] = deque(maxlen=max(1, int(window / interval)))
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        """Start sampling"""
+        self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            lag = max(0.0, now - start - self.interval)
+            self.samples.append((now, lag))
+            self.max_lag = max(self.max_lag, lag)
+
+    async def close(self):
+        """Stop sampling"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        """Returns the lag percentiles of the window in milliseconds"""
+        lags = sorted(lag for _, lag in self.samples)
+        if not lags:
+            return {"lag_p50_ms": 0.0, "lag_p99_ms": 0.0, "lag_max_ms": 0.0, "samples": 0}
+        return {
+            "lag_p50_ms": lags[len(lags) // 2] * 1000,
+            "lag_p99_ms": lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000,
+            "lag_max_ms": self.max_lag * 1000,
+            "samples": len(lags),
+        }
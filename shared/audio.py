@@ -0,0 +1,356 @@
+from collections import deque
+
+import numpy as np
+import struct
+
+
+class RingBuffer:
+    """
+    Preallocated byte ring buffer for a single producer and a single consumer.
+    The producer only moves the write cursor and the consumer only moves the
+    read cursor, so both sides can run on different threads without a lock
+
+    Args:
+        capacity: the size of the buffer in bytes
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._written = 0  # total bytes written, producer side
+        self._read = 0  # total bytes read, consumer side
+        self.dropped = 0  # bytes the producer could not fit
+
+    @property
+    def available(self) -> int:
+        """Bytes ready to be read"""
+        return self._written - self._read
+
+    @property
+    def free(self) -> int:
+        """Bytes that can be written"""
+        return self.capacity - self.available
+
+    def write(self, data) -> int:
+        """
+        Write as much of the data as fits, the rest is counted as dropped
+
+        Args:
+            data: a bytes-like object
+
+        Returns:
+            the bytes written
+        """
+        data = memoryview(data).cast("B")
+        size = min(len(data), self.free)
+        self.dropped += len(data) - size
+        start = self._written % self.capacity
+        first = min(size, self.capacity - start)
+        self._view[start : start + first] = data[:first]
+        self._view[: size - first] = data[first:size]
+        self._written += size
+        return size
+
+    def read_into(self, out: memoryview, exact: bool = False) -> int:
+        """
+        Read into a preallocated buffer
+
+        Args:
+            out: the writable buffer to fill
+            exact: only read when the whole buffer can be filled
+
+        Returns:
+            the bytes read
+        """
+        out = memoryview(out).cast("B")
+        size = min(len(out), self.available)
+        if exact and size < len(out):
+            return 0
+        start = self._read % self.capacity
+        first = min(size, self.capacity - start)
+        out[:first] = self._view[start : start + first]
+        out[first:size] = self._view[: size - first]
+        self._read += size
+        return size
+
+    def clear(self):
+        """Drop everything not yet read, consumer side"""
+        self._read = self._written
+
+
+class EnergyVAD:
+    """
+    Frame energy voice activity detector with hangover. Frames with a high
+    zero-crossing rate are treated as hiss rather than speech
+
+    Args:
+        threshold_db: the RMS level in dBFS above which a frame is speech
+        hangover_frames: how many frames to stay in speech after the energy drops
+        max_zcr: the highest zero-crossing rate of speech, None to disable
+    """
+
+    def __init__(
+        self,
+        threshold_db: float = -45.0,
+        hangover_frames: int = 10,
+        max_zcr: float | None = None,
+    ):
+        self.threshold = 32768 * 10 ** (threshold_db / 20)
+        self.hangover_frames = hangover_frames
+        self.max_zcr = max_zcr
+        self._hangover = 0
+        self.frames = 0
+        self.speech_frames = 0
+
+    @staticmethod
+    def rms(samples: np.ndarray) -> float:
+        """
+        The RMS level of int16 samples
+
+        Args:
+            samples: the int16 samples
+        """
+        samples = samples.astype(np.float32)
+        return float(np.sqrt(np.dot(samples, samples) / max(len(samples), 1)))
+
+    @staticmethod
+    def zcr(samples: np.ndarray) -> float:
+        """
+        The share of neighbouring samples changing sign
+
+        Args:
+            samples: the int16 samples
+        """
+        if len(samples) < 2:
+            return 0.0
+        signs = np.signbit(samples)
+        return float(np.count_nonzero(signs[1:] != signs[:-1]) / (len(samples) - 1))
+
+    def is_speech(self, frame) -> bool:
+        """
+        Classify a frame of 16-bit mono PCM
+
+        Args:
+            frame: a bytes-like frame or int16 array
+        """
+        samples = np.frombuffer(frame, dtype=np.int16)
+        self.frames += 1
+        loud = self.rms(samples) >= self.threshold
+        if loud and self.max_zcr is not None:
+            loud = self.zcr(samples) <= self.max_zcr
+        if loud:
+            self._hangover = self.hangover_frames
+        elif self._hangover > 0:
+            self._hangover -= 1
+        else:
+            return False
+        self.speech_frames += 1
+        return True
+
+    @property
+    def duty_cycle(self) -> float:
+        """The share of frames classified as speech"""
+        return self.speech_frames / self.frames if self.frames else 0.0
+
+
+class SpeechGate:
+    """
+    Passes only speech frames on, keeping a short pre-roll of the frames
+    before speech so the onset of the first word is not cut
+
+    Args:
+        vad: the EnergyVAD classifying each frame
+        pre_roll_frames: how many frames before speech to keep
+    """
+
+    def __init__(self, vad: EnergyVAD, pre_roll_frames: int = 3):
+        self.vad = vad
+        self.pre_roll: deque[bytes] = deque(maxlen=pre_roll_frames)
+        self.open = False
+        self.segments = 0
+
+    def process(self, frame) -> list[bytes]:
+        """
+        Classify a frame of 16-bit mono PCM
+
+        Args:
+            frame: a bytes-like frame
+
+        Returns:
+            the frames to pass on, empty during silence
+        """
+        if self.vad.is_speech(frame):
+            frames = [*self.pre_roll, bytes(frame)]
+            self.pre_roll.clear()
+            if not self.open:
+                self.open = True
+                self.segments += 1
+            return frames
+        self.open = False
+        self.pre_roll.append(bytes(frame))
+        return []
+
+    def stats(self) -> dict:
+        """Returns the gate metrics"""
+        return {
+            "frames": self.vad.frames,
+            "speech_frames": self.vad.speech_frames,
+            "duty_cycle": self.vad.duty_cycle,
+            "segments": self.segments,
+        }
+
+
+# Length-prefixed PCM frames: sequence, capture timestamp (ms), flags, payload length
+FRAME_HEADER = struct.Struct("!IIBI")
+FLAG_COMPRESSED = 0x01
+FLAG_AUDIO = 0x02
+FLAG_EVENT = 0x04
+
+
+def pack_header(buffer: bytearray, seq: int, timestamp_ms: int, flags: int, length: int):
+    """
+    Pack a frame header into a preallocated buffer
+
+    Args:
+        buffer: the buffer of FRAME_HEADER.size bytes
+        seq: the frame sequence number
+        timestamp_ms: the capture timestamp in milliseconds
+        flags: the frame flags
+        length: the payload length
+    """
+    FRAME_HEADER.pack_into(buffer, 0, seq & 0xFFFFFFFF, timestamp_ms & 0xFFFFFFFF, flags, length)
+
+
+class JitterBuffer:
+    """
+    Adaptive jitter buffer reordering frames by sequence and releasing them at
+    a steady cadence. The playout delay follows the measured arrival jitter
+
+    Args:
+        frame_ms: the duration of a frame in milliseconds
+        min_delay_ms: the lowest playout delay
+        max_delay_ms: the highest playout delay
+        capacity: how many frames may be buffered
+    """
+
+    def __init__(
+        self,
+        frame_ms: float,
+        min_delay_ms: float = 20,
+        max_delay_ms: float = 200,
+        capacity: int = 64,
+    ):
+        self.frame_ms = frame_ms
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.capacity = capacity
+        self.frames: dict[int, bytes] = {}
+        self.jitter = 0.0
+        self._last_transit: float | None = None
+        self._anchor: tuple[float, int] | None = None  # (arrival ms, seq)
+        self.next_seq: int | None = None
+        self.late = 0
+        self.lost = 0
+        self.overflow = 0
+
+    @property
+    def target_delay(self) -> float:
+        """The playout delay in milliseconds"""
+        delay = self.frame_ms + 3 * self.jitter
+        return min(max(delay, self.min_delay_ms), self.max_delay_ms)
+
+    def push(self, seq: int, timestamp_ms: int, payload: bytes, arrival_ms: float):
+        """
+        Add a received frame
+
+        Args:
+            seq: the frame sequence number
+            timestamp_ms: the capture timestamp of the sender
+            payload: the frame payload
+            arrival_ms: the local arrival time in milliseconds
+        """
+        transit = arrival_ms - timestamp_ms
+        if self._last_transit is not None:
+            # RFC 3550 interarrival jitter estimate
+            self.jitter += (abs(transit - self._last_transit) - self.jitter) / 16
+        self._last_transit = transit
+
+        if self.next_seq is not None and seq < self.next_seq:
+            self.late += 1
+            return
+        if self._anchor is None:
+            if self.next_seq is not None and seq > self.next_seq:
+                self.lost += seq - self.next_seq
+            self._anchor = (arrival_ms, seq)
+            self.next_seq = seq
+        if len(self.frames) >= self.capacity:
+            oldest = min(self.frames)
+            del self.frames[oldest]
+            self.overflow += 1
+        self.frames[seq] = payload
+
+    def pop_ready(self, now_ms: float) -> list[bytes | None]:
+        """
+        Release the frames due for playout, None marks a lost frame to conceal
+
+        Args:
+            now_ms: the local time in milliseconds
+        """
+        ready: list[bytes | None] = []
+        while self._anchor is not None:
+            arrival, seq = self._anchor
+            due = arrival + (self.next_seq - seq) * self.frame_ms + self.target_delay
+            if due > now_ms:
+                break
+            if self.next_seq in self.frames:
+                ready.append(self.frames.pop(self.next_seq))
+            elif self.frames:
+                self.lost += 1
+                ready.append(None)
+            else:
+                # Underrun, anchor again on the next frame
+                self._anchor = None
+                break
+            self.next_seq += 1
+        return ready
+
+
+# Reply audio formats, best first. PCM is what OpenAI speech returns: 24 kHz, 16-bit mono
+AUDIO_FORMATS: dict[str, str] = {
+    "pcm": "audio/pcm",
+    "opus": "audio/ogg",
+    "mp3": "audio/mpeg",
+}
+PCM_SAMPLE_RATE = 24000
+
+
+def negotiate_format(accept: str | None, supported: list[str], default: str = "mp3") -> str:
+    """
+    Pick the reply audio format from an `Accept` header
+
+    Args:
+        accept: the Accept header of the request
+        supported: the formats the server can produce
+        default: the format when the client did not ask for one
+    """
+    if not accept:
+        return default
+    by_media = {AUDIO_FORMATS[f]: f for f in supported if f in AUDIO_FORMATS}
+    best, best_q = None, 0.0
+    for part in accept.split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media in ("*/*", "audio/*"):
+            fmt = default if default in supported else None
+        else:
+            fmt = by_media.get(media)
+        if fmt and q > best_q:
+            best, best_q = fmt, q
+    return best or default
@@ -0,0 +1,241 @@
+"""
+Structured logging that stays off the request path.
+
+Records are filtered, rate limited and sampled in the calling thread, then
+handed to a queue. A background listener formats and writes them, so a turn
+never waits on the terminal or the disk. Keyword arguments become structured
+fields:
+
+    log = get_logger(__name__)
+    log.info("turn finished", client_id=client_id, seconds=0.42)
+    if log.isEnabledFor(DEBUG):
+        log.debug("history", messages=[m.content for m in history])
+"""
+
+from logging import DEBUG, INFO, WARNING, ERROR
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+
+ROOT = "homelink"
+_RESERVED = {"exc_info", "stack_info", "stacklevel", "extra"}
+
+__all__ = (
+    "DEBUG",
+    "INFO",
+    "WARNING",
+    "ERROR",
+    "configure",
+    "get_logger",
+    "shutdown",
+)
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Turns keyword arguments into the `fields` of the record"""
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _RESERVED}
+        extra = kwargs.setdefault("extra", {})
+        extra["fields"] = fields
+        return msg, kwargs
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """
+    Get a structured logger under the `homelink` logger
+
+    Args:
+        name: the module name
+    """
+    if not name.startswith(ROOT):
+        name = f"{ROOT}.{name}"
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per logger and message, the suppressed count is reported on
+    the next record that passes
+
+    Args:
+        rate: records per second
+        burst: records allowed at once
+        min_level: records at this level or above are never limited
+    """
+
+    def __init__(self, rate: float = 10, burst: int = 20, min_level: int = ERROR):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.min_level = min_level
+        self._buckets: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.min_level:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # tokens, last refill, suppressed
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a share of the records of each level
+
+    Args:
+        rates: the share kept per level name, ie `{"DEBUG": 0.1}`
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = {logging.getLevelName(level.upper()): rate for level, rate in rates.items()}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the record fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            data["trace_id"] = trace_id
+        data.update(getattr(record, "fields", None) or {})
+        if getattr(record, "suppressed", 0):
+            data["suppressed"] = record.suppressed
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable lines for the terminal"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if getattr(record, "suppressed", 0):
+            line += f" (suppressed {record.suppressed})"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller, records are dropped when the writer falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the writer thread, only capture what can change
+        from shared.tracing import current_context
+
+        context = current_context()
+        if context is not None:
+            record.trace_id = context.trace_id
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: QueueListener | None = None
+_handler: DroppingQueueHandler | None = None
+
+
+def configure(
+    level: str | int = "INFO",
+    format: str = "text",
+    file: str | None = None,
+    rate_limit: float | None = 10,
+    burst: int = 20,
+    sample_rates: dict[str, float] | None = None,
+    max_queued: int = 10000,
+) -> DroppingQueueHandler:
+    """
+    Route the `homelink` loggers through a queue to a background writer
+
+    Args:
+        level: the minimum level, verbose payloads are only logged at DEBUG
+        format: `text` or `json`
+        file: the file to append to, stderr if not given
+        rate_limit: records per second per message, None to disable
+        burst: records per message allowed at once
+        sample_rates: the share of records kept per level, ie `{"DEBUG": 0.1}`
+        max_queued: records beyond this are dropped
+    """
+    global _listener, _handler
+    shutdown()
+
+    writer = logging.FileHandler(file) if file else logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JSONFormatter() if format == "json" else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max_queued)
+    _handler = DroppingQueueHandler(log_queue)
+    if rate_limit:
+        _handler.addFilter(RateLimitFilter(rate_limit, burst))
+    if sample_rates:
+        _handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger(ROOT)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.addHandler(_handler)
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, writer, respect_handler_level=True)
+    _listener.start()
+    return _handler
+
+
+def shutdown():
+    """Flush the queued records and stop the writer"""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger(ROOT).removeHandler(_handler)
+        _handler = None
+
@@ -0,0 +1,449 @@
+"""
+Lightweight span tracing for HomeLink turns.
+
+Spans follow the current span through `contextvars`, so they nest across
+awaits, tasks and `asyncio.to_thread`. Between the client and the server the
+context travels in a W3C `traceparent` header. Sampled spans are batched on a
+background thread and written as OTLP JSON, either to a file or to a collector.
+
+Usage:
+    configure("homelink-server", file="traces/server.otlp.jsonl")
+    with span("intent.tiebreak", candidates=3):
+        ...
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from shared.log import get_logger
+
+log = get_logger(__name__)
+
+TRACEPARENT = "traceparent"
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def from_traceparent(cls, header: str | None) -> "SpanContext | None":
+        """
+        Parse a W3C `traceparent` header
+
+        Args:
+            header: the header value
+        """
+        parts = (header or "").strip().split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        try:
+            sampled = bool(int(parts[3], 16) & 1)
+        except ValueError:
+            return None
+        return cls(trace_id=parts[1], span_id=parts[2], sampled=sampled)
+
+
+_current: ContextVar[SpanContext | None] = ContextVar("homelink_span", default=None)
+
+
+def current_context() -> SpanContext | None:
+    """Get the context of the current span"""
+    return _current.get()
+
+
+def inject(headers: dict | None = None) -> dict:
+    """
+    Add the current span to outgoing headers
+
+    Args:
+        headers: the headers to add to
+    """
+    headers = headers if headers is not None else {}
+    context = _current.get()
+    if context is not None:
+        headers[TRACEPARENT] = context.traceparent()
+    return headers
+
+
+def extract(headers) -> SpanContext | None:
+    """
+    Get the remote parent span from incoming headers
+
+    Args:
+        headers: the headers mapping
+    """
+    return SpanContext.from_traceparent(headers.get(TRACEPARENT))
+
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    """
+    A timed stage of a turn, use as a context manager
+
+    Args:
+        tracer: the Tracer the span is exported through
+        name: the stage name
+        context: the span context
+        parent_id: the parent span id
+        attributes: the span attributes
+    """
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "context",
+        "parent_id",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "error",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        context: SpanContext,
+        parent_id: str | None,
+        attributes: dict,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: str | None = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.error = message
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self.context)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None and self.error is None:
+            self.error = repr(exc)
+        if self.context.sampled:
+            self.tracer.exporter.export(self)
+        return False
+
+    def to_otlp(self) -> dict:
+        data = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+
+class _NoopSpan:
+    """Returned while tracing is off, costs nothing and propagates nothing"""
+
+    def set_attribute(self, key: str, value: Any): ...
+
+    def set_error(self, message: str): ...
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter:
+    """
+    Batches finished spans on a background thread so exporting never blocks a turn
+
+    Args:
+        service: the service name the spans are reported under
+        max_batch: the most spans written at once
+        interval: seconds between flushes
+        max_queued: spans beyond this are dropped
+    """
+
+    def __init__(
+        self,
+        service: str,
+        max_batch: int = 256,
+        interval: float = 1.0,
+        max_queued: int = 10000,
+    ):
+        self.service = service
+        self.max_batch = max_batch
+        self.interval = interval
+        self._queue: queue.Queue[Span | None] = queue.Queue(maxsize=max_queued)
+        self.dropped = 0
+        self.exported = 0
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch: list[Span] = []
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self.write(self.to_request(batch))
+                    self.exported += len(batch)
+                except Exception as ex:
+                    log.warning("could not export spans", spans=len(batch), error=str(ex))
+            if stop:
+                return
+
+    def to_request(self, spans: list[Span]) -> dict:
+        """
+        Build an OTLP `ExportTraceServiceRequest`
+
+        Args:
+            spans: the finished spans
+        """
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_attribute("service.name", self.service)]},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "homelink"},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def write(self, request: dict):
+        raise NotImplementedError
+
+    def shutdown(self, timeout: float = 5):
+        """
+        Flush the queued spans and stop
+
+        Args:
+            timeout: seconds to wait for the flush
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class OTLPFileExporter(SpanExporter):
+    """
+    Appends one OTLP JSON request per line, the file exporter format of the
+    OpenTelemetry collector
+
+    Args:
+        path: the file to append to
+    """
+
+    def __init__(self, service: str, path: str, **kwargs):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        super().__init__(service, **kwargs)
+
+    def write(self, request: dict):
+        with open(self.path, "a") as file:
+            file.write(json.dumps(request) + "\n")
+
+
+class OTLPHttpExporter(SpanExporter):
+    """
+    Posts OTLP JSON to a collector
+
+    Args:
+        endpoint: the collector traces endpoint, ie `http://localhost:4318/v1/traces`
+    """
+
+    def __init__(self, service: str, endpoint: str, **kwargs):
+        import httpx
+
+        self.endpoint = endpoint
+        self.client = httpx.Client(timeout=5)
+        super().__init__(service, **kwargs)
+
+    def write(self, request: dict):
+        self.client.post(self.endpoint, json=request).raise_for_status()
+
+
+class Tracer:
+    """
+    Starts spans, sampling is decided once per trace at its root
+
+    Args:
+        exporter: where sampled spans go, tracing is off without one
+        sample_rate: the share of traces that are recorded
+    """
+
+    def __init__(self, exporter: SpanExporter | None = None, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def span(self, name: str, parent: SpanContext | None = None, **attributes):
+        """
+        Start a span under the current span
+
+        Args:
+            name: the stage name
+            parent: the parent span, defaults to the current span
+            attributes: the span attributes
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+        parent = parent or _current.get()
+        if parent is None:
+            trace_id = f"{random.getrandbits(128):032x}"
+            sampled = random.random() < self.sample_rate
+        else:
+            trace_id, sampled = parent.trace_id, parent.sampled
+        context = SpanContext(trace_id, f"{random.getrandbits(64):016x}", sampled)
+        return Span(self, name, context, parent.span_id if parent else None, attributes)
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+_tracer = Tracer()
+
+
+def configure(
+    service: str,
+    file: str | None = None,
+    endpoint: str | None = None,
+    sample_rate: float = 1.0,
+) -> Tracer:
+    """
+    Set up the process wide tracer, tracing stays off without a file or endpoint
+
+    Args:
+        service: the service name the spans are reported under
+        file: the OTLP JSON file to append to
+        endpoint: the OTLP/HTTP collector traces endpoint
+        sample_rate: the share of traces that are recorded
+    """
+    global _tracer
+    _tracer.shutdown()
+    exporter = None
+    if endpoint:
+        exporter = OTLPHttpExporter(service, endpoint)
+    elif file:
+        exporter = OTLPFileExporter(service, file)
+    _tracer = Tracer(exporter, sample_rate)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def shutdown():
+    """Flush the spans and turn tracing off"""
+    global _tracer
+    _tracer.shutdown()
+    _tracer = Tracer()
+
+
+def span(name: str, parent: SpanContext | None = None, **attributes):
+    """
+    Start a span on the process wide tracer
+
+    Args:
+        name: the stage name
+        parent: the parent span, defaults to the current span
+        attributes: the span attributes
+    """
+    return _tracer.span(name, parent, **attributes)
+
+
+def traced(name: str) -> Callable:
+    """
+    Trace every call of a function
+
+    Args:
+        name: the stage name
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _tracer.span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _tracer.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
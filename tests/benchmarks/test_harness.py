@@ -0,0 +1,57 @@
+import pytest
+from benchmarks.fakes import Fixtures, LatencyDistribution
+from benchmarks.harness import (
+    BenchmarkConfig,
+    find_regressions,
+    percentile,
+    run_benchmark,
+)
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+
+    assert percentile(values, 50) == pytest.approx(50.5)
+    assert percentile(values, 99) == pytest.approx(99.01)
+    assert percentile([], 95) == 0.0
+
+
+def test_find_regressions():
+    baseline = {"stages": {"tts": {"p95": 100.0}, "total": {"p95": 500.0}}}
+    stages = {"tts": {"p95": 130.0}, "total": {"p95": 520.0}}
+
+    regressions = find_regressions(stages, baseline, threshold=0.1)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("tts")
+
+
+def test_fixture_rules_match_latest_message(tmp_path):
+    fixtures = Fixtures(str(tmp_path / "missing.json"))
+    fixtures.rules = [
+        {"contains": ["System:"], "message": "Thanks", "response": "Anytime!"},
+        {"contains": ["System:"], "response": "Got it."},
+    ]
+
+    assert fixtures.llm_response("System: hi\nHuman: Thanks\nAI: x\nHuman: Add eggs") == "Got it."
+    assert fixtures.llm_response("System: hi\nHuman: Thanks!") == "Anytime!"
+    with pytest.raises(KeyError):
+        fixtures.llm_response("unknown prompt")
+
+
+def test_latency_distribution_scale():
+    latency = LatencyDistribution(distribution="constant", median_ms=200, scale=0.5)
+
+    assert latency.sample(None) == pytest.approx(0.1)
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark_reports_stages():
+    pytest.importorskip("fakeredis")
+    report = await run_benchmark(BenchmarkConfig(iterations=1, latency_scale=0))
+
+    stages = report.stages()
+    assert report.errors == 0
+    assert stages["total"]["count"] == len(report.samples)
+    for stage in ("intent", "memory_extraction", "conversation", "tts"):
+        assert stage in stages
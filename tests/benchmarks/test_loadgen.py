@@ -0,0 +1,59 @@
+from benchmarks.loadgen import LoadConfig, LoadRun, StageReport
+
+from fastapi import FastAPI, Response
+
+import asyncio
+import httpx
+import pytest
+
+
+def test_stage_summary():
+    stage = StageReport(clients=2, seconds=2.0, latencies=[0.1, 0.2, 0.3, 0.4])
+    stage.queue_depths = [0, 2, 4]
+    stage.server_lag_ms = [1.0, 6.0]
+    summary = stage.summary()
+    assert summary["requests"] == 4
+    assert summary["rps"] == 2.0
+    assert summary["p50"] == pytest.approx(250)
+    assert summary["queue_depth_avg"] == 2
+    assert summary["queue_depth_max"] == 4
+    assert summary["server_lag_p99"] == 6.0
+
+
+@pytest.mark.asyncio
+async def test_load_run_counts_turns_and_rejections():
+    app = FastAPI()
+    calls = {"awake": 0}
+
+    @app.get("/")
+    async def status():
+        return {"pool": {"queue_depth": 3}, "loop": {"lag_p99_ms": 1.5}}
+
+    @app.post("/awake")
+    async def awake():
+        calls["awake"] += 1
+        if calls["awake"] % 2 == 0:
+            return Response(status_code=503, headers={"Retry-After": "0"})
+        return {"response": "ok"}
+
+    @app.post("/chat")
+    async def chat():
+        return Response(status_code=500)
+
+    utterances = [{"text": "Thanks!", "mode": "link"}, {"text": "Hi", "mode": "chat"}]
+    config = LoadConfig(poll_interval=0.01)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://loadgen"
+    ) as client:
+        run = LoadRun(client, utterances, config)
+        run.stage = StageReport(clients=2)
+        tasks = [asyncio.create_task(run.poll())]
+        tasks += [asyncio.create_task(run.room(i)) for i in range(2)]
+        await asyncio.sleep(0.1)
+        run.stop.set()
+        await asyncio.gather(*tasks)
+
+    stage = run.stage
+    assert stage.latencies and stage.rejected and stage.errors
+    assert stage.queue_depths[0] == 3
+    assert stage.server_lag_ms[0] == 1.5
@@ -0,0 +1,88 @@
+import asyncio
+import subprocess
+import sys
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from benchmarks.startup import parse_importtime, ROOT_DIR
+from server.homelink import HomeLink, component
+
+
+def test_parse_importtime():
+    stderr = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   shared.utils",
+            "import time:      2500 |       2620 | server",
+        ]
+    )
+    timings = parse_importtime(stderr)
+    assert [t.module for t in timings] == ["shared.utils", "server"]
+    assert timings[0].depth == 1
+    assert timings[1].cumulative_ms == 2.62
+
+
+def test_server_import_is_lazy():
+    code = "import sys, server.main; print('langchain_openai' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_component_builds_once_and_can_be_replaced():
+    built = []
+
+    class Link:
+        def __init__(self):
+            self.startup_times = {}
+
+        @component
+        def voice(self):
+            built.append(1)
+            return object()
+
+    link = Link()
+    assert link.voice is link.voice
+    assert len(built) == 1
+    assert "voice" in link.startup_times
+
+    link.voice = "fake"
+    assert link.voice == "fake"
+    assert isinstance(HomeLink.voice, component)
+
+
+@pytest.mark.asyncio
+async def test_first_turn_builds_off_the_event_loop(monkeypatch):
+    import fakeredis
+    import time
+
+    builds = []
+
+    def build_components(self):
+        # stands in for importing langchain and building the clients
+        builds.append(1)
+        time.sleep(0.3)
+
+    monkeypatch.setattr(HomeLink, "build_components", build_components)
+    link = HomeLink(config_folder="config", redis=fakeredis.FakeRedis(decode_responses=True))
+    link.memory = MagicMock(list_of_keys=AsyncMock(return_value=[]))
+    await link.warm_up(startup="lazy")
+
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    # turns arriving together share the one build
+    await asyncio.gather(link.ready(), link.ready())
+    ticker.cancel()
+    assert ticks > 10
+    assert link._ready and len(builds) == 1
+    await link.close()
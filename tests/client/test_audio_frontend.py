@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from client.audio_frontend import AudioFrontend
+
+RATE = 48000
+
+
+def tone(hz: float, seconds: float = 1) -> np.ndarray:
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (np.sin(2 * np.pi * hz * t) * 10000).astype(np.int16)
+
+
+def run(frontend: AudioFrontend, samples: np.ndarray, block: int) -> np.ndarray:
+    out = [
+        np.frombuffer(bytes(frontend.process(samples[i : i + block].tobytes())), np.int16)
+        for i in range(0, len(samples), block)
+    ]
+    return np.concatenate(out)
+
+
+def rms(samples: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(samples[200:].astype(np.float64) ** 2)))
+
+
+def test_decimates_and_keeps_speech_band():
+    out = run(AudioFrontend(RATE, 16000), tone(440), 4800)
+
+    assert len(out) == 16000
+    assert rms(out) == pytest.approx(10000 / np.sqrt(2), rel=0.02)
+
+
+def test_removes_aliasing_band():
+    out = run(AudioFrontend(RATE, 16000), tone(12000), 4800)
+
+    assert rms(out) < 10
+
+
+def test_block_size_does_not_change_output():
+    samples = tone(440)
+    whole = run(AudioFrontend(RATE, 16000), samples, 48000)
+    blocks = run(AudioFrontend(RATE, 16000), samples, 960)
+
+    np.testing.assert_array_equal(whole, blocks)
+
+
+def test_mixes_channels():
+    left = tone(440)
+    stereo = np.stack([left, np.zeros_like(left)], axis=1).ravel()
+    out = run(AudioFrontend(RATE, 16000, channels=2), stereo, 9600)
+
+    assert rms(out) == pytest.approx(5000 / np.sqrt(2), rel=0.02)
+
+
+def test_rejects_fractional_ratio():
+    with pytest.raises(NotImplementedError):
+        AudioFrontend(44100, 16000)
@@ -0,0 +1,106 @@
+import asyncio
+import httpx
+import pytest
+from client.server_link import ServerLink
+
+
+def make_link(handler, **kwargs) -> ServerLink:
+    return ServerLink(
+        "http://homelink",
+        "kitchen",
+        backoff=0,
+        transport=httpx.MockTransport(handler),
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_submit_sends_in_background():
+    received = []
+    responses = []
+
+    def handler(request: httpx.Request):
+        received.append(request.read())
+        return httpx.Response(200, content=b"audio")
+
+    async def on_response(response):
+        responses.append(response.content)
+
+    link = make_link(handler, on_response=on_response)
+    await link.start()
+    link.submit("hello")
+    await asyncio.sleep(0)
+    await link.queue.join()
+    await link.close()
+
+    assert received == [b'{"input":"hello","client_id":"kitchen"}']
+    assert responses == [b"audio"]
+    assert link.stats()["sent"] == 1
+
+
+@pytest.mark.asyncio
+async def test_send_retries_busy_server():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) < 2 else 200)
+
+    link = make_link(handler, retries=2)
+    await link.start()
+    response = await link.send("hello")
+    await link.close()
+
+    assert response.status_code == 200
+    assert link.retried == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_oldest():
+    link = make_link(lambda request: httpx.Response(200), max_pending=1)
+    await link.start()
+    link._task.cancel()
+    link._enqueue("first")
+    link._enqueue("second")
+
+    assert link.dropped == 1
+    assert link.queue.get_nowait() == "second"
+    await link.close()
+
+
+@pytest.mark.asyncio
+async def test_only_send_retries(monkeypatch):
+    built = []
+
+    def transport(**kwargs):
+        built.append(kwargs)
+        return httpx.MockTransport(lambda request: httpx.Response(200))
+
+    monkeypatch.setattr(httpx, "AsyncHTTPTransport", transport)
+    link = ServerLink("http://homelink", "kitchen", retries=3)
+    await link.start()
+    await link.close()
+
+    # retrying in the transport as well would multiply the attempts
+    assert built == [{"retries": 0}]
+
+
+@pytest.mark.asyncio
+async def test_send_retries_only_unsent_turns():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        # the server may already be running the turn
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    link = make_link(handler, retries=3)
+    await link.start()
+    response = await link.send("text mom")
+    await link.close()
+
+    assert response is None
+    assert len(calls) == 2
+    assert link.retried == 1 and link.failed == 1
@@ -0,0 +1,135 @@
+import asyncio
+import importlib
+import sys
+import threading
+import types
+
+import pytest
+
+
+class FakeChannel:
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeSound:
+    """Stands in for `pygame.mixer.Sound`, named after the encoded bytes"""
+
+    played: list[str] = []
+    length = 0.05
+    # decoding these waits until the event is set
+    blocking: dict[str, threading.Event] = {}
+
+    def __init__(self, source=None, buffer=None, file=None):
+        self.name = file.getvalue().decode() if file is not None else str(source)
+        if self.name in self.blocking:
+            self.blocking[self.name].wait(2)
+
+    def play(self):
+        self.played.append(self.name)
+        return FakeChannel()
+
+    def get_length(self):
+        return self.length
+
+
+@pytest.fixture
+def sound_controller(monkeypatch):
+    mixer = types.SimpleNamespace(
+        init=lambda **kwargs: None,
+        get_init=lambda: (24000, -16, 1),
+        Sound=FakeSound,
+    )
+    monkeypatch.setitem(sys.modules, "pygame", types.SimpleNamespace(mixer=mixer))
+    monkeypatch.setitem(sys.modules, "pygame.mixer", mixer)
+    monkeypatch.delitem(sys.modules, "client.sound_controller", raising=False)
+    FakeSound.played = []
+    FakeSound.length = 0.05
+    FakeSound.blocking = {}
+    module = importlib.import_module("client.sound_controller")
+    yield module
+    sys.modules.pop("client.sound_controller", None)
+
+
+async def wait_playing(controller):
+    while not controller.is_playing:
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_alerts_play_before_chatter(sound_controller):
+    priority = sound_controller.PlaybackPriority
+    controller = sound_controller.SoundController()
+    await controller.start()
+
+    first = asyncio.create_task(controller.play_audio(b"first"))
+    await wait_playing(controller)
+    chatter = asyncio.create_task(controller.play_audio(b"chatter", priority=priority.CHATTER))
+    alert = asyncio.create_task(controller.play_audio(b"alert", priority=priority.ALERT))
+    await asyncio.gather(first, chatter, alert)
+
+    assert FakeSound.played == ["first", "alert", "chatter"]
+    assert controller.played == 3
+    await controller.close()
+
+
+@pytest.mark.asyncio
+async def test_barge_in_interrupts_playback(sound_controller):
+    FakeSound.length = 5
+    controller = sound_controller.SoundController()
+    await controller.start()
+
+    playing = asyncio.create_task(controller.play_audio(b"long"))
+    await wait_playing(controller)
+    # the voice listener barges in from its own thread
+    listener = threading.Thread(target=controller.barge_in_threadsafe)
+    listener.start()
+    listener.join()
+    response = await asyncio.wait_for(playing, 1)
+
+    assert response.response == "Interrupted"
+    assert controller.interrupted == 1
+    await controller.close()
+
+
+@pytest.mark.asyncio
+async def test_clearing_the_queue_cancels_preloads(sound_controller):
+    FakeSound.length = 5
+    FakeSound.blocking["next"] = release = threading.Event()
+    controller = sound_controller.SoundController()
+    await controller.start()
+
+    playing = asyncio.create_task(controller.play_audio(b"long"))
+    queued = asyncio.create_task(controller.play_audio(b"next"))
+    await wait_playing(controller)
+    # the next sound is decoding while the first one plays
+    item = controller._heap[0]
+    assert item.sound is not None and not item.sound.done()
+
+    controller.barge_in(clear=True)
+    release.set()
+    assert (await queued).response == "Interrupted"
+    assert (await playing).response == "Interrupted"
+    await asyncio.gather(item.sound, return_exceptions=True)
+    assert item.sound.cancelled()
+    assert not controller._heap
+    await controller.close()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects(sound_controller):
+    FakeSound.length = 5
+    controller = sound_controller.SoundController(max_queued=1)
+    await controller.start()
+
+    await controller.play_audio(b"long", wait=False)
+    await wait_playing(controller)
+    await controller.play_audio(b"queued", wait=False)
+    response = await controller.play_audio(b"rejected", wait=False)
+
+    assert response.retry is True
+    assert response.response == "Too many sounds are queued"
+    await controller.close()
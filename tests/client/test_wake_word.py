@@ -0,0 +1,42 @@
+import json
+from client.wake_word import WakeWordDetector, wake_variants
+
+
+class FakeRecognizer:
+    def __init__(self, partials: list[str]):
+        self.partials = partials
+        self.resets = 0
+
+    def AcceptWaveform(self, frame):
+        return False
+
+    def PartialResult(self):
+        return json.dumps({"partial": self.partials.pop(0) if self.partials else ""})
+
+    def Reset(self):
+        self.resets += 1
+
+
+def test_wake_variants_from_string():
+    variants = wake_variants("Hey Jared", extra=["Hey Jarrod"])
+
+    assert variants[0] == "hey jared"
+    assert "hay jared" in variants
+    assert "hey jarrod" in variants
+    # a string is one wake word, not a list of characters
+    assert "h" not in variants
+
+
+def test_detects_on_partial_result():
+    recognizer = FakeRecognizer(["", "hey", "hey jared"])
+    detector = WakeWordDetector(recognizer, wake_variants(["Hey Jared"]))
+
+    assert [detector.process(b"") for _ in range(3)] == [False, False, True]
+    assert detector.detections == 1
+    assert recognizer.resets == 1
+
+
+def test_ignores_partial_words():
+    detector = WakeWordDetector(FakeRecognizer(["hey jaredson"]), wake_variants("hey jared"))
+
+    assert detector.process(b"") is False
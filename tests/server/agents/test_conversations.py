@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from server.agent import AgentConfig
+from server.agents import Conversations, Memory
+
+
+@pytest.fixture
+def conversations():
+    settings = MagicMock()
+    settings.get.return_value.response = {"name": "Jarvis"}
+    config = AgentConfig(redis=MagicMock(), llm_ctx=MagicMock(), settings=settings)
+    conversations = Conversations(config=config)
+    conversations._inject_memory_agent(Memory(config=config))
+    return conversations
+
+
+def test_sessions_are_per_client(conversations):
+    kitchen = conversations.session_id("kitchen")
+    bedroom = conversations.session_id("bedroom")
+
+    assert kitchen != bedroom
+    assert conversations.session_id("kitchen") == kitchen
+
+
+def test_ended_session_starts_new_conversation(conversations):
+    kitchen = conversations.session_id("kitchen")
+    conversations.memory.get_chat_session(kitchen).ended_conversation = True
+
+    assert conversations.session_id("kitchen") != kitchen
+
+
+@pytest.mark.asyncio
+async def test_turns_serialize_per_client(conversations):
+    running: dict[str, int] = {}
+    overlaps: list[str] = []
+
+    async def fake_conversate(input, has_intent, convo_id):
+        running[convo_id] = running.get(convo_id, 0) + 1
+        if len(running) > 1 and convo_id not in overlaps:
+            overlaps.append(convo_id)
+        assert running[convo_id] == 1
+        await asyncio.sleep(0.01)
+        running[convo_id] -= 1
+        if not running[convo_id]:
+            del running[convo_id]
+        return input
+
+    conversations._conversate = fake_conversate
+    results = await asyncio.gather(
+        conversations.conversate("a", client_id="kitchen"),
+        conversations.conversate("b", client_id="kitchen"),
+        conversations.conversate("c", client_id="bedroom"),
+    )
+
+    assert results == ["a", "b", "c"]
+    # different clients ran at the same time
+    assert overlaps
+
+
+@pytest.mark.asyncio
+async def test_intent_turns_use_the_client_session(conversations):
+    seen: list[str] = []
+
+    async def fake_conversate(input, has_intent, convo_id):
+        seen.append(convo_id)
+        return input
+
+    conversations._conversate = fake_conversate
+    await conversations.execute("hi", intent=None, client_id="kitchen")
+    await conversations.execute("hi", intent=None, client_id="bedroom")
+
+    assert seen == [conversations.session_id("kitchen"), conversations.session_id("bedroom")]
@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from server.agent import AgentConfig
 from server.agents import Memory
+from server.models import KeyMatch, MemoryCommand, MemoryExtraction, MemorySettings
 from shared.mixins import ResponseMixin
 
 
@@ -25,12 +26,16 @@ def llm_ctx_mock():
     llm_ctx = MagicMock()
     llm_ctx.intent_llm = MagicMock()
     llm_ctx.intent_llm.ainvoke = AsyncMock()
+    llm_ctx.supports_structured = MagicMock(return_value=False)
+    llm_ctx.structured = AsyncMock(return_value=None)
     return llm_ctx
 
 
 @pytest.fixture
 def agent_config_mock(redis_mock, llm_ctx_mock):
-    config = AgentConfig(redis=redis_mock, llm_ctx=llm_ctx_mock)
+    config = AgentConfig(
+        redis=redis_mock, llm_ctx=llm_ctx_mock, settings=MagicMock(memory=MemorySettings())
+    )
     return config
 
 
@@ -308,3 +313,178 @@ async def test_understand_agent(memory_agent):
     # Check the response
     assert isinstance(response, ResponseMixin)
     assert response.response == f"{Memory.__doc__} | Methods: list_of_methods"
+
+
+@pytest.mark.asyncio
+async def test_parse_memory_response_list(memory_agent):
+    memory_agent.store = AsyncMock()
+
+    response = await memory_agent._parse_memory_response("grocery_list|list|eggs, milk")
+
+    memory_agent.store.assert_called_with(
+        key="grocery_list", memory=["eggs", "milk"], value_type="list", ttl=None
+    )
+    assert response.completed is True
+
+
+@pytest.mark.asyncio
+async def test_parse_memory_response_malformed(memory_agent):
+    memory_agent.store = AsyncMock()
+
+    response = await memory_agent._parse_memory_response("grocery_list")
+
+    memory_agent.store.assert_not_called()
+    assert response.retry is True
+
+
+@pytest.mark.asyncio
+async def test_is_this_memorable_structured(memory_agent, llm_ctx_mock):
+    llm_ctx_mock.supports_structured.return_value = True
+    llm_ctx_mock.structured.return_value = MemoryExtraction(
+        memories=[
+            MemoryCommand(key="parking_spot", action="str", memory="level 3"),
+            MemoryCommand(key="old_note", action="clear"),
+        ]
+    )
+    memory_agent.store = AsyncMock()
+    memory_agent.forget = MagicMock()
+
+    response = await memory_agent._is_this_memorable("I parked on level 3")
+
+    memory_agent.store.assert_called_once_with(
+        key="parking_spot", memory="level 3", value_type="str", ttl=None
+    )
+    memory_agent.forget.assert_called_once_with("old_note")
+    assert response.completed is True
+    assert "parking_spot" in response.response
+
+
+@pytest.fixture
+def fake_memory(llm_ctx_mock):
+    import fakeredis
+
+    settings = MagicMock(memory=MemorySettings(max_memories=2))
+    config = AgentConfig(
+        redis=fakeredis.FakeRedis(decode_responses=True),
+        llm_ctx=llm_ctx_mock,
+        settings=settings,
+    )
+    memory = Memory(config)
+    memory.ensure_key = AsyncMock(side_effect=lambda key: f"memory|{key}")
+    return memory
+
+
+@pytest.mark.asyncio
+async def test_store_applies_ttls(fake_memory):
+    fake_memory.memory_settings = MemorySettings(ttls={"parking*": 60})
+    await fake_memory.store("parking_spot", "level 3")
+    await fake_memory.store("note", "call back", ttl=30)
+    await fake_memory.store("birthday", "may 4")
+
+    redis = fake_memory.redis
+    assert 0 < redis.ttl("memory|parking_spot") <= 60
+    assert 0 < redis.ttl("memory|note") <= 30
+    assert redis.ttl("memory|birthday") == -1
+
+
+@pytest.mark.asyncio
+async def test_evicts_least_used_beyond_cap(fake_memory):
+    await fake_memory.store("grocery_list", ["eggs"], value_type="list")
+    await fake_memory.store("birthday", "may 4")
+    await fake_memory.retrieve("grocery_list")
+    await fake_memory.store("wifi", "hunter2")
+
+    redis = fake_memory.redis
+    assert not redis.exists("memory|birthday")
+    assert redis.exists("memory|grocery_list") and redis.exists("memory|wifi")
+    assert redis.zcard("memory_usage") == 2
+
+
+@pytest.mark.asyncio
+async def test_mixed_case_memories_count_against_the_cap(fake_memory):
+    await fake_memory.store("Birthday", "may 4")
+    await fake_memory.store("WiFi", "hunter2")
+    await fake_memory.retrieve("birthday")
+    await fake_memory.store("Parking_Spot", "level 3")
+
+    redis = fake_memory.redis
+    assert set(redis.zrange("memory_usage", 0, -1)) == {
+        "memory|birthday",
+        "memory|parking_spot",
+    }
+    assert not redis.exists("memory|wifi")
+    assert "birthday" in fake_memory.key_index and "wifi" not in fake_memory.key_index
+
+
+@pytest.mark.asyncio
+async def test_expired_memories_leave_the_ranking(fake_memory):
+    await fake_memory.store("birthday", "may 4")
+    await fake_memory.retrieve("birthday")
+    await fake_memory.store("wifi", "hunter2")
+    fake_memory.redis.delete("memory|birthday")  # as if it expired
+
+    # reconciling drops it, without waiting for it to be evicted
+    fake_memory._scan_keys()
+
+    assert fake_memory.redis.zrange("memory_usage", 0, -1) == ["memory|wifi"]
+
+
+def test_usage_weight_decays_and_rebases(fake_memory):
+    fake_memory.memory_settings = MemorySettings(decay_half_life_hours=1)
+    fake_memory._touch("memory|old")
+    epoch = fake_memory._usage_epoch
+
+    # a use one half life later counts twice as much
+    fake_memory._usage_epoch = epoch - 3600
+    assert fake_memory._usage_weight() == pytest.approx(2.0, rel=1e-3)
+
+    # far enough out the scores are rescaled relative to now
+    fake_memory.redis.hset("memory_usage_meta", "epoch", epoch - 3600 * 100)
+    fake_memory._usage_epoch = epoch - 3600 * 100
+    assert fake_memory._usage_weight() == pytest.approx(1.0, rel=1e-3)
+    assert fake_memory.redis.zscore("memory_usage", "memory|old") < 1e-20
+
+
+@pytest.mark.asyncio
+async def test_determine_key_skips_llm_for_same_key(memory_agent, redis_mock, llm_ctx_mock):
+    redis_mock.scan_iter.return_value = ["memory|grocery_list", "memory|parking_spot"]
+
+    assert await memory_agent._determine_key_via_llm("Grocery List") == "grocery_list"
+    llm_ctx_mock.structured.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_candidate_keys_are_limited(memory_agent, redis_mock):
+    memory_agent.memory_settings = MemorySettings(key_candidates=2)
+    redis_mock.scan_iter.return_value = [
+        "memory|grocery_list",
+        "memory|parking_spot",
+        "memory|wifi",
+    ]
+
+    assert await memory_agent.candidate_keys("park car") == ["parking_spot", "grocery_list"]
+    redis_mock.keys.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_key_index_reconciles_on_interval(memory_agent, redis_mock):
+    redis_mock.scan_iter.return_value = ["memory|wifi"]
+    await memory_agent.candidate_keys("wifi")
+    # another worker stored a memory, it is not rescanned on every lookup
+    redis_mock.scan_iter.return_value = ["memory|wifi", "memory|parking_spot"]
+    await memory_agent.candidate_keys("park")
+    assert "parking_spot" not in memory_agent.key_index
+    assert redis_mock.scan_iter.call_count == 1
+
+    memory_agent._key_index_synced -= memory_agent.memory_settings.key_index_refresh
+    assert "parking_spot" in await memory_agent.candidate_keys("park")
+
+
+@pytest.mark.asyncio
+async def test_determine_key_asks_llm_for_similar_spelling(memory_agent, redis_mock, llm_ctx_mock):
+    redis_mock.scan_iter.return_value = ["memory|kate_birthday"]
+    llm_ctx_mock.supports_structured.return_value = True
+    llm_ctx_mock.structured.return_value = KeyMatch(key=None)
+
+    assert await memory_agent._determine_key_via_llm("nate_birthday") == "nate_birthday"
+    llm_ctx_mock.structured.assert_called_once()
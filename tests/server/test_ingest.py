@@ -0,0 +1,171 @@
+import numpy as np
+import pytest
+import socket
+import zlib
+from fastapi.testclient import TestClient
+from server.ingest import AudioPipeline, AlwaysAwake
+from server.main import create_app
+from server.models import IngestSettings
+from server.transport import ConnectionClosed, PCMConnection, PCMStreamServer
+from shared.audio import FRAME_HEADER, FLAG_EVENT, pack_header
+from tests.server.test_main import FakeHomeLink
+
+FRAME = 160
+SILENCE = np.zeros(FRAME, dtype=np.int16).tobytes()
+SPEECH = (np.sin(np.arange(FRAME) / 3) * 20000).astype(np.int16).tobytes()
+
+
+class FakeWakeWord:
+    frame_length = FRAME
+
+    def __init__(self):
+        self.frames = 0
+
+    def process(self, frame):
+        self.frames += 1
+        return self.frames == 2
+
+
+class FakeRecognition:
+    def __init__(self, after: int = 3):
+        self.after = after
+        self.frames = 0
+
+    def accept(self, frame):
+        self.frames += 1
+        return "add eggs to grocery list" if self.frames == self.after else None
+
+    def reset(self):
+        self.frames = 0
+
+
+def make_pipeline(wake_word=None, **settings):
+    settings = IngestSettings(vad_threshold_db=-30, vad_hangover_ms=0, **settings)
+    return AudioPipeline(settings, wake_word or FakeWakeWord(), FakeRecognition())
+
+
+def test_vad_gates_wake_word():
+    wake_word = FakeWakeWord()
+    pipeline = make_pipeline(wake_word)
+
+    assert pipeline.feed(SILENCE * 5) == []
+    assert wake_word.frames == 0
+    assert pipeline.stats.frames == 5
+
+
+def test_wake_then_transcript():
+    pipeline = make_pipeline()
+
+    events = pipeline.feed(SPEECH * 2 + SPEECH + SILENCE * 2)
+
+    assert [e.event for e in events] == ["wake", "transcript"]
+    assert events[1].text == "add eggs to grocery list"
+    assert pipeline.awake is False
+
+
+def test_partial_frames_are_buffered():
+    pipeline = make_pipeline(AlwaysAwake(FRAME))
+
+    assert pipeline.feed(SPEECH[:100]) == []
+    events = pipeline.feed(SPEECH[100:])
+
+    assert [e.event for e in events] == ["wake"]
+
+
+class FakeEngines:
+    async def pipeline(self):
+        return make_pipeline(AlwaysAwake(FRAME))
+
+
+def test_audio_stream_runs_turn():
+    app = create_app(homelink=FakeHomeLink(stream_chunk_size=4))
+    with TestClient(app) as client:
+        app.state.ingest = FakeEngines()
+        with client.websocket_connect("/audio/stream") as websocket:
+            websocket.send_bytes(SPEECH * 4)
+
+            assert websocket.receive_json()["event"] == "wake"
+            transcript = websocket.receive_json()
+            assert transcript["event"] == "transcript"
+            audio = b"".join(websocket.receive_bytes() for _ in range(3))
+            assert audio == b"a" * 10
+            assert websocket.receive_json() == {"event": "audio_end", "continuous": True}
+
+
+def test_pcm_transport_runs_turn():
+    homelink = FakeHomeLink(stream_chunk_size=4)
+    homelink.settings.ingest.tcp_port = 0
+    app = create_app(homelink=homelink)
+    with TestClient(app):
+        transport: PCMStreamServer = app.state.transport
+        transport.engines = FakeEngines()
+        sock = socket.create_connection(("127.0.0.1", transport.port), timeout=5)
+        header = bytearray(FRAME_HEADER.size)
+        for seq in range(4):
+            pack_header(header, seq, seq * 10, 0, len(SPEECH))
+            sock.sendall(header + SPEECH)
+
+        def receive():
+            data = b""
+            while len(data) < FRAME_HEADER.size:
+                data += sock.recv(FRAME_HEADER.size - len(data))
+            _, _, flags, length = FRAME_HEADER.unpack(data)
+            payload = b""
+            while len(payload) < length:
+                payload += sock.recv(length - len(payload))
+            return flags, payload
+
+        flags, payload = receive()
+        assert flags == FLAG_EVENT and b"wake" in payload
+        assert b"transcript" in receive()[1]
+        audio = b"".join(receive()[1] for _ in range(3))
+        assert audio == b"a" * 10
+        assert b"audio_end" in receive()[1]
+        sock.close()
+
+
+def test_pcm_transport_limits_decompression():
+    server_sock, client_sock = socket.socketpair()
+    connection = PCMConnection(
+        server_sock,
+        make_pipeline(),
+        pool=None,
+        execute=None,
+        client_id="test",
+        max_frame_bytes=1024,
+    )
+    try:
+        assert connection._decompress(zlib.compress(SPEECH)) == SPEECH
+        # a small frame that inflates far beyond the frame limit
+        with pytest.raises(ConnectionClosed):
+            connection._decompress(zlib.compress(bytes(1024 * 1024)))
+        with pytest.raises(ConnectionClosed):
+            connection._decompress(b"not zlib")
+        with pytest.raises(ConnectionClosed):
+            connection._decompress(zlib.compress(SPEECH)[:-4])
+    finally:
+        server_sock.close()
+        client_sock.close()
+
+
+@pytest.mark.asyncio
+async def test_pcm_transport_times_the_wire_frames():
+    server_sock, client_sock = socket.socketpair()
+    server_sock.setblocking(False)
+    connection = PCMConnection(
+        server_sock, make_pipeline(), pool=None, execute=None, client_id="test"
+    )
+    # the client sends 20 ms frames, the pipeline works on 10 ms frames
+    wire_frame = SPEECH * 2
+    header = bytearray(FRAME_HEADER.size)
+    for seq in range(3):
+        pack_header(header, seq, seq * 20, 0, len(wire_frame))
+        client_sock.sendall(header + wire_frame)
+    client_sock.close()
+    with pytest.raises(ConnectionClosed):
+        await connection._receive()
+    server_sock.close()
+
+    assert connection.frame_ms == connection.jitter.frame_ms == 20
+    assert len(connection._silence) == len(wire_frame)
+    assert len(connection.jitter.frames) == 3
@@ -0,0 +1,162 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import fakeredis
+import pytest
+
+from server.homelink import HomeLink
+from server.intents import IntentEngine, IntentResponse
+from shared.mixins import ResponseMixin
+from shared.utils import load_yaml
+
+
+@pytest.fixture
+def engine():
+    return IntentEngine(intents=load_yaml("config/intents.yml"), llm=None)
+
+
+@pytest.mark.asyncio
+async def test_segment_compound_command(engine):
+    clauses = await engine.segment("text mom and dad then turn the lights off")
+    assert [(c.text, c.sequential) for c in clauses] == [
+        ("text mom and dad", False),
+        ("turn the lights off", True),
+    ]
+    assert len(await engine.segment("turn on the lights")) == 1
+
+
+@pytest.mark.asyncio
+async def test_determine_intents(engine):
+    intents = await engine.determine_intents("turn off the lights and text mom")
+    assert [i.intent.name for i in intents] == ["Lights", "iMessage"]
+    assert [i.clause for i in intents] == ["turn off the lights", "text mom"]
+    assert [i.after for i in intents] == [None, None]
+
+    intents = await engine.determine_intents("text mom then turn off the lights")
+    assert [i.after for i in intents] == [None, 0]
+
+    assert await engine.determine_intents("how are you") == []
+
+
+class FakeRegistry:
+    def __init__(self):
+        self.started: list[str] = []
+        self.clients: list[str] = []
+
+    def available(self, name):
+        return True
+
+    async def dispatch(self, intent, input, query=False, client_id=None):
+        self.started.append(input)
+        self.clients.append(client_id)
+        await asyncio.sleep(0.05)
+        if "mom" in input:
+            return ResponseMixin(response="Could not text mom.")
+        return ResponseMixin(response=f"Done: {input}.", completed=True)
+
+
+@pytest.fixture
+def homelink(engine):
+    homelink = HomeLink(config_folder="config", redis=fakeredis.FakeRedis(decode_responses=True))
+    homelink.intents_engine = engine
+    homelink.agents = FakeRegistry()
+    return homelink
+
+
+@pytest.mark.asyncio
+async def test_execute_intents_runs_clauses_concurrently(homelink):
+    intents = await homelink.determine_intents("turn off the lights and text mom")
+    start = asyncio.get_running_loop().time()
+    result = await homelink.execute_intents(intents, "turn off the lights and text mom")
+    assert asyncio.get_running_loop().time() - start < 0.09
+    assert result.response == "Done: turn off the lights. Could not text mom."
+    assert not result.completed
+
+
+@pytest.mark.asyncio
+async def test_execute_intents_waits_for_dependencies(homelink):
+    intents = await homelink.determine_intents("text mom then turn off the lights")
+    result = await homelink.execute_intents(intents, "")
+    # the lights wait for the message, which failed
+    assert homelink.agents.started == ["text mom"]
+    assert result.response == "Could not text mom."
+
+
+@pytest.mark.asyncio
+async def test_unavailable_agents_fall_back_to_conversation(homelink):
+    homelink.agents.available = lambda name: False
+    homelink.memory = SimpleNamespace(_is_this_memorable=AsyncMock())
+    homelink.conversations = SimpleNamespace(conversate=AsyncMock(return_value="Done?"))
+    homelink.voice = SimpleNamespace(tts=AsyncMock(return_value=b"audio"))
+    homelink._ready = True
+
+    assert await homelink.execute_link("turn off the lights") == (True, b"audio")
+    homelink.conversations.conversate.assert_awaited_once()
+    assert homelink.agents.started == []
+
+
+@pytest.mark.asyncio
+async def test_intent_turns_keep_their_client(homelink):
+    homelink.memory = SimpleNamespace(_is_this_memorable=AsyncMock())
+    homelink.voice = SimpleNamespace(tts=AsyncMock(return_value=b"audio"))
+    homelink._ready = True
+
+    await asyncio.gather(
+        homelink.execute_link("turn off the lights", client_id="kitchen"),
+        homelink.execute_link("text dad", client_id="bedroom"),
+    )
+
+    assert dict(zip(homelink.agents.started, homelink.agents.clients)) == {
+        "turn off the lights": "kitchen",
+        "text dad": "bedroom",
+    }
+
+
+@pytest.mark.asyncio
+async def test_leftover_clauses_go_to_the_conversation(homelink):
+    homelink.agents.available = lambda name: name == "lights"
+    homelink.memory = SimpleNamespace(_is_this_memorable=AsyncMock())
+    homelink.conversations = SimpleNamespace(conversate=AsyncMock(return_value="Texted mom."))
+    homelink.voice = SimpleNamespace(tts=AsyncMock(return_value=b"audio"))
+    homelink._ready = True
+
+    await homelink.execute_link("turn off the lights and text mom", client_id="kitchen")
+
+    homelink.voice.tts.assert_awaited_once_with(
+        "Done: turn off the lights. Texted mom.", "mp3"
+    )
+    homelink.conversations.conversate.assert_awaited_once_with(
+        "text mom", has_intent=True, client_id="kitchen"
+    )
+    # the memories are extracted on the intent path too
+    homelink.memory._is_this_memorable.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_clauses_without_intent_are_kept(engine):
+    engine.determine_intent = AsyncMock(
+        side_effect=lambda text: IntentResponse(
+            response="", intent=engine._get_intent_data("Lights") if "lights" in text else None
+        )
+    )
+    intents = await engine.determine_intents("turn off the lights and text mom")
+
+    assert [i.clause for i in intents] == ["turn off the lights", "text mom"]
+    assert intents[1].intent is None
+
+
+@pytest.mark.asyncio
+async def test_failing_clause_does_not_cancel_the_others(homelink):
+    async def dispatch(intent, input, query=False, client_id=None):
+        if "mom" in input:
+            raise RuntimeError("agent crashed")
+        await asyncio.sleep(0.05)
+        return ResponseMixin(response=f"Done: {input}.", completed=True)
+
+    homelink.agents.dispatch = dispatch
+    intents = await homelink.determine_intents("turn off the lights and text mom")
+    result = await homelink.execute_intents(intents, "turn off the lights and text mom")
+
+    assert result.response == "Done: turn off the lights. I could not handle: text mom."
+    assert not result.completed
@@ -0,0 +1,51 @@
+from server.keyindex import KeyIndex, normalize, trigrams
+
+
+def test_normalize_and_trigrams():
+    assert normalize("Grocery-List ") == "grocery list"
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+
+
+def test_search_ranks_closest_keys_first():
+    index = KeyIndex()
+    for key in ["grocery_list", "parking_spot", "wifi_password", "movie_list"]:
+        index.add(key)
+
+    keys = [key for key, _ in index.search("groceries", 2)]
+    assert keys[0] == "grocery_list"
+    assert len(keys) == 2
+
+    keys = [key for key, _ in index.search("where did I park the car?", 1)]
+    assert keys == ["parking_spot"]
+
+
+def test_search_fills_up_with_unmatched_keys():
+    index = KeyIndex()
+    index.sync(["shopping_list", "birthday"])
+
+    assert {key for key, _ in index.search("eggs_needed", 5)} == {"shopping_list", "birthday"}
+
+
+def test_sync_only_updates_changes():
+    index = KeyIndex()
+    index.sync(["a_key", "b_key"])
+    index.sync(["b_key", "c_key"])
+
+    assert "a_key" not in index and "c_key" in index
+    assert len(index) == 2
+    assert all(keys for keys in index._postings.values())
+    assert not any("a_key" in keys for keys in index._postings.values())
+
+
+def test_exact_only_matches_the_same_key():
+    index = KeyIndex()
+    index.sync(["grocery_list", "kate_birthday", "mika_phone_number"])
+
+    assert index.exact("Grocery List") == "grocery_list"
+    assert index.exact("grocery-list ") == "grocery_list"
+    assert index.exact("grocery_lists") is None
+    assert index.exact("nate_birthday") is None
+    assert index.exact("mike_phone_number") is None
+
+    index.remove("grocery_list")
+    assert index.exact("Grocery List") is None
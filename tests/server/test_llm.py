@@ -0,0 +1,221 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from unittest.mock import MagicMock, patch
+from server.llm import LLMContext, SingleFlight, RETRY_STATS, heal, parse_structured
+from server.models import KeyMatch, LLMSettings, ProviderLimits
+from shared.mixins import ResponseMixin
+from server.scheduler import LLMScheduler, Priority, ProviderBudget, llm_priority
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+
+@pytest.fixture
+def settings_mock():
+    settings = MagicMock()
+    settings.llm.reasoning_llm = "openai"
+    settings.llm.reasoning_llm_model = "gpt-4o-mini"
+    return settings
+
+
+@pytest.fixture
+def llm_ctx(settings_mock):
+    with patch("server.llm.construct_llm", return_value=MagicMock()):
+        return LLMContext(settings=settings_mock)
+
+
+class SlowLLM:
+    """Fake model counting the upstream calls"""
+
+    model_name = "slow-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, input):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return f"response to {input}"
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_identical_calls():
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(
+        *[single_flight.run("key", call) for _ in range(5)]
+    )
+
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert single_flight.stats()["upstream_calls"] == 1
+    assert single_flight.stats()["coalesced_callers"] == 4
+    assert single_flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_exceptions():
+    single_flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    results = await asyncio.gather(
+        single_flight.run("key", call),
+        single_flight.run("key", call),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, ValueError) for result in results)
+    # The next call is not served from the failed flight
+    with pytest.raises(ValueError):
+        await single_flight.run("key", call)
+    assert single_flight.stats()["upstream_calls"] == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancelled_caller_keeps_flight():
+    single_flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    leader = asyncio.create_task(single_flight.run("key", call))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(single_flight.run("key", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "result"
+
+
+@pytest.mark.asyncio
+async def test_llm_context_coalesces_same_model_and_prompt(llm_ctx):
+    slow = SlowLLM()
+    llm_ctx.intent_llm = slow
+    llm_ctx.reasoning_llm = slow
+
+    results = await asyncio.gather(
+        llm_ctx.intent_llm.ainvoke("same prompt"),
+        llm_ctx.reasoning_llm.ainvoke("same prompt"),
+        llm_ctx.intent_llm.ainvoke("other prompt"),
+    )
+
+    assert results[0] == results[1] == "response to same prompt"
+    assert slow.calls == 2
+    assert llm_ctx.stats()["single_flight"]["coalesced_callers"] == 1
+
+
+@pytest.mark.asyncio
+async def test_interactive_callers_do_not_join_background_calls(llm_ctx):
+    # a single background slot, held by the blocker
+    llm_ctx.scheduler = LLMScheduler({"openai": ProviderBudget(max_concurrency=2)})
+    release = asyncio.Event()
+
+    class BlockingLLM(SlowLLM):
+        async def ainvoke(self, input):
+            if input == "blocker":
+                await release.wait()
+            return await super().ainvoke(input)
+
+    llm_ctx.intent_llm = BlockingLLM()
+    with llm_priority(Priority.BACKGROUND):
+        blocker = asyncio.create_task(llm_ctx.intent_llm.ainvoke("blocker"))
+        queued = asyncio.create_task(llm_ctx.intent_llm.ainvoke("same prompt"))
+    await asyncio.sleep(0)
+
+    result = await asyncio.wait_for(llm_ctx.intent_llm.ainvoke("same prompt"), 1)
+
+    assert result == "response to same prompt"
+    assert not queued.done()
+    release.set()
+    await asyncio.gather(blocker, queued)
+
+
+def test_parse_structured():
+    assert parse_structured(KeyMatch, AIMessage(content='{"key": "grocery_list"}')).key == "grocery_list"
+    assert parse_structured(KeyMatch, '```json\n{"key": null}\n```').key is None
+    assert parse_structured(KeyMatch, "grocery_list") is None
+
+
+@pytest.mark.asyncio
+async def test_structured_invalid_output_returns_none(llm_ctx):
+    class TextLLM(SlowLLM):
+        supports_structured_output = True
+
+        async def ainvoke(self, input, **kwargs):
+            return AIMessage(content="not json")
+
+    llm_ctx.intent_llm = TextLLM()
+
+    assert llm_ctx.supports_structured("intent") is True
+    assert await llm_ctx.structured("intent", "prompt", KeyMatch, task="test_invalid") is None
+    assert RETRY_STATS.stats()["test_invalid"]["structured"]["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_heal_records_retries():
+    attempts = []
+
+    async def action(response):
+        attempts.append(response)
+        if len(attempts) < 2:
+            return ResponseMixin(response="bad", retry=True, helper=lambda heal: "again")
+        return ResponseMixin(response="good", completed=True)
+
+    llm = RunnableLambda(lambda input: AIMessage(content=str(input)))
+    response = await heal(llm, action, task="test_heal").ainvoke("input")
+
+    assert response.response == "good"
+    stats = RETRY_STATS.stats()["test_heal"]["text"]
+    assert stats["calls"] == 1
+    assert stats["retries"] == 1
+
+
+def test_provider_limits_reach_the_scheduler():
+    llm_settings = LLMSettings(
+        reasoning_llm="openai",
+        reasoning_llm_model="gpt-4o-mini",
+        intent_llm="openai",
+        intent_llm_model="gpt-4o-mini",
+        provider_limits={"openai": ProviderLimits(max_concurrency=1)},
+    )
+    with patch("server.llm.construct_llm", return_value=MagicMock()):
+        ctx = LLMContext(settings=MagicMock(llm=llm_settings))
+        queue = ctx.scheduler._queue("openai")
+        ctx.apply_settings(
+            MagicMock(
+                llm=llm_settings.model_copy(
+                    update={"provider_limits": {"openai": ProviderLimits(max_concurrency=8)}}
+                )
+            )
+        )
+
+    assert ctx.scheduler.budgets["openai"].max_concurrency == 8
+    assert queue.budget.max_concurrency == 8
+
+
+@pytest.mark.asyncio
+async def test_only_routed_calls_are_observed(llm_ctx):
+    llm_ctx.intent_llm = SlowLLM()
+    llm_ctx.fast_llm = SlowLLM()
+    llm_ctx.reasoning_llm = SlowLLM()
+    llm_ctx.task_llm = SlowLLM()
+
+    await llm_ctx.intent_llm.ainvoke("what is the intent")
+    await llm_ctx.task_llm.ainvoke("extract the memories")
+    await llm_ctx.reasoning_llm.ainvoke("pick the memories")
+    await llm_ctx.routed_llm(SimpleNamespace(route="fast")).ainvoke("hello")
+    await llm_ctx.routed_llm(SimpleNamespace(route="strong")).ainvoke("why")
+
+    assert llm_ctx.router.route_stats["fast"].samples == 1
+    assert llm_ctx.router.route_stats["strong"].samples == 1
@@ -0,0 +1,90 @@
+import io
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from server.main import create_app
+from server.models import ServerSettings, IngestSettings, TracingSettings, LoggingSettings
+from shared.mixins import ResponseMixin
+
+
+class FakeHomeLink:
+    def __init__(self, **server):
+        self.settings = SimpleNamespace(
+            server=ServerSettings(**server),
+            ingest=IngestSettings(tcp_port=None),
+            voice=SimpleNamespace(audio_formats=["pcm", "opus", "mp3"]),
+            tracing=TracingSettings(),
+            logging=LoggingSettings(),
+        )
+        self.warmed = False
+        self.clients: list[str] = []
+        self.formats: list[str] = []
+
+    async def warm_up(self):
+        self.warmed = True
+
+    async def close(self):
+        self.closed = True
+
+    async def execute_link(
+        self, input: str, client_id: str = "default", audio_format: str = "mp3"
+    ):
+        self.clients.append(client_id)
+        self.formats.append(audio_format)
+        if input == "turn on the lights":
+            return None
+        return True, io.BytesIO(b"a" * 10)
+
+    async def send_chat(self, input: str, client_id: str = "default"):
+        return ResponseMixin(response=f"echo {input}", completed=True)
+
+
+def test_awake_streams_audio():
+    homelink = FakeHomeLink(stream_chunk_size=4)
+    with TestClient(create_app(homelink=homelink)) as client:
+        response = client.post("/awake", json={"input": "hello"})
+
+    assert homelink.warmed is True
+    assert response.status_code == 200
+    assert response.content == b"a" * 10
+    assert response.headers["X-Continuous-Conversation"] == "true"
+
+
+def test_awake_without_audio():
+    with TestClient(create_app(homelink=FakeHomeLink())) as client:
+        response = client.post("/awake", json={"input": "turn on the lights"})
+
+    assert response.status_code == 204
+
+
+def test_chat():
+    with TestClient(create_app(homelink=FakeHomeLink())) as client:
+        response = client.post("/chat", json={"input": "hi"})
+        root = client.get("/")
+
+    assert response.json()["response"] == "echo hi"
+    assert root.json()["pool"]["completed"] == 1
+
+
+def test_awake_routes_client_id():
+    homelink = FakeHomeLink()
+    with TestClient(create_app(homelink=homelink)) as client:
+        client.post("/awake", json={"input": "hello", "client_id": "kitchen"})
+        client.post("/awake", json={"input": "hello"})
+
+    assert homelink.clients == ["kitchen", "default"]
+
+
+def test_awake_negotiates_audio_format():
+    homelink = FakeHomeLink()
+    with TestClient(create_app(homelink=homelink)) as client:
+        pcm = client.post(
+            "/awake",
+            json={"input": "hello"},
+            headers={"Accept": "audio/pcm, audio/mpeg;q=0.5"},
+        )
+        default = client.post("/awake", json={"input": "hello"})
+
+    assert homelink.formats == ["pcm", "mp3"]
+    assert pcm.headers["content-type"] == "audio/pcm;rate=24000"
+    assert pcm.headers["X-Audio-Format"] == "pcm"
+    assert default.headers["content-type"] == "audio/mpeg"
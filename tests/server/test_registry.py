@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from server.agent import AgentBase
+from server.models import AgentSettings, AgentSpec, Intent
+from server.registry import AgentRegistry, load_agent_class
+
+MODULE = "tests.server.test_registry"
+
+
+class BlockingAgent(AgentBase):
+    def execute(self, input, intent, query=False, client_id=None):
+        time.sleep(float(input))
+        return f"slept {input}"
+
+
+class AsyncAgent(AgentBase):
+    async def execute(self, input, intent, query=False, client_id=None):
+        await asyncio.sleep(0)
+        return None if input == "quiet" else f"echo {input}"
+
+
+class ClientAgent(AgentBase):
+    async def execute(self, input, intent, query=False, client_id=None):
+        return client_id
+
+
+class PidAgent(AgentBase):
+    def execute(self, input, intent, query=False, client_id=None):
+        return str(os.getpid())
+
+
+def make_registry(**agents: AgentSpec) -> AgentRegistry:
+    settings = SimpleNamespace(
+        agents=AgentSettings(timeout=1, agents=agents), subscribe=lambda callback: None
+    )
+    return AgentRegistry(config=None, settings=settings)
+
+
+def intent(agent: str) -> Intent:
+    return Intent(name=agent, agent=agent, description="", keywords=[])
+
+
+def test_load_agent_class():
+    assert load_agent_class(f"{MODULE}:AsyncAgent") is AsyncAgent
+    # the only agent in the module is picked without naming it
+    assert load_agent_class("config.agents.imessage").__name__ == "iMessageAgent"
+    with pytest.raises(AttributeError):
+        load_agent_class(MODULE)
+    with pytest.raises(AttributeError):
+        load_agent_class("config.agents.missing")
+
+
+@pytest.mark.asyncio
+async def test_dispatch_caches_and_wraps_results():
+    registry = make_registry(echo=AgentSpec(module=f"{MODULE}:AsyncAgent"))
+    response = await registry.dispatch(intent("echo"), "hi")
+    assert response.completed and response.response == "echo hi"
+    assert registry.get("echo") is registry.get("echo")
+
+    response = await registry.dispatch(intent("echo"), "quiet")
+    assert response.completed and response.response == ""
+    assert registry.stats()["echo"]["completed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_unimplemented_and_missing_agents_fail_softly():
+    registry = make_registry()
+    response = await registry.dispatch(intent("imessage"), "text mom")
+    assert not response.completed
+    response = await registry.dispatch(intent("lights"), "turn on the lights")
+    assert not response.completed
+    assert registry.stats()["lights"]["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_blocking_agent_times_out_without_stalling_the_loop():
+    registry = make_registry(
+        slow=AgentSpec(module=f"{MODULE}:BlockingAgent", timeout=0.1, max_concurrency=1)
+    )
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    start = time.perf_counter()
+    response, _ = await asyncio.gather(registry.dispatch(intent("slow"), "0.3"), ticker())
+    assert response.retry and not response.completed
+    assert ticks == 10
+    assert time.perf_counter() - start < 0.25
+
+    # the timed out call keeps its slot until the thread returns
+    assert registry.stats()["slow"]["in_flight"] == 1
+    response = await registry.dispatch(intent("slow"), "0")
+    assert not response.completed
+    await asyncio.sleep(0.3)
+    assert registry.stats()["slow"]["in_flight"] == 0
+    response = await registry.dispatch(intent("slow"), "0")
+    assert response.completed
+    registry.close()
+
+
+@pytest.mark.asyncio
+async def test_process_isolation():
+    registry = make_registry(
+        pid=AgentSpec(module=f"{MODULE}:PidAgent", isolation="process", timeout=10)
+    )
+    response = await registry.dispatch(intent("pid"), "")
+    assert response.completed
+    assert response.response != str(os.getpid())
+    registry.close()
+
+
+def test_intent_agents_are_validated_up_front():
+    settings = SimpleNamespace(
+        agents=AgentSettings(agents={"echo": AgentSpec(module=f"{MODULE}:AsyncAgent")}),
+        subscribe=lambda callback: None,
+    )
+    intents = [intent("echo"), intent("imessage"), intent("lights")]
+    registry = AgentRegistry(config=None, settings=settings, intents=intents)
+    assert registry.available("echo")
+    # imessage does not implement execute, lights has no module
+    assert not registry.available("imessage")
+    assert not registry.available("lights")
+    assert registry._checked == {"echo", "imessage", "lights"}
+
+
+@pytest.mark.parametrize(
+    "source", ["raise RuntimeError('no device found')", "def broken(:", "import missing_sdk"]
+)
+def test_agents_failing_at_import_are_unavailable(tmp_path, monkeypatch, source):
+    (tmp_path / "broken_agent.py").write_text(source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "broken_agent", raising=False)
+    registry = make_registry(broken=AgentSpec(module="broken_agent"))
+
+    assert not registry.available("broken")
+    assert "broken" in registry._unavailable
+
+
+@pytest.mark.asyncio
+async def test_dispatch_passes_the_client():
+    registry = make_registry(client=AgentSpec(module=f"{MODULE}:ClientAgent"))
+    response = await registry.dispatch(intent("client"), "hi", client_id="kitchen")
+    assert response.response == "kitchen"
@@ -0,0 +1,71 @@
+from server.router import ModelRouter, FAST, STRONG
+
+
+def test_small_talk_goes_fast():
+    router = ModelRouter()
+
+    decision = router.route("Thanks!")
+
+    assert decision.route == FAST
+    assert decision.score == 0.0
+    assert decision.features.small_talk is True
+
+
+def test_complex_question_goes_strong():
+    router = ModelRouter()
+
+    decision = router.route(
+        "Can you explain the difference between a heat pump and a furnace and which should I buy?"
+    )
+
+    assert decision.route == STRONG
+    assert decision.reason == "complexity"
+
+
+def test_memory_request_feature():
+    router = ModelRouter()
+
+    features = router.features("What is on my grocery list?")
+
+    assert features.memory_request is True
+    assert features.question_words == 1
+
+
+def test_failover_when_route_errors():
+    router = ModelRouter(min_samples=3)
+    for _ in range(3):
+        router.observe(FAST, 0.1, error=True)
+
+    decision = router.route("Thanks!")
+
+    assert decision.route == STRONG
+    assert decision.reason == "failover"
+
+
+def test_borderline_turns_leave_slow_strong_route():
+    router = ModelRouter(threshold=2.0, latency_budget=1.0, min_samples=3)
+    for _ in range(3):
+        router.observe(STRONG, 3.0)
+
+    borderline = router.route(
+        "Why is the sky blue during the day and what makes the sunsets look so red?"
+    )
+    complex_turn = router.route(
+        "Explain step by step how to plan and compare a week of meals, and then why it matters"
+    )
+
+    assert borderline.route == FAST
+    assert borderline.reason == "latency"
+    assert complex_turn.route == STRONG
+
+
+def test_decisions_are_exposed():
+    router = ModelRouter()
+    router.route("hi")
+    router.route("hello")
+
+    stats = router.stats()
+
+    assert len(stats["decisions"]) == 2
+    assert stats["decisions"][0]["route"] == FAST
+    assert set(stats["routes"]) == {FAST, STRONG}
@@ -0,0 +1,156 @@
+import asyncio
+import pytest
+from server.scheduler import (
+    LLMScheduler,
+    ProviderBudget,
+    Priority,
+    current_priority,
+    llm_priority,
+)
+
+
+def test_llm_priority_context():
+    assert current_priority() == Priority.INTERACTIVE
+    with llm_priority(Priority.BACKGROUND):
+        assert current_priority() == Priority.BACKGROUND
+    assert current_priority() == Priority.INTERACTIVE
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit():
+    scheduler = LLMScheduler({"openai": ProviderBudget(max_concurrency=2)})
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(*[scheduler.run("openai", call) for _ in range(6)])
+
+    assert peak == 2
+    assert scheduler.stats()["openai"]["interactive"]["completed"] == 6
+
+
+@pytest.mark.asyncio
+async def test_interactive_beats_background():
+    scheduler = LLMScheduler({"openai": ProviderBudget(max_concurrency=1)})
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        await release.wait()
+
+    def call(name):
+        async def run():
+            order.append(name)
+
+        return run
+
+    first = asyncio.create_task(scheduler.run("openai", blocker))
+    await asyncio.sleep(0)
+    queued = [
+        asyncio.create_task(scheduler.run("openai", call("bg1"), Priority.BACKGROUND)),
+        asyncio.create_task(scheduler.run("openai", call("bg2"), Priority.BACKGROUND)),
+        asyncio.create_task(scheduler.run("openai", call("chat"), Priority.INTERACTIVE)),
+    ]
+    await asyncio.sleep(0)
+
+    stats = scheduler.stats()["openai"]
+    assert stats["background"]["queue_depth"] == 2
+    assert stats["interactive"]["queue_depth"] == 1
+
+    release.set()
+    await asyncio.gather(first, *queued)
+
+    assert order == ["chat", "bg1", "bg2"]
+
+
+@pytest.mark.asyncio
+async def test_background_leaves_interactive_slot():
+    scheduler = LLMScheduler({"openai": ProviderBudget(max_concurrency=2)})
+    release = asyncio.Event()
+
+    async def blocker():
+        await release.wait()
+
+    background = [
+        asyncio.create_task(scheduler.run("openai", blocker, Priority.BACKGROUND))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+
+    async def chat():
+        return "reply"
+
+    assert await asyncio.wait_for(scheduler.run("openai", chat), timeout=1) == "reply"
+    assert scheduler.stats()["openai"]["background"]["in_flight"] == 1
+
+    release.set()
+    await asyncio.gather(*background)
+
+
+@pytest.mark.asyncio
+async def test_token_budget_delays_calls():
+    # 6000 tokens per minute refills 100 tokens per second
+    scheduler = LLMScheduler({"openai": ProviderBudget(tokens_per_minute=6000)})
+
+    async def call():
+        return True
+
+    await scheduler.run("openai", call, tokens=6000)
+    start = asyncio.get_running_loop().time()
+    await scheduler.run("openai", call, tokens=5)
+
+    assert asyncio.get_running_loop().time() - start >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_is_skipped():
+    scheduler = LLMScheduler({"openai": ProviderBudget(max_concurrency=1)})
+    release = asyncio.Event()
+
+    async def blocker():
+        await release.wait()
+
+    async def call():
+        return "done"
+
+    first = asyncio.create_task(scheduler.run("openai", blocker))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(scheduler.run("openai", call))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+    await first
+
+    assert await scheduler.run("openai", call) == "done"
+    assert scheduler.stats()["openai"]["interactive"]["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_raised_budget_grants_waiting_calls():
+    scheduler = LLMScheduler({"openai": ProviderBudget(max_concurrency=1)})
+    release = asyncio.Event()
+
+    async def blocker():
+        await release.wait()
+
+    async def call():
+        return "done"
+
+    first = asyncio.create_task(scheduler.run("openai", blocker))
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(scheduler.run("openai", call))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    scheduler.update_budgets({"openai": ProviderBudget(max_concurrency=2)})
+
+    assert await asyncio.wait_for(waiting, 1) == "done"
+    release.set()
+    await first
+    assert scheduler.stats()["openai"]["interactive"]["completed"] == 2
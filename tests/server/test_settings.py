@@ -0,0 +1,81 @@
+import asyncio
+import fakeredis
+import os
+import pytest
+from server.settings import Settings
+
+CONFIG = os.path.join(os.path.dirname(__file__), "..", "..", "config")
+
+
+def make_settings(server: fakeredis.FakeServer) -> Settings:
+    return Settings(
+        settings_opt=os.path.join(CONFIG, "SETTINGS_OPT.yml"),
+        settings=os.path.join(CONFIG, "settings.yml"),
+        client=os.path.join(CONFIG, "client.yml"),
+        redis=fakeredis.FakeRedis(server=server, decode_responses=True),
+    )
+
+
+def test_set_stores_versioned_change():
+    server = fakeredis.FakeServer()
+    settings = make_settings(server)
+    seen = []
+    settings.subscribe(seen.append)
+
+    response = settings.set("voice", "voice_pitch", 1.5)
+
+    assert response.completed is True
+    assert settings.version == 1
+    assert settings.voice.voice_pitch == 1.5
+    assert [s.version for s in seen] == [1]
+    # a new worker starts from the stored changes
+    assert make_settings(server).voice.voice_pitch == 1.5
+
+
+def test_set_rejects_invalid_option():
+    settings = make_settings(fakeredis.FakeServer())
+
+    response = settings.set("voice", "voice_lib", "unknown")
+
+    assert response.retry is True
+    assert settings.version == 0
+    assert settings.voice.voice_lib == "openai"
+
+
+def test_snapshot_is_read_only():
+    settings = make_settings(fakeredis.FakeServer())
+
+    assert settings.get("voice") is settings.get("voice")
+    with pytest.raises(TypeError):
+        settings.settings["voice"]["voice_pitch"] = 2
+
+
+@pytest.mark.asyncio
+async def test_change_propagates_over_pubsub():
+    server = fakeredis.FakeServer()
+    worker, other = make_settings(server), make_settings(server)
+    worker.start_listener()
+    try:
+        other.set("voice", "voice_pitch", 0.75)
+        for _ in range(50):
+            if worker.version == 1:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        worker.stop_listener()
+
+    assert worker.version == 1
+    assert worker.voice.voice_pitch == 0.75
+
+
+def test_set_keeps_changes_of_other_workers():
+    server = fakeredis.FakeServer()
+    worker, other = make_settings(server), make_settings(server)
+
+    worker.set("voice", "voice_pitch", 1.5)
+    # the change has not reached the other worker before it sets its own
+    other.set("voice", "voice_agent", "nova")
+
+    assert other.version == 2
+    assert other.voice.voice_pitch == 1.5
+    assert other.voice.voice_agent == "nova"
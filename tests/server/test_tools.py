@@ -0,0 +1,68 @@
+from typing import Literal
+
+from server.agent import AgentBase
+from server.models import KeyMatch
+from server.tools import compile_tool, json_schema, parse_docstring
+
+
+class LightsAgent(AgentBase):
+    """Turns the lights on and off"""
+
+    async def switch(self, room: str, on: bool = True, level: float | None = None):
+        """
+        Switch the lights of a room
+
+        Args:
+            room: the room name
+            on: turn the lights on,
+                off when false
+            level: the brightness
+        """
+
+    def scene(self, names: list[str], mode: Literal["calm", "party"], match: KeyMatch):
+        """Set a scene"""
+
+    def _helper(self): ...
+
+
+def test_parse_docstring():
+    summary, args = parse_docstring(LightsAgent.switch.__doc__)
+    assert summary == "Switch the lights of a room"
+    assert args == {
+        "room": "the room name",
+        "on": "turn the lights on, off when false",
+        "level": "the brightness",
+    }
+
+
+def test_json_schema():
+    assert json_schema(str | None) == {"type": "string"}
+    assert json_schema(str | list) == {
+        "anyOf": [{"type": "string"}, {"type": "array", "items": {}}]
+    }
+    assert json_schema(list[str]) == {"type": "array", "items": {"type": "string"}}
+    assert json_schema(Literal["a", "b"]) == {"enum": ["a", "b"]}
+
+
+def test_compile_tool():
+    tool = compile_tool(LightsAgent.switch)
+    assert tool.name == "switch"
+    assert tool.parameters["required"] == ["room"]
+    assert tool.parameters["properties"]["on"] == {
+        "type": "boolean",
+        "description": "turn the lights on, off when false",
+        "default": True,
+    }
+    assert tool.spec["function"]["parameters"] is tool.parameters
+    assert "key" in compile_tool(LightsAgent.scene).parameters["properties"]["match"]["properties"]
+
+
+def test_tools_compiled_when_the_class_is_defined():
+    assert [tool.name for tool in LightsAgent.tools] == ["scene", "switch"]
+    assert LightsAgent.tool_specs[1]["function"]["name"] == "switch"
+    assert '"name": "scene"' in LightsAgent.tools_json
+    assert LightsAgent._capture_functions() == {
+        "scene": "Set a scene",
+        "switch": "Switch the lights of a room",
+    }
+    assert AgentBase.tools == ()
@@ -0,0 +1,120 @@
+import asyncio
+import pytest
+from server.workers import TurnPool, PoolFull, PoolClosed
+
+
+@pytest.mark.asyncio
+async def test_pool_bounds_concurrency():
+    pool = TurnPool(workers=2, max_pending=10)
+    await pool.start()
+    running = 0
+    peak = 0
+
+    async def turn(value):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return value
+
+    results = await asyncio.gather(*[pool.submit(turn, i) for i in range(6)])
+
+    assert results == list(range(6))
+    assert peak == 2
+    await pool.drain()
+
+
+@pytest.mark.asyncio
+async def test_pool_rejects_when_full():
+    pool = TurnPool(workers=1, max_pending=1)
+    await pool.start()
+    release = asyncio.Event()
+
+    async def turn():
+        await release.wait()
+
+    running = asyncio.create_task(pool.submit(turn))
+    await asyncio.sleep(0)
+    pending = asyncio.create_task(pool.submit(turn))
+    await asyncio.sleep(0)
+
+    with pytest.raises(PoolFull):
+        await pool.submit(turn)
+
+    release.set()
+    await asyncio.gather(running, pending)
+    assert pool.stats()["rejected"] == 1
+    await pool.drain()
+
+
+@pytest.mark.asyncio
+async def test_drain_finishes_in_flight_turns():
+    pool = TurnPool(workers=1, max_pending=5)
+    await pool.start()
+
+    async def turn():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    turns = [asyncio.create_task(pool.submit(turn)) for _ in range(3)]
+    await asyncio.sleep(0)
+    await pool.drain(timeout=1)
+
+    assert [await t for t in turns] == ["done"] * 3
+    with pytest.raises(PoolClosed):
+        await pool.submit(turn)
+
+
+@pytest.mark.asyncio
+async def test_drain_timeout_fails_remaining_turns():
+    pool = TurnPool(workers=1, max_pending=5)
+    await pool.start()
+
+    async def turn():
+        await asyncio.sleep(10)
+
+    turns = [asyncio.create_task(pool.submit(turn)) for _ in range(2)]
+    await asyncio.sleep(0)
+    await pool.drain(timeout=0.01)
+
+    for t in turns:
+        with pytest.raises(PoolClosed):
+            await t
+
+
+@pytest.mark.asyncio
+async def test_pool_runs_turns_in_the_submitter_context():
+    import contextvars
+
+    request = contextvars.ContextVar("request", default=None)
+    pool = TurnPool(workers=1, max_pending=4)
+    await pool.start()
+
+    async def turn():
+        return request.get()
+
+    request.set("first")
+    first = await pool.submit(turn)
+    request.set("second")
+    second = await pool.submit(turn)
+
+    assert (first, second) == ("first", "second")
+    await pool.drain()
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_sees_blocking_work():
+    import time
+    from server.workers import LoopLagMonitor
+
+    monitor = LoopLagMonitor(interval=0.01, window=1)
+    await monitor.start()
+    await asyncio.sleep(0.03)
+    time.sleep(0.1)  # blocks the loop
+    await asyncio.sleep(0.03)
+    await monitor.close()
+
+    stats = monitor.stats()
+    assert stats["samples"] >= 2
+    assert stats["lag_max_ms"] >= 80
@@ -0,0 +1,123 @@
+import numpy as np
+from shared.audio import (
+    RingBuffer,
+    EnergyVAD,
+    SpeechGate,
+    JitterBuffer,
+    FRAME_HEADER,
+    pack_header,
+    negotiate_format,
+)
+
+
+def test_ring_buffer_wraps_around():
+    ring = RingBuffer(8)
+    out = bytearray(4)
+
+    assert ring.write(b"abcdef") == 6
+    assert ring.read_into(memoryview(out)) == 4
+    assert bytes(out) == b"abcd"
+    assert ring.write(b"ghijkl") == 6
+    assert ring.available == 8
+
+    out = bytearray(8)
+    assert ring.read_into(memoryview(out)) == 8
+    assert bytes(out) == b"efghijkl"
+
+
+def test_ring_buffer_drops_when_full():
+    ring = RingBuffer(4)
+
+    assert ring.write(b"abcdef") == 4
+    assert ring.dropped == 2
+
+
+def test_ring_buffer_exact_read():
+    ring = RingBuffer(8)
+    ring.write(b"abc")
+    out = bytearray(4)
+
+    assert ring.read_into(memoryview(out), exact=True) == 0
+    ring.write(b"d")
+    assert ring.read_into(memoryview(out), exact=True) == 4
+
+
+def test_energy_vad_hangover():
+    vad = EnergyVAD(threshold_db=-30, hangover_frames=2)
+    silence = np.zeros(160, dtype=np.int16).tobytes()
+    loud = (np.sin(np.arange(160) / 3) * 20000).astype(np.int16).tobytes()
+
+    results = [vad.is_speech(frame) for frame in (silence, loud, silence, silence, silence)]
+
+    assert results == [False, True, True, True, False]
+    assert vad.duty_cycle == 3 / 5
+
+
+def test_pack_header_round_trip():
+    header = bytearray(FRAME_HEADER.size)
+    pack_header(header, 7, 1234, 0x01, 640)
+
+    assert FRAME_HEADER.unpack(header) == (7, 1234, 0x01, 640)
+
+
+def test_jitter_buffer_reorders_frames():
+    jitter = JitterBuffer(frame_ms=20, min_delay_ms=20, max_delay_ms=20)
+    jitter.push(0, 0, b"a", arrival_ms=0)
+    jitter.push(2, 40, b"c", arrival_ms=40)
+    jitter.push(1, 20, b"b", arrival_ms=45)
+
+    assert jitter.pop_ready(10) == []
+    assert jitter.pop_ready(60) == [b"a", b"b", b"c"]
+    assert jitter.late == 0
+
+
+def test_jitter_buffer_counts_lost_and_late():
+    jitter = JitterBuffer(frame_ms=20, min_delay_ms=20, max_delay_ms=20)
+    jitter.push(0, 0, b"a", arrival_ms=0)
+    jitter.push(2, 40, b"c", arrival_ms=40)
+
+    assert jitter.pop_ready(60) == [b"a", None, b"c"]
+    assert jitter.lost == 1
+    jitter.push(1, 20, b"b", arrival_ms=70)
+    assert jitter.late == 1
+
+
+def test_jitter_buffer_adapts_delay():
+    jitter = JitterBuffer(frame_ms=20, min_delay_ms=20, max_delay_ms=200)
+    for seq in range(32):
+        jitter.push(seq, seq * 20, b"x", arrival_ms=seq * 20 + (30 if seq % 2 else 0))
+
+    assert jitter.target_delay > 40
+
+
+def test_energy_vad_rejects_hiss():
+    rng = np.random.default_rng(0)
+    hiss = (rng.standard_normal(160) * 8000).astype(np.int16).tobytes()
+    voice = (np.sin(np.arange(160) / 3) * 8000).astype(np.int16).tobytes()
+    vad = EnergyVAD(threshold_db=-30, hangover_frames=0, max_zcr=0.3)
+
+    assert vad.is_speech(hiss) is False
+    assert vad.is_speech(voice) is True
+
+
+def test_speech_gate_pre_roll():
+    silence = [np.full(160, i, dtype=np.int16).tobytes() for i in range(4)]
+    loud = (np.sin(np.arange(160) / 3) * 20000).astype(np.int16).tobytes()
+    gate = SpeechGate(EnergyVAD(threshold_db=-30, hangover_frames=0), pre_roll_frames=2)
+
+    assert all(gate.process(frame) == [] for frame in silence)
+    assert gate.process(loud) == [silence[2], silence[3], loud]
+    assert gate.process(loud) == [loud]
+    assert gate.process(silence[0]) == []
+    assert gate.stats()["segments"] == 1
+    assert gate.stats()["duty_cycle"] == 2 / 7
+
+
+def test_negotiate_format():
+    supported = ["pcm", "opus", "mp3"]
+
+    assert negotiate_format(None, supported) == "mp3"
+    assert negotiate_format("audio/ogg;q=0.9, audio/pcm", supported) == "pcm"
+    assert negotiate_format("audio/pcm;q=0.2, audio/ogg;q=0.8", supported) == "opus"
+    assert negotiate_format("audio/pcm", ["mp3"]) == "mp3"
+    assert negotiate_format("*/*", supported) == "mp3"
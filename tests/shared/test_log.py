@@ -0,0 +1,73 @@
+import json
+import logging
+
+import pytest
+
+from shared import log, tracing
+from shared.log import RateLimitFilter
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "homelink.log"
+    yield path
+    log.shutdown()
+
+
+def read_records(path) -> list[dict]:
+    log.shutdown()
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_structured_fields_are_written_in_the_background(log_file):
+    log.configure(level="INFO", format="json", file=str(log_file))
+    logger = log.get_logger("server.test")
+    logger.info("turn finished", client_id="kitchen", seconds=0.5)
+    logger.debug("history", messages=["hi"])
+
+    (record,) = read_records(log_file)
+    assert record["event"] == "turn finished"
+    assert record["logger"] == "homelink.server.test"
+    assert record["client_id"] == "kitchen"
+    assert record["seconds"] == 0.5
+    assert not logger.isEnabledFor(log.DEBUG)
+
+
+def test_records_carry_the_trace_id(log_file, tmp_path):
+    log.configure(format="json", file=str(log_file))
+    tracing.configure("test", file=str(tmp_path / "traces.jsonl"))
+    try:
+        with tracing.span("turn") as span:
+            log.get_logger("test").warning("slow turn")
+    finally:
+        tracing.shutdown()
+    (record,) = read_records(log_file)
+    assert record["trace_id"] == span.context.trace_id
+
+
+def test_rate_limit_reports_suppressed_records(log_file):
+    handler = log.configure(format="json", file=str(log_file), rate_limit=None)
+    limiter = RateLimitFilter(rate=0.0001, burst=2)
+    handler.addFilter(limiter)
+    logger = log.get_logger("test")
+    for _ in range(5):
+        logger.info("recognized")
+    logger.error("failed")
+
+    records = read_records(log_file)
+    assert [r["event"] for r in records] == ["recognized", "recognized", "failed"]
+
+    limiter.rate = 1e9
+    record = logging.LogRecord("homelink.test", logging.INFO, "", 0, "recognized", None, None)
+    assert limiter.filter(record)
+    assert record.suppressed == 3
+
+
+def test_full_queue_drops_instead_of_blocking(log_file):
+    handler = log.configure(file=str(log_file), rate_limit=None, max_queued=1)
+    log._listener.stop()
+    logger = log.get_logger("test")
+    for index in range(5):
+        logger.info("chatter", index=index)
+    assert handler.dropped == 4
+    log._listener = None
@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import pytest
+
+from shared import tracing
+from shared.tracing import SpanContext
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure("test", file=str(path))
+    yield path
+    tracing.shutdown()
+
+
+def read_spans(path) -> list[dict]:
+    tracing.shutdown()
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans.extend(scope["spans"])
+    return spans
+
+
+def test_traceparent_round_trip():
+    context = SpanContext(trace_id="a" * 32, span_id="b" * 16, sampled=True)
+    assert SpanContext.from_traceparent(context.traceparent()) == context
+    assert SpanContext.from_traceparent("00-abc-def-01") is None
+    assert SpanContext.from_traceparent(None) is None
+
+
+def test_spans_are_noops_when_off():
+    with tracing.span("stage") as span:
+        span.set_attribute("key", 1)
+        assert tracing.current_context() is None
+    assert tracing.inject() == {}
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_across_tasks(trace_file):
+    async def stage(name: str):
+        with tracing.span(name):
+            await asyncio.sleep(0)
+
+    with tracing.span("turn", client_id="kitchen") as root:
+        headers = tracing.inject()
+        await asyncio.gather(stage("intent"), asyncio.create_task(stage("tts")))
+        await asyncio.to_thread(tracing.traced("agent")(lambda: None))
+
+    spans = {span["name"]: span for span in read_spans(trace_file)}
+    assert set(spans) == {"turn", "intent", "tts", "agent"}
+    trace_id = root.context.trace_id
+    assert all(span["traceId"] == trace_id for span in spans.values())
+    for name in ("intent", "tts", "agent"):
+        assert spans[name]["parentSpanId"] == spans["turn"]["spanId"]
+    assert "parentSpanId" not in spans["turn"]
+    assert spans["turn"]["attributes"] == [
+        {"key": "client_id", "value": {"stringValue": "kitchen"}}
+    ]
+    assert headers["traceparent"] == root.context.traceparent()
+
+
+def test_remote_parent_and_errors(trace_file):
+    parent = SpanContext(trace_id="c" * 32, span_id="d" * 16)
+    with pytest.raises(ValueError):
+        with tracing.span("server.awake", parent=parent):
+            raise ValueError("boom")
+
+    (span,) = read_spans(trace_file)
+    assert span["traceId"] == "c" * 32
+    assert span["parentSpanId"] == "d" * 16
+    assert span["status"]["code"] == 2
+
+
+def test_sampling_is_decided_at_the_root(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure("test", file=str(path), sample_rate=0)
+    with tracing.span("turn"):
+        with tracing.span("stage"):
+            assert tracing.inject()["traceparent"].endswith("-00")
+    tracing.shutdown()
+    assert not path.exists() or path.read_text() == ""
+
+
+def test_fold_for_flame_graphs(trace_file):
+    from benchmarks.traces import fold, load_spans
+
+    with tracing.span("turn"):
+        with tracing.span("tts"):
+            pass
+    read_spans(trace_file)
+
+    stacks = fold(load_spans([str(trace_file)]))
+    assert set(stacks) == {"turn", "turn;tts"}